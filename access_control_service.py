@@ -1,34 +1,87 @@
 # access_control_service.py
-# Microservice responsible for: Share Secret, Check Access
-from concurrent import futures
+# Microservice responsible for: Share Secret, Check Access, Groups
 import grpc
 import os
-import threading
 
 import vault_pb2
 import vault_pb2_grpc
+import prefork
+import logs
+import channels
+import metrics
+import profiling
+import tracing
+import quorum
 import shared_data
+from deadlines import budget
+from hash_ring import ShardMap, parse_nodes
+from hlc import clock, NODE_ID
+from replication_log import hint_log
 
-# Replication service addresses
-REPLICATION_SERVICE_ADDRS = os.environ.get("REPLICATION_NODES", "").split(',')
-
-def replicate_share(secret_id, owner_id, target_user_id):
-    """Replicate share operation to other nodes"""
-    for addr in REPLICATION_SERVICE_ADDRS:
-        if not addr:
-            continue
-        try:
-            with grpc.insecure_channel(addr) as channel:
-                stub = vault_pb2_grpc.ReplicationServiceStub(channel)
-                request = vault_pb2.ReplicateShareRequest(
-                    secret_id=secret_id,
-                    owner_id=owner_id,
-                    target_user_id=target_user_id
-                )
-                stub.ReplicateShare(request, timeout=2)
-                print(f"[AccessControl] Replicated share {secret_id} to {addr}")
-        except grpc.RpcError as e:
-            print(f"[AccessControl] Failed to replicate share to {addr}: {e}")
+log = logs.get_logger("AccessControl")
+
+# Replication service addresses ("node_id=host:port" entries enable sharding,
+# see hash_ring.py). Shares go only to the nodes that own the secret.
+replicas = ShardMap(parse_nodes(os.environ.get("REPLICATION_NODES", "")), local_node=NODE_ID)
+
+def _report(addr, delivered, secret_id):
+    if delivered:
+        log.sampled("share.replicated", "Replicated share", secret_id=secret_id, peer=addr)
+    else:
+        log.warning("Queued share for unavailable peer", secret_id=secret_id, peer=addr)
+
+def replicate_share(secret_id, owner_id, target_user_id, version, level=quorum.ONE,
+                    timeout=quorum.QUORUM_TIMEOUT):
+    """
+    Replicate share operation to other nodes concurrently, waiting at most
+    timeout seconds for level to be met. Returns (acknowledged, required),
+    counting the local write.
+    """
+    calls = hint_log.submit_all(replicas.owner_addrs(secret_id), 'share', {
+        'secret_id': secret_id,
+        'owner_id': owner_id,
+        'target_user_id': target_user_id,
+        'version': version
+    })
+    for addr, call in calls.items():
+        call.add_done_callback(lambda call, addr=addr: _report(addr, call.result(), secret_id))
+    return quorum.await_acks(calls, 1 if replicas.is_owner(secret_id) else 0, level, timeout)
+
+def replicate_group_share(secret_id, owner_id, group_id, version, level=quorum.ONE,
+                          timeout=quorum.QUORUM_TIMEOUT):
+    """Replicate a share with a group to the nodes that own the secret, like replicate_share"""
+    calls = hint_log.submit_all(replicas.owner_addrs(secret_id), 'group_share', {
+        'secret_id': secret_id,
+        'owner_id': owner_id,
+        'group_id': group_id,
+        'version': version
+    })
+    for addr, call in calls.items():
+        call.add_done_callback(lambda call, addr=addr: _report(addr, call.result(), secret_id))
+    return quorum.await_acks(calls, 1 if replicas.is_owner(secret_id) else 0, level, timeout)
+
+def replicate_group_member(group_id, owner_id, user_id, member, version, level=quorum.ONE,
+                           timeout=quorum.QUORUM_TIMEOUT):
+    """
+    Replicate a membership change. A group's secrets may live on any shard,
+    so every node gets it.
+    """
+    calls = hint_log.submit_all(replicas.all_addrs(), 'group_member', {
+        'group_id': group_id,
+        'owner_id': owner_id,
+        'user_id': user_id,
+        'member': member,
+        'version': version
+    })
+    for addr, call in calls.items():
+        call.add_done_callback(lambda call, addr=addr: _report(addr, call.result(), group_id))
+    return quorum.await_acks(calls, 1, level, timeout)
+
+def _unmet(context, level, acked, needed):
+    message = f"Consistency level {level} not met: {acked} of {needed} replicas acknowledged"
+    context.set_code(grpc.StatusCode.UNAVAILABLE)
+    context.set_details(message)
+    return message
 
 class AccessControlServiceImpl(vault_pb2_grpc.AccessControlServiceServicer):
 
@@ -49,7 +102,7 @@ class AccessControlServiceImpl(vault_pb2_grpc.AccessControlServiceServicer):
             )
 
         # Verify ownership
-        if secret['user_id'] != owner_id:
+        if secret.user_id != owner_id:
             context.set_code(grpc.StatusCode.PERMISSION_DENIED)
             context.set_details("Only owner can share secrets")
             return vault_pb2.ShareSecretResponse(
@@ -57,33 +110,115 @@ class AccessControlServiceImpl(vault_pb2_grpc.AccessControlServiceServicer):
                 success=False
             )
 
-        # Initialize access control entry if doesn't exist
-        access_control = shared_data.get_access_control(secret_id)
-        if not access_control:
-            access_control = {
-                'owner_id': owner_id,
-                'shared_with': []
-            }
+        # Add target user to the access list (creating it if needed)
+        clock.observe(secret.version)
+        version = clock.now()
+        shared_data.merge_share(secret_id, owner_id, target_user_id, version)
 
-        # Add target user to shared list
-        if target_user_id not in access_control['shared_with']:
-            access_control['shared_with'].append(target_user_id)
-
-        shared_data.set_access_control(secret_id, access_control)
-
-        print(f"[AccessControl] Shared secret {secret_id} with user {target_user_id}")
+        log.sampled("secret.shared", "Shared secret", secret_id=secret_id, target_user_id=target_user_id)
 
         # Replicate share operation
-        threading.Thread(
-            target=replicate_share,
-            args=(secret_id, owner_id, target_user_id)
-        ).start()
+        level = quorum.from_proto(request.consistency, quorum.WRITE_CONSISTENCY)
+        acked, needed = replicate_share(secret_id, owner_id, target_user_id, version, level,
+                                        budget(context, quorum.QUORUM_TIMEOUT))
+        if acked < needed:
+            return vault_pb2.ShareSecretResponse(message=_unmet(context, level, acked, needed), success=False)
 
         return vault_pb2.ShareSecretResponse(
             message=f"Secret shared successfully with user {target_user_id}",
             success=True
         )
 
+    def ShareSecretWithGroup(self, request, context):
+        """Share a secret with every current and future member of a group"""
+        secret_id = request.secret_id
+        owner_id = request.owner_id
+        group_id = request.group_id
+
+        secret = shared_data.get_secret(secret_id)
+        if not secret:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Secret not found")
+            return vault_pb2.ShareSecretResponse(message="Secret not found", success=False)
+        if secret.user_id != owner_id:
+            context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+            context.set_details("Only owner can share secrets")
+            return vault_pb2.ShareSecretResponse(message="Only owner can share secrets", success=False)
+
+        clock.observe(secret.version)
+        version = clock.now()
+        shared_data.merge_group_share(secret_id, owner_id, group_id, version)
+
+        log.sampled("secret.shared", "Shared secret with group", secret_id=secret_id, group_id=group_id)
+
+        level = quorum.from_proto(request.consistency, quorum.WRITE_CONSISTENCY)
+        acked, needed = replicate_group_share(secret_id, owner_id, group_id, version, level,
+                                              budget(context, quorum.QUORUM_TIMEOUT))
+        if acked < needed:
+            return vault_pb2.ShareSecretResponse(message=_unmet(context, level, acked, needed), success=False)
+
+        return vault_pb2.ShareSecretResponse(
+            message=f"Secret shared successfully with group {group_id}",
+            success=True
+        )
+
+    def AddGroupMember(self, request, context):
+        """Add a user to a group, creating the group if needed"""
+        return self._change_member(request, context, True)
+
+    def RemoveGroupMember(self, request, context):
+        """Remove a user from a group"""
+        return self._change_member(request, context, False)
+
+    def _change_member(self, request, context, member):
+        group_id = request.group_id
+        owner_id = request.owner_id
+        user_id = request.user_id
+
+        # Verify ownership; the first member added creates the group
+        group = shared_data.get_group(group_id)
+        if group is not None and group.owner_id != owner_id:
+            context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+            context.set_details("Only owner can change group members")
+            return vault_pb2.GroupMemberResponse(message="Only owner can change group members", success=False)
+        if group is None and not member:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Group not found")
+            return vault_pb2.GroupMemberResponse(message="Group not found", success=False)
+
+        if group is not None:
+            clock.observe(group.version)
+        version = clock.now()
+        shared_data.merge_group_member(group_id, owner_id, user_id, member, version)
+
+        log.sampled("group.changed", "Changed group membership", group_id=group_id, user_id=user_id, member=member)
+
+        level = quorum.from_proto(request.consistency, quorum.WRITE_CONSISTENCY)
+        acked, needed = replicate_group_member(group_id, owner_id, user_id, member, version, level,
+                                               budget(context, quorum.QUORUM_TIMEOUT))
+        if acked < needed:
+            return vault_pb2.GroupMemberResponse(message=_unmet(context, level, acked, needed), success=False)
+
+        action = "added to" if member else "removed from"
+        return vault_pb2.GroupMemberResponse(message=f"User {user_id} {action} group {group_id}", success=True)
+
+    def ListGroupMembers(self, request, context):
+        """List the current members of a group, for its owner or one of its members"""
+        group = shared_data.get_group(request.group_id)
+        if group is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Group not found")
+            return vault_pb2.ListGroupMembersResponse(group_id=request.group_id)
+        if request.user_id != group.owner_id and request.user_id not in group.members:
+            context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+            context.set_details("Only the owner and members can list a group")
+            return vault_pb2.ListGroupMembersResponse(group_id=request.group_id)
+        return vault_pb2.ListGroupMembersResponse(
+            group_id=request.group_id,
+            owner_id=group.owner_id,
+            user_ids=sorted(group.members)
+        )
+
     def CheckAccess(self, request, context):
         """Check if a user has access to a secret"""
         user_id = request.user_id
@@ -97,7 +232,7 @@ class AccessControlServiceImpl(vault_pb2_grpc.AccessControlServiceServicer):
                 owner_id=""
             )
 
-        owner_id = secret['user_id']
+        owner_id = secret.user_id
 
         # Check if user is owner
         if owner_id == user_id:
@@ -107,13 +242,11 @@ class AccessControlServiceImpl(vault_pb2_grpc.AccessControlServiceServicer):
             )
 
         # Check if secret is shared with user
-        access_control = shared_data.get_access_control(secret_id)
-        if access_control:
-            if user_id in access_control.get('shared_with', []):
-                return vault_pb2.CheckAccessResponse(
-                    has_access=True,
-                    owner_id=owner_id
-                )
+        if shared_data.is_shared_with(secret_id, user_id):
+            return vault_pb2.CheckAccessResponse(
+                has_access=True,
+                owner_id=owner_id
+            )
 
         # No access
         return vault_pb2.CheckAccessResponse(
@@ -122,15 +255,24 @@ class AccessControlServiceImpl(vault_pb2_grpc.AccessControlServiceServicer):
         )
 
 def serve():
+    # Once, before any worker serves data written by an older version
+    shared_data.migrate_legacy_acls()
+    if prefork.is_supervisor():
+        return prefork.supervise("AccessControl")
+    tracing.set_service_name("AccessControl")
     port = os.environ.get("PORT", "50053")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = channels.create_server("AccessControl", 10,
+                                    interceptors=[metrics.ServerInterceptor(), tracing.ServerInterceptor()],
+                                    options=prefork.SERVER_OPTIONS)
     vault_pb2_grpc.add_AccessControlServiceServicer_to_server(
         AccessControlServiceImpl(), server
     )
     server.add_insecure_port(f'[::]:{port}')
-    print(f"[AccessControl] Service started on port {port}")
+    log.info("Service started", port=port)
     server.start()
-    server.wait_for_termination()
+    metrics.serve("AccessControl")
+    profiling.serve("AccessControl")
+    prefork.run(server, "AccessControl")
 
 if __name__ == '__main__':
     serve()
@@ -0,0 +1,215 @@
+# admission.py
+# Admission control for gRPC servers: rate limits and adaptive concurrency
+#
+# Requests over their user's or method's token bucket, or arriving while the
+# concurrency limit is reached, are rejected at once with RESOURCE_EXHAUSTED
+# instead of queueing behind everyone else's work. The concurrency limit
+# adapts to observed latency (gradient method): while latency stays near its
+# long-run baseline the limit grows, and when latency rises because work is
+# queueing downstream it shrinks in proportion.
+import collections
+import math
+import os
+import threading
+import time
+
+import grpc
+
+import logs
+import metrics
+
+# Per-user token bucket, in requests per second (0 = no per-user limit)
+RATE_LIMIT_USER_RPS = float(os.environ.get("RATE_LIMIT_USER_RPS", "0"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", str(2 * RATE_LIMIT_USER_RPS)))
+# Per-method limits as "ListSecrets=50,RetrieveSecret=500" (requests per second)
+RATE_LIMIT_METHODS = os.environ.get("RATE_LIMIT_METHODS", "")
+# Users whose buckets are kept; the least recently seen are dropped first
+RATE_LIMIT_MAX_USERS = int(os.environ.get("RATE_LIMIT_MAX_USERS", "100000"))
+
+ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "true").lower() in ("1", "true", "yes")
+CONCURRENCY_MIN_LIMIT = int(os.environ.get("CONCURRENCY_MIN_LIMIT", "4"))
+# How far latency may rise over its baseline before the limit shrinks
+CONCURRENCY_TOLERANCE = float(os.environ.get("CONCURRENCY_TOLERANCE", "1.5"))
+
+_SMOOTHING = 0.2
+# Number of samples the baseline latency averages over
+_BASELINE_WINDOW = 600
+# Minimum seconds between repeated rejection log lines
+_LOG_INTERVAL = 1.0
+
+# Outcomes that mean the call was dropped because the system is overloaded
+_DROP_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED,
+               grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+def parse_method_limits(spec):
+    """Parse "Method=rps,..." into {method: rps}"""
+    limits = {}
+    for entry in spec.split(','):
+        if entry.strip():
+            method, rps = entry.split('=', 1)
+            limits[method.strip()] = float(rps)
+    return limits
+
+class TokenBucket:
+    """Allows rate requests per second on average, bursts of up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        # Caller serializes access
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class RateLimiter:
+    """Token buckets per user and per method"""
+
+    def __init__(self, user_rps=0.0, user_burst=0.0, method_limits=None, max_users=100000):
+        self.user_rps = user_rps
+        self.user_burst = user_burst or user_rps
+        self.max_users = max_users
+        self._users = collections.OrderedDict()
+        self._methods = {method: TokenBucket(rps, rps) for method, rps in (method_limits or {}).items()}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.user_rps > 0 or bool(self._methods)
+
+    def allow(self, method, user_id):
+        """Returns None if allowed, else which limit was hit"""
+        with self._lock:
+            if self.user_rps > 0 and user_id:
+                bucket = self._users.get(user_id)
+                if bucket is None:
+                    bucket = self._users[user_id] = TokenBucket(self.user_rps, self.user_burst)
+                    if len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+                else:
+                    self._users.move_to_end(user_id)
+                if not bucket.try_acquire():
+                    return f"rate limit for user {user_id}"
+            bucket = self._methods.get(method)
+            if bucket is not None and not bucket.try_acquire():
+                return f"rate limit for {method}"
+        return None
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that follows latency. Each sample moves the limit
+    towards limit * gradient + sqrt(limit), where gradient is the baseline
+    latency over the sample latency (at most 1, at least 0.5): it shrinks
+    the limit when requests queue, and the sqrt(limit) term probes for more
+    capacity while they don't.
+    """
+
+    def __init__(self, initial, min_limit, max_limit, tolerance=CONCURRENCY_TOLERANCE):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.inflight = 0
+        self._baseline = None   # long-run EWMA of latency
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, latency, dropped=False):
+        with self._lock:
+            inflight = self.inflight
+            self.inflight -= 1
+            if dropped:
+                new_limit = self.limit * 0.9
+            else:
+                if self._baseline is None:
+                    self._baseline = latency
+                else:
+                    self._baseline += (latency - self._baseline) * 2 / (_BASELINE_WINDOW + 1)
+                    # After a slow period, let the baseline recover quickly
+                    if self._baseline > 2 * latency:
+                        self._baseline *= 0.95
+                # Don't grow a limit the load isn't even using
+                if inflight < self.limit / 2:
+                    return
+                gradient = max(0.5, min(1.0, self.tolerance * self._baseline / max(latency, 1e-6)))
+                new_limit = self.limit * gradient + math.sqrt(self.limit)
+            new_limit = self.limit * (1 - _SMOOTHING) + new_limit * _SMOOTHING
+            self.limit = max(self.min_limit, min(new_limit, self.max_limit))
+
+def _user_of(request):
+    return getattr(request, 'user_id', '') or getattr(request, 'owner_id', '')
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """Rejects unary calls over the rate or concurrency limits with RESOURCE_EXHAUSTED"""
+
+    def __init__(self, rate_limiter=None, concurrency=None, name="Admission"):
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.name = name
+        self.log = logs.get_logger(name)
+        self.rejected = collections.Counter()
+        self._last_log = 0.0
+        self._log_lock = threading.Lock()
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+        method = handler_call_details.method.rsplit('/', 1)[-1]
+        behavior = handler.unary_unary
+
+        def admit(request, context):
+            if self.rate_limiter is not None:
+                reason = self.rate_limiter.allow(method, _user_of(request))
+                if reason:
+                    self._reject(context, method, 'rate', reason)
+            if self.concurrency is None:
+                return behavior(request, context)
+            if not self.concurrency.try_acquire():
+                self._reject(context, method, 'concurrency',
+                             f"concurrency limit {int(self.concurrency.limit)} reached")
+            start = time.monotonic()
+            try:
+                return behavior(request, context)
+            finally:
+                self.concurrency.release(time.monotonic() - start, context.code() in _DROP_CODES)
+
+        return grpc.unary_unary_rpc_method_handler(
+            admit,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+    def _reject(self, context, method, limit, reason):
+        metrics.ADMISSION_REJECTED.labels(self.name, method, limit).inc()
+        with self._log_lock:
+            self.rejected[method] += 1
+            now = time.monotonic()
+            if now - self._last_log >= _LOG_INTERVAL:
+                self._last_log = now
+                self.log.warning("Rejected call", method=method, reason=reason,
+                                 rejected_total=sum(self.rejected.values()))
+        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"Overloaded: {reason}")
+
+def interceptor_from_env(max_concurrency, name="Admission"):
+    """Build the interceptor configured by the environment, or None if all limits are off"""
+    rate_limiter = RateLimiter(RATE_LIMIT_USER_RPS, RATE_LIMIT_USER_BURST,
+                               parse_method_limits(RATE_LIMIT_METHODS), RATE_LIMIT_MAX_USERS)
+    concurrency = (AdaptiveLimiter(max_concurrency, min(CONCURRENCY_MIN_LIMIT, max_concurrency), max_concurrency)
+                   if ADAPTIVE_CONCURRENCY else None)
+    if not rate_limiter.enabled and concurrency is None:
+        return None
+    return AdmissionInterceptor(rate_limiter if rate_limiter.enabled else None, concurrency, name)
@@ -3,26 +3,114 @@
 from concurrent import futures
 import grpc
 import os
+import uuid
 
 import vault_pb2
 import vault_pb2_grpc
+import prefork
+import admission
+import logs
+import channels
+import metrics
+import profiling
+import tracing
+import singleflight
+from deadlines import time_left
+from hash_ring import ShardMap, parse_nodes
+from load_balancer import LoadBalancer, parse_addrs
+from response_cache import InvalidationBus, ResponseCache, tags_for
 
-# Microservice addresses
+log = logs.get_logger("Gateway")
+
+# Microservice addresses. Each may list several upstream replicas of the
+# service ("host1:50052,host2:50052"); calls are load balanced across them.
 SECRET_MANAGEMENT_ADDR = os.environ.get("SECRET_MGMT_ADDR", "localhost:50051")
 SECRET_RETRIEVAL_ADDR = os.environ.get("SECRET_RETRIEVAL_ADDR", "localhost:50052")
 ACCESS_CONTROL_ADDR = os.environ.get("ACCESS_CONTROL_ADDR", "localhost:50053")
 
+# Worker threads, and the most calls admitted at once (running or waiting
+# for a worker); calls beyond that are rejected with RESOURCE_EXHAUSTED
+GATEWAY_WORKERS = int(os.environ.get("GATEWAY_WORKERS", "20"))
+GATEWAY_MAX_CONCURRENT_RPCS = int(os.environ.get("GATEWAY_MAX_CONCURRENT_RPCS", str(5 * GATEWAY_WORKERS)))
+
+# Timeout for forwarded calls when the client didn't set a deadline; a
+# client deadline is passed downstream as-is
+GATEWAY_TIMEOUT = float(os.environ.get("GATEWAY_TIMEOUT", "5"))
+
+# Sharded mode (REPLICATION_FACTOR > 0): per-node service addresses as
+# "node1=host:port,node2=host:port,...". Node ids must match the NODE_ID of
+# each node's services so the gateway and the services build the same ring.
+SECRET_MANAGEMENT_SHARDS = ShardMap(parse_nodes(os.environ.get("SHARD_SECRET_MGMT_NODES", "")))
+SECRET_RETRIEVAL_SHARDS = ShardMap(parse_nodes(os.environ.get("SHARD_SECRET_RETRIEVAL_NODES", "")))
+ACCESS_CONTROL_SHARDS = ShardMap(parse_nodes(os.environ.get("SHARD_ACCESS_CONTROL_NODES", "")))
+
+def _sharded(shards):
+    return shards.sharded and bool(shards.peers)
+
+def _balancer(name, addr_spec, shards):
+    addrs = shards.all_addrs() if _sharded(shards) else parse_addrs(addr_spec)
+    return LoadBalancer(addrs, name=f"Gateway/{name}")
+
+SECRET_MANAGEMENT_LB = _balancer("SecretManagement", SECRET_MANAGEMENT_ADDR, SECRET_MANAGEMENT_SHARDS)
+SECRET_RETRIEVAL_LB = _balancer("SecretRetrieval", SECRET_RETRIEVAL_ADDR, SECRET_RETRIEVAL_SHARDS)
+ACCESS_CONTROL_LB = _balancer("AccessControl", ACCESS_CONTROL_ADDR, ACCESS_CONTROL_SHARDS)
+
+# Optional cache of ListSecrets and CheckAccess responses (GATEWAY_CACHE_TTL
+# seconds, 0 = off). Writes forwarded by this gateway invalidate the entries
+# they affect; with GATEWAY_CACHE_REDIS_HOST set, gateways also exchange
+# invalidations over Redis pub/sub so writes through a peer gateway are seen.
+GATEWAY_CACHE_TTL = float(os.environ.get("GATEWAY_CACHE_TTL", "0"))
+GATEWAY_CACHE_MAX_ENTRIES = int(os.environ.get("GATEWAY_CACHE_MAX_ENTRIES", "10000"))
+GATEWAY_CACHE_REDIS_HOST = os.environ.get("GATEWAY_CACHE_REDIS_HOST", "")
+GATEWAY_CACHE_CHANNEL = os.environ.get("GATEWAY_CACHE_CHANNEL", "gateway-cache-invalidation")
+
+LIST_CACHE = ResponseCache("ListSecrets", GATEWAY_CACHE_TTL, GATEWAY_CACHE_MAX_ENTRIES)
+ACCESS_CACHE = ResponseCache("CheckAccess", GATEWAY_CACHE_TTL, GATEWAY_CACHE_MAX_ENTRIES)
+CACHES = (LIST_CACHE, ACCESS_CACHE)
+
+def _invalidate_local(users, secrets):
+    tags = tags_for(users, secrets)
+    for cache in CACHES:
+        cache.invalidate(tags)
+
+cache_bus = (InvalidationBus(GATEWAY_CACHE_REDIS_HOST, GATEWAY_CACHE_CHANNEL, _invalidate_local)
+             if GATEWAY_CACHE_TTL > 0 and GATEWAY_CACHE_REDIS_HOST else None)
+
+def invalidate(users=(), secrets=()):
+    """Drop cached responses about these users and secrets, here and on peer gateways"""
+    if GATEWAY_CACHE_TTL <= 0:
+        return
+    _invalidate_local(users, secrets)
+    if cache_bus:
+        cache_bus.publish([u for u in users if u], [s for s in secrets if s])
+
+def forward(balancer, shards, stub_class, method, request, key, context, hedge=False):
+    """
+    Call method on one of the service's upstreams, chosen by the load
+    balancer, within the client's remaining deadline. With sharding, only
+    the owners of key are candidates. hedge=True (idempotent reads only)
+    also sends the request to a second upstream if the first is slow.
+    """
+    candidates = shards.owner_addrs(key) if _sharded(shards) else None
+    call = balancer.hedged_call if hedge else balancer.call
+    return call(stub_class, method, request, time_left(context, GATEWAY_TIMEOUT), candidates)
+
 class GatewaySecretManagementService(vault_pb2_grpc.SecretManagementServiceServicer):
     """Gateway for Secret Management operations"""
 
+    def _forward(self, method, request, key, context):
+        return forward(SECRET_MANAGEMENT_LB, SECRET_MANAGEMENT_SHARDS,
+                       vault_pb2_grpc.SecretManagementServiceStub, method, request, key, context)
+
     def AddSecret(self, request, context):
         """Forward to Secret Management Service"""
         try:
-            with grpc.insecure_channel(SECRET_MANAGEMENT_ADDR) as channel:
-                stub = vault_pb2_grpc.SecretManagementServiceStub(channel)
-                response = stub.AddSecret(request, timeout=5)
-                print(f"[Gateway] AddSecret routed to SecretManagement")
-                return response
+            if _sharded(SECRET_MANAGEMENT_SHARDS) and not request.secret_id:
+                # Pick the id here so the write lands on the secret's owners
+                request.secret_id = str(uuid.uuid4())
+            response = self._forward('AddSecret', request, request.secret_id, context)
+            log.sampled("gateway.routed", "Routed call", method="AddSecret", service="SecretManagement")
+            return response
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
@@ -31,15 +119,15 @@ class GatewaySecretManagementService(vault_pb2_grpc.SecretManagementServiceServi
                 message=f"Service unavailable: {e.details()}",
                 success=False
             )
+        finally:
+            invalidate(users=[request.user_id], secrets=[request.secret_id])
 
     def UpdateSecret(self, request, context):
         """Forward to Secret Management Service"""
         try:
-            with grpc.insecure_channel(SECRET_MANAGEMENT_ADDR) as channel:
-                stub = vault_pb2_grpc.SecretManagementServiceStub(channel)
-                response = stub.UpdateSecret(request, timeout=5)
-                print(f"[Gateway] UpdateSecret routed to SecretManagement")
-                return response
+            response = self._forward('UpdateSecret', request, request.secret_id, context)
+            log.sampled("gateway.routed", "Routed call", method="UpdateSecret", service="SecretManagement")
+            return response
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
@@ -48,15 +136,16 @@ class GatewaySecretManagementService(vault_pb2_grpc.SecretManagementServiceServi
                 message=f"Service unavailable: {e.details()}",
                 success=False
             )
+        finally:
+            # A failed write may still have been applied on some replicas
+            invalidate(users=[request.user_id], secrets=[request.secret_id])
 
     def DeleteSecret(self, request, context):
         """Forward to Secret Management Service"""
         try:
-            with grpc.insecure_channel(SECRET_MANAGEMENT_ADDR) as channel:
-                stub = vault_pb2_grpc.SecretManagementServiceStub(channel)
-                response = stub.DeleteSecret(request, timeout=5)
-                print(f"[Gateway] DeleteSecret routed to SecretManagement")
-                return response
+            response = self._forward('DeleteSecret', request, request.secret_id, context)
+            log.sampled("gateway.routed", "Routed call", method="DeleteSecret", service="SecretManagement")
+            return response
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
@@ -65,51 +154,111 @@ class GatewaySecretManagementService(vault_pb2_grpc.SecretManagementServiceServi
                 message=f"Service unavailable: {e.details()}",
                 success=False
             )
+        finally:
+            # A failed write may still have been applied on some replicas
+            invalidate(users=[request.user_id], secrets=[request.secret_id])
 
 class GatewaySecretRetrievalService(vault_pb2_grpc.SecretRetrievalServiceServicer):
     """Gateway for Secret Retrieval operations"""
 
+    def __init__(self):
+        self._scatter = futures.ThreadPoolExecutor(max_workers=max(len(SECRET_RETRIEVAL_SHARDS.peers), 1))
+        # Concurrent identical RetrieveSecret calls share one upstream call
+        self._inflight = singleflight.Group("Gateway/RetrieveSecret")
+
     def RetrieveSecret(self, request, context):
         """Forward to Secret Retrieval Service"""
+        key = (request.user_id, request.secret_id, request.consistency)
+        timeout = time_left(context, GATEWAY_TIMEOUT)
         try:
-            with grpc.insecure_channel(SECRET_RETRIEVAL_ADDR) as channel:
-                stub = vault_pb2_grpc.SecretRetrievalServiceStub(channel)
-                response = stub.RetrieveSecret(request, timeout=5)
-                print(f"[Gateway] RetrieveSecret routed to SecretRetrieval")
-                return response
+            response = self._inflight.do(key, forward, SECRET_RETRIEVAL_LB, SECRET_RETRIEVAL_SHARDS,
+                                         vault_pb2_grpc.SecretRetrievalServiceStub,
+                                         'RetrieveSecret', request, request.secret_id, context, True,
+                                         timeout=timeout)
+            log.sampled("gateway.routed", "Routed call", method="RetrieveSecret", service="SecretRetrieval")
+            return response
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
-            return vault_pb2.RetrieveSecretResponse(
-                secret_id=request.secret_id,
-                data="",
-                success=False
-            )
+        except TimeoutError as e:
+            context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+            context.set_details(str(e))
+        return vault_pb2.RetrieveSecretResponse(
+            secret_id=request.secret_id,
+            data="",
+            success=False
+        )
+
+    def _list_from(self, request, timeout, addr=None):
+        if addr:
+            return SECRET_RETRIEVAL_LB.call(vault_pb2_grpc.SecretRetrievalServiceStub, 'ListSecrets',
+                                            request, timeout, candidates=[addr])
+        return SECRET_RETRIEVAL_LB.hedged_call(vault_pb2_grpc.SecretRetrievalServiceStub, 'ListSecrets',
+                                               request, timeout)
 
     def ListSecrets(self, request, context):
-        """Forward to Secret Retrieval Service"""
+        """Forward to Secret Retrieval Service, or answer from the cache"""
+        cached = LIST_CACHE.get(request.user_id)
+        if cached is not None:
+            return cached
+        epoch = LIST_CACHE.epoch
         try:
-            with grpc.insecure_channel(SECRET_RETRIEVAL_ADDR) as channel:
-                stub = vault_pb2_grpc.SecretRetrievalServiceStub(channel)
-                response = stub.ListSecrets(request, timeout=5)
-                print(f"[Gateway] ListSecrets routed to SecretRetrieval")
-                return response
+            response, complete = self._list(request, context)
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
             return vault_pb2.ListSecretsResponse(secrets=[], total_count=0)
+        if complete:
+            # Tagged with every listed secret, so a change to any of them
+            # (including ones shared with this user) drops the entry
+            LIST_CACHE.put(request.user_id, response, epoch=epoch,
+                           tags=tags_for([request.user_id], [m.secret_id for m in response.secrets]))
+        return response
+
+    def _list(self, request, context):
+        """Returns (response, complete); complete is False if some shards didn't answer"""
+        if not _sharded(SECRET_RETRIEVAL_SHARDS):
+            response = self._list_from(request, time_left(context, GATEWAY_TIMEOUT))
+            log.sampled("gateway.routed", "Routed call", method="ListSecrets", service="SecretRetrieval")
+            return response, True
+
+        # Each node only lists the secrets it owns: query all of them in
+        # parallel and merge, keeping the most recent copy of each secret.
+        timeout = time_left(context, GATEWAY_TIMEOUT)
+        calls = [self._scatter.submit(tracing.wrap(self._list_from), request, timeout, addr)
+                 for addr in SECRET_RETRIEVAL_SHARDS.all_addrs()]
+        merged, failures = {}, []
+        for call in calls:
+            try:
+                for metadata in call.result().secrets:
+                    current = merged.get(metadata.secret_id)
+                    if current is None or metadata.updated_at > current.updated_at:
+                        merged[metadata.secret_id] = metadata
+            except grpc.RpcError as e:
+                failures.append(e)
+        if failures and len(failures) == len(calls):
+            raise failures[0]
+        log.sampled("gateway.list_merged", "ListSecrets merged", shards=len(calls) - len(failures))
+        response = vault_pb2.ListSecretsResponse(
+            secrets=list(merged.values()),
+            total_count=len(merged)
+        )
+        return response, not failures
 
 class GatewayAccessControlService(vault_pb2_grpc.AccessControlServiceServicer):
     """Gateway for Access Control operations"""
 
+    def _forward(self, method, request, context, hedge=False, key=None):
+        return forward(ACCESS_CONTROL_LB, ACCESS_CONTROL_SHARDS,
+                       vault_pb2_grpc.AccessControlServiceStub, method, request, key or request.secret_id,
+                       context, hedge)
+
     def ShareSecret(self, request, context):
         """Forward to Access Control Service"""
         try:
-            with grpc.insecure_channel(ACCESS_CONTROL_ADDR) as channel:
-                stub = vault_pb2_grpc.AccessControlServiceStub(channel)
-                response = stub.ShareSecret(request, timeout=5)
-                print(f"[Gateway] ShareSecret routed to AccessControl")
-                return response
+            response = self._forward('ShareSecret', request, context)
+            log.sampled("gateway.routed", "Routed call", method="ShareSecret", service="AccessControl")
+            return response
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
@@ -117,22 +266,103 @@ class GatewayAccessControlService(vault_pb2_grpc.AccessControlServiceServicer):
                 message=f"Service unavailable: {e.details()}",
                 success=False
             )
+        finally:
+            invalidate(users=[request.target_user_id], secrets=[request.secret_id])
 
-    def CheckAccess(self, request, context):
+    def ShareSecretWithGroup(self, request, context):
         """Forward to Access Control Service"""
         try:
-            with grpc.insecure_channel(ACCESS_CONTROL_ADDR) as channel:
-                stub = vault_pb2_grpc.AccessControlServiceStub(channel)
-                response = stub.CheckAccess(request, timeout=5)
-                return response
+            response = self._forward('ShareSecretWithGroup', request, context)
+            log.sampled("gateway.routed", "Routed call", method="ShareSecretWithGroup", service="AccessControl")
+            return response
+        except grpc.RpcError as e:
+            context.set_code(e.code())
+            context.set_details(e.details())
+            return vault_pb2.ShareSecretResponse(
+                message=f"Service unavailable: {e.details()}",
+                success=False
+            )
+        finally:
+            # The members' cached lists now miss the secret
+            invalidate(users=self._group_members(request.group_id, request.owner_id, context),
+                       secrets=[request.secret_id])
+
+    def _group_members(self, group_id, owner_id, context):
+        """Members of a group, as its owner sees them ([] if caching is off or they can't be listed)"""
+        if GATEWAY_CACHE_TTL <= 0:
+            return []
+        request = vault_pb2.ListGroupMembersRequest(group_id=group_id, user_id=owner_id)
+        try:
+            return list(self._forward('ListGroupMembers', request, context, key=group_id).user_ids)
+        except grpc.RpcError as e:
+            # e.g. not the owner; any entries that do exist expire by TTL
+            log.sampled("gateway.group_lookup_failed", "Could not list group members to invalidate",
+                        group_id=group_id, code=e.code().name)
+            return []
+
+    def AddGroupMember(self, request, context):
+        """Forward to Access Control Service"""
+        return self._change_member('AddGroupMember', request, context)
+
+    def RemoveGroupMember(self, request, context):
+        """Forward to Access Control Service"""
+        return self._change_member('RemoveGroupMember', request, context)
+
+    def _change_member(self, method, request, context):
+        try:
+            response = self._forward(method, request, context, key=request.group_id)
+            log.sampled("gateway.routed", "Routed call", method=method, service="AccessControl")
+            return response
+        except grpc.RpcError as e:
+            context.set_code(e.code())
+            context.set_details(e.details())
+            return vault_pb2.GroupMemberResponse(
+                message=f"Service unavailable: {e.details()}",
+                success=False
+            )
+        finally:
+            invalidate(users=[request.user_id])
+
+    def ListGroupMembers(self, request, context):
+        """Forward to Access Control Service"""
+        try:
+            return self._forward('ListGroupMembers', request, context, hedge=True, key=request.group_id)
+        except grpc.RpcError as e:
+            context.set_code(e.code())
+            context.set_details(e.details())
+            return vault_pb2.ListGroupMembersResponse(group_id=request.group_id)
+
+    def CheckAccess(self, request, context):
+        """Forward to Access Control Service, or answer from the cache"""
+        key = (request.user_id, request.secret_id)
+        cached = ACCESS_CACHE.get(key)
+        if cached is not None:
+            return cached
+        epoch = ACCESS_CACHE.epoch
+        try:
+            response = self._forward('CheckAccess', request, context, hedge=True)
+            ACCESS_CACHE.put(key, response, epoch=epoch,
+                             tags=tags_for([request.user_id], [request.secret_id]))
+            return response
         except grpc.RpcError as e:
             context.set_code(e.code())
             context.set_details(e.details())
             return vault_pb2.CheckAccessResponse(has_access=False, owner_id="")
 
 def serve():
+    if prefork.is_supervisor():
+        return prefork.supervise("Gateway")
+    tracing.set_service_name("Gateway")
     port = os.environ.get("PORT", "50050")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=20))
+    # Per-user/per-method rate limits and the adaptive concurrency limit
+    # (see admission.py) shed excess load before it queues
+    interceptor = admission.interceptor_from_env(GATEWAY_WORKERS, name="Gateway/Admission")
+    # Metrics first, so calls rejected by admission control are counted too
+    interceptors = [metrics.ServerInterceptor(), tracing.ServerInterceptor()] + ([interceptor] if interceptor else [])
+    server = channels.create_server("Gateway", GATEWAY_WORKERS,
+                                    interceptors=interceptors,
+                                    maximum_concurrent_rpcs=GATEWAY_MAX_CONCURRENT_RPCS,
+                                    options=prefork.SERVER_OPTIONS)
 
     # Register all gateway services
     vault_pb2_grpc.add_SecretManagementServiceServicer_to_server(
@@ -146,13 +376,21 @@ def serve():
     )
 
     server.add_insecure_port(f'[::]:{port}')
-    print(f"[Gateway] API Gateway started on port {port}")
-    print(f"[Gateway] Routing to:")
-    print(f"  - Secret Management: {SECRET_MANAGEMENT_ADDR}")
-    print(f"  - Secret Retrieval: {SECRET_RETRIEVAL_ADDR}")
-    print(f"  - Access Control: {ACCESS_CONTROL_ADDR}")
+    if _sharded(SECRET_MANAGEMENT_SHARDS):
+        log.info("API Gateway started", port=port, nodes=len(SECRET_MANAGEMENT_SHARDS.peers),
+                 replication_factor=SECRET_MANAGEMENT_SHARDS.replication_factor)
+    else:
+        log.info("API Gateway started", port=port,
+                 secret_management=SECRET_MANAGEMENT_LB.addrs,
+                 secret_retrieval=SECRET_RETRIEVAL_LB.addrs,
+                 access_control=ACCESS_CONTROL_LB.addrs)
+    if GATEWAY_CACHE_TTL > 0:
+        log.info("Caching ListSecrets/CheckAccess", ttl=GATEWAY_CACHE_TTL,
+                 invalidation_bus=GATEWAY_CACHE_REDIS_HOST if cache_bus else None)
     server.start()
-    server.wait_for_termination()
+    metrics.serve("Gateway")
+    profiling.serve("Gateway")
+    prefork.run(server, "Gateway")
 
 if __name__ == '__main__':
     serve()
@@ -0,0 +1,175 @@
+# channels.py
+# Shared, long-lived gRPC channels for service-to-service calls, and the
+# factories every gRPC channel and server in the services is created with
+#
+# Wire settings are applied the same way everywhere through
+# create_channel()/create_server():
+#   GRPC_COMPRESSION            none, gzip or deflate: compresses the calls a process sends
+#                               and the responses its servers return
+#   GRPC_COMPRESSION_<SERVICE>  overrides it for one server, e.g. GRPC_COMPRESSION_GATEWAY
+#   GRPC_MAX_SEND_MESSAGE_BYTES / GRPC_MAX_RECEIVE_MESSAGE_BYTES   message size limits
+#   GRPC_HTTP2_LOOKAHEAD_BYTES  per-stream HTTP/2 flow-control window to read ahead (0 = gRPC default)
+#   GRPC_HTTP2_BDP_PROBE        let gRPC grow the window from the measured bandwidth-delay product
+# Receivers always accept compressed messages, so nodes with different
+# settings interoperate.
+from concurrent import futures
+import os
+import grpc
+import threading
+import time
+
+import tracing
+
+_COMPRESSION = {
+    'none': grpc.Compression.NoCompression,
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+}
+
+GRPC_COMPRESSION = os.environ.get("GRPC_COMPRESSION", "none").lower()
+# gRPC's defaults are 4 MiB received and unlimited sent; snapshot chunks
+# and large ListSecrets responses need more headroom
+GRPC_MAX_SEND_MESSAGE_BYTES = int(os.environ.get("GRPC_MAX_SEND_MESSAGE_BYTES", str(64 * 1024 * 1024)))
+GRPC_MAX_RECEIVE_MESSAGE_BYTES = int(os.environ.get("GRPC_MAX_RECEIVE_MESSAGE_BYTES", str(64 * 1024 * 1024)))
+GRPC_HTTP2_LOOKAHEAD_BYTES = int(os.environ.get("GRPC_HTTP2_LOOKAHEAD_BYTES", "0"))
+GRPC_HTTP2_BDP_PROBE = os.environ.get("GRPC_HTTP2_BDP_PROBE", "true").lower() in ("1", "true", "yes")
+
+def compression(name=None):
+    """The grpc.Compression configured for a service (by its serve() name), or for this process"""
+    setting = GRPC_COMPRESSION
+    if name:
+        setting = os.environ.get(f"GRPC_COMPRESSION_{name.upper()}", setting).lower()
+    if setting not in _COMPRESSION:
+        raise ValueError(f"Unknown gRPC compression {setting!r}; use one of {', '.join(_COMPRESSION)}")
+    return _COMPRESSION[setting]
+
+def _options():
+    options = [
+        ("grpc.max_send_message_length", GRPC_MAX_SEND_MESSAGE_BYTES),
+        ("grpc.max_receive_message_length", GRPC_MAX_RECEIVE_MESSAGE_BYTES),
+        ("grpc.http2.bdp_probe", int(GRPC_HTTP2_BDP_PROBE)),
+    ]
+    if GRPC_HTTP2_LOOKAHEAD_BYTES:
+        options.append(("grpc.http2.lookahead_bytes", GRPC_HTTP2_LOOKAHEAD_BYTES))
+    return options
+
+def create_channel(addr):
+    """A new channel to addr with the configured compression and limits"""
+    return grpc.insecure_channel(addr, options=_options(), compression=compression())
+
+def create_server(name, max_workers, interceptors=(), options=(), **kwargs):
+    """
+    A grpc.server for the service called name, with the configured
+    compression and limits; options (e.g. prefork.SERVER_OPTIONS) are added
+    to them, and kwargs go to grpc.server.
+    """
+    return grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                       interceptors=list(interceptors),
+                       options=_options() + list(options),
+                       compression=compression(name),
+                       **kwargs)
+
+# One channel per target address, reused across calls and threads.
+# grpc channels are thread-safe and reconnect on their own, so there is
+# no reason to pay the connection setup on every replicated mutation.
+_channels = {}
+_lock = threading.Lock()
+
+def get_channel(addr):
+    """Return the cached channel for addr, creating it on first use"""
+    with _lock:
+        channel = _channels.get(addr)
+        if channel is None:
+            channel = tracing.intercept_channel(create_channel(addr), addr)
+            _channels[addr] = channel
+        return channel
+
+def close_all():
+    """Close every cached channel (used on shutdown)"""
+    with _lock:
+        for channel in _channels.values():
+            channel.close()
+        _channels.clear()
+
+# Services running in this process, by the addresses other code reaches
+# them at. When every service shares one process (grpc_server.py), a call
+# to one of these addresses invokes the servicer directly: no protobuf
+# serialization, no loopback socket. Split deployments register nothing
+# and keep calling over the network.
+_local = {}     # (addr, service name) -> servicer
+
+def register_local(addrs, service_name, servicer):
+    """Serve calls to service_name at any of addrs from servicer, in-process"""
+    with _lock:
+        for addr in addrs:
+            _local[(addr, service_name)] = servicer
+
+def get_stub(stub_class, addr):
+    """
+    Stub for the service at addr: the co-located servicer if there is one,
+    else a gRPC stub on the cached channel. Local stubs support blocking
+    unary calls only.
+    """
+    service_name = stub_class.__name__[:-len('Stub')]
+    servicer = _local.get((addr, service_name))
+    if servicer is not None:
+        return LocalStub(servicer, service_name)
+    return stub_class(get_channel(addr))
+
+class LocalRpcError(grpc.RpcError):
+    """Error status of an in-process call, with the grpc.Call accessors callers use"""
+
+    def __init__(self, code, details):
+        super().__init__(f"{code}: {details}")
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+class LocalContext:
+    """The parts of grpc.ServicerContext the servicers use"""
+
+    def __init__(self, timeout):
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+        self._code = None
+        self._details = None
+
+    def time_remaining(self):
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0.0)
+
+    def set_code(self, code):
+        self._code = code
+
+    def set_details(self, details):
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def abort(self, code, details):
+        raise LocalRpcError(code, details)
+
+class LocalStub:
+    def __init__(self, servicer, service_name):
+        self._servicer = servicer
+        self._service_name = service_name
+
+    def __getattr__(self, method):
+        handler = getattr(self._servicer, method)
+        name = f"{self._service_name}/{method}"
+
+        def call(request, timeout=None, metadata=None):
+            with tracing.span(name, tracing.INTERNAL, {'rpc.system': 'inproc', 'rpc.method': name}) as span:
+                context = LocalContext(timeout)
+                response = handler(request, context)
+                if context.code() not in (None, grpc.StatusCode.OK):
+                    span.set_error(context.code().name)
+                    raise LocalRpcError(context.code(), context._details)
+                return response
+        return call
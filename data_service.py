@@ -1,16 +1,38 @@
 # data_service.py
 # Centralized data service for microservices to share data
-from concurrent import futures
 import grpc
 import os
-from datetime import datetime
 
 import vault_pb2
 import vault_pb2_grpc
+import logs
+import channels
+import metrics
+import persistence
+import profiling
+import tracing
+import snapshot
+from snapshot import SNAPSHOT_CHUNK_RECORDS
+from hlc import clock
+from memory_store import MemoryStore
+from records import Secret, to_iso
 
-# Centralized data stores
-secrets_db = {}
-access_db = {}
+log = logs.get_logger("DataService")
+
+# Centralized data stores (versioned, last-writer-wins), persisted to
+# PERSIST_DIR if set (see persistence.py)
+store = MemoryStore()
+secrets_db = store.secrets
+access_db = store.access
+changelog = store.changelog
+
+# Address of another data service to copy data from on startup
+BOOTSTRAP_FROM = os.environ.get("BOOTSTRAP_FROM", "")
+
+def _version(request):
+    version = request.version or clock.now()
+    clock.observe(version)
+    return version
 
 class DataServiceImpl(vault_pb2_grpc.ReplicationServiceServicer):
     """
@@ -21,56 +43,122 @@ class DataServiceImpl(vault_pb2_grpc.ReplicationServiceServicer):
     def ReplicateSecret(self, request, context):
         """Store a new secret"""
         secret_id = request.secret_id
-        secrets_db[secret_id] = {
-            'user_id': request.user_id,
-            'secret_name': request.secret_name,
-            'data': request.data,
-            'created_at': request.created_at,
-            'updated_at': request.created_at
-        }
-        print(f"[DataService] Stored secret {secret_id}")
+        store.put_secret(secret_id, Secret(request.user_id, request.secret_name, request.data,
+                                           request.created_at, request.created_at, _version(request)))
+        log.sampled("data.stored", "Stored secret", secret_id=secret_id)
         return vault_pb2.ReplicateSecretResponse(success=True)
 
     def ReplicateUpdate(self, request, context):
         """Update an existing secret"""
         secret_id = request.secret_id
-        if secret_id in secrets_db:
-            secrets_db[secret_id]['data'] = request.data
-            secrets_db[secret_id]['updated_at'] = request.updated_at
-            print(f"[DataService] Updated secret {secret_id}")
-            return vault_pb2.ReplicateUpdateResponse(success=True)
-        return vault_pb2.ReplicateUpdateResponse(success=False)
+        current = secrets_db.get(secret_id)
+        if current is None and not request.user_id:
+            return vault_pb2.ReplicateUpdateResponse(success=False)
+        secret = current or Secret(request.user_id, request.secret_name, '', request.created_at)
+        secret = secret.replace(data=request.data, updated_at=request.updated_at, version=_version(request))
+        if store.put_secret(secret_id, secret):
+            log.sampled("data.updated", "Updated secret", secret_id=secret_id)
+        return vault_pb2.ReplicateUpdateResponse(success=True)
 
     def ReplicateDeletion(self, request, context):
         """Delete a secret"""
         secret_id = request.secret_id
-        if secret_id in secrets_db:
-            del secrets_db[secret_id]
-        if secret_id in access_db:
-            del access_db[secret_id]
-        print(f"[DataService] Deleted secret {secret_id}")
+        store.delete_secret(secret_id, _version(request))
+        log.sampled("data.deleted", "Deleted secret", secret_id=secret_id)
         return vault_pb2.ReplicateDeletionResponse(success=True)
 
     def ReplicateShare(self, request, context):
         """Store share information"""
         secret_id = request.secret_id
-        if secret_id not in access_db:
-            access_db[secret_id] = {
-                'owner_id': request.owner_id,
-                'shared_with': []
-            }
-        if request.target_user_id not in access_db[secret_id]['shared_with']:
-            access_db[secret_id]['shared_with'].append(request.target_user_id)
-        print(f"[DataService] Stored share for {secret_id}")
+        store.merge_share(secret_id, request.owner_id, request.target_user_id, _version(request))
+        log.sampled("data.shared", "Stored share", secret_id=secret_id)
         return vault_pb2.ReplicateShareResponse(success=True)
 
+    def FetchSecret(self, request, context):
+        """Return the versioned copy of a secret"""
+        version, secret = store.get_secret_versioned(request.secret_id)
+        if secret is None:
+            return vault_pb2.FetchSecretResponse(found=False, version=version)
+        return vault_pb2.FetchSecretResponse(
+            found=True, version=version,
+            user_id=secret.user_id,
+            secret_name=secret.secret_name,
+            data=secret.data,
+            created_at=to_iso(secret.created_at),
+            updated_at=to_iso(secret.updated_at)
+        )
+
+    def Snapshot(self, request, context):
+        """Stream all data, then the keys changed since the snapshot watermark"""
+        since = request.since_watermark
+        delta = changelog.changes_since(since) if since else None
+
+        if delta is None:
+            since = changelog.watermark()
+            # list() copies the items in one step so concurrent writers can't
+            # break the iteration; each batch is serialized as soon as it's built.
+            for records in snapshot.iter_batches(list(secrets_db.items())):
+                yield _chunk(False, since, records, {})
+            for records in snapshot.iter_batches(list(access_db.items())):
+                yield _chunk(False, since, {}, records)
+            with store.lock:
+                tombstones = list(store.tombstones.items())
+            for records in snapshot.iter_batches(tombstones):
+                yield _chunk(False, since, {}, {}, records)
+            delta = changelog.changes_since(since)
+            if delta is None:
+                context.abort(grpc.StatusCode.ABORTED,
+                              "Changelog trimmed during snapshot, retry")
+
+        keys, watermark = delta
+        keys = sorted(keys)
+        for i in range(0, len(keys), SNAPSHOT_CHUNK_RECORDS):
+            batch = keys[i:i + SNAPSHOT_CHUNK_RECORDS]
+            secrets = {sid: secrets_db.get(sid) for kind, sid in batch if kind == 'secret'}
+            access = {sid: access_db.get(sid) for kind, sid in batch if kind == 'access'}
+            # Deleted secrets carry their deletion version, so a late write can't revive them
+            tombstones = {sid: version for sid, secret in secrets.items()
+                          if secret is None and (version := store.tombstones.get(sid))}
+            yield _chunk(True, watermark, secrets, access, tombstones)
+        log.info("Streamed snapshot/delta", watermark=watermark)
+
+        yield vault_pb2.SnapshotChunk(is_delta=True, watermark=watermark, last=True)
+
+def _chunk(is_delta, watermark, secrets, access, tombstones=None):
+    return vault_pb2.SnapshotChunk(
+        is_delta=is_delta,
+        watermark=watermark,
+        payload=snapshot.encode_batch(secrets, access, tombstones=tombstones),
+        record_count=len(secrets) + len(access) + len(tombstones or ())
+    )
+
+def bootstrap_from(addr):
+    """Load another data service's dataset before serving"""
+    records = 0
+    with channels.create_channel(addr) as channel:
+        stub = vault_pb2_grpc.ReplicationServiceStub(channel)
+        for chunk in stub.Snapshot(vault_pb2.SnapshotRequest()):
+            if not chunk.payload:
+                continue
+            secrets, access, _, tombstones = snapshot.decode_batch(chunk.payload)
+            store.apply_batch(secrets, access, tombstones)
+            records += chunk.record_count
+    log.info("Bootstrapped", records=records, source=addr)
+
 def serve():
+    tracing.set_service_name("DataService")
     port = os.environ.get("DATA_SERVICE_PORT", "50055")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = channels.create_server("DataService", 10,
+                                    interceptors=[metrics.ServerInterceptor(), tracing.ServerInterceptor()])
     vault_pb2_grpc.add_ReplicationServiceServicer_to_server(DataServiceImpl(), server)
+    persistence.restore(store)
+    if BOOTSTRAP_FROM:
+        bootstrap_from(BOOTSTRAP_FROM)
     server.add_insecure_port(f'[::]:{port}')
-    print(f"[DataService] Centralized Data Service started on port {port}")
+    log.info("Centralized Data Service started", port=port)
     server.start()
+    metrics.serve("DataService")
+    profiling.serve("DataService")
     server.wait_for_termination()
 
 if __name__ == '__main__':
@@ -0,0 +1,21 @@
+# deadlines.py
+# Propagation of a caller's gRPC deadline to downstream calls
+#
+# A downstream call should never outlive the request that made it: once the
+# client has given up, any further work on its behalf is wasted. Handlers
+# derive downstream timeouts from context.time_remaining() instead of
+# fixed constants.
+
+# time_remaining() reports "no deadline" as an effectively infinite value
+_NO_DEADLINE = 1e9
+
+def time_left(context, default):
+    """Seconds left before the caller's deadline, or default if it set none"""
+    left = context.time_remaining() if context is not None else None
+    if left is None or left > _NO_DEADLINE:
+        return default
+    return max(left, 0.0)
+
+def budget(context, cap):
+    """Timeout for a downstream call: the caller's remaining time, at most cap"""
+    return min(time_left(context, cap), cap)
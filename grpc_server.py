@@ -1,11 +1,17 @@
 # grpc_server.py
 # Unified server that runs all microservices on a single port (for simple deployment)
 # Note: For full microservices architecture, use individual service files
-from concurrent import futures
-import grpc
 import os
+import socket
 
 import vault_pb2_grpc
+import prefork
+import logs
+import metrics
+import profiling
+import tracing
+import channels
+import shared_data
 
 # Import microservice implementations
 from secret_management_service import SecretManagementServiceImpl
@@ -13,6 +19,22 @@ from secret_retrieval_service import SecretRetrievalServiceImpl
 from access_control_service import AccessControlServiceImpl
 from replication_service import ReplicationServiceImpl
 
+log = logs.get_logger("UnifiedServer")
+
+# Calls between the services in this process (e.g. SecretRetrieval's access
+# checks via ACCESS_CONTROL_ADDR) skip the network when their target is this
+# server. Addresses that reach it besides localhost/hostname, such as a
+# compose service name, can be listed in LOCAL_SERVICE_ADDRS.
+INPROC_CALLS = os.environ.get("INPROC_CALLS", "true").lower() in ("1", "true", "yes")
+LOCAL_SERVICE_ADDRS = os.environ.get("LOCAL_SERVICE_ADDRS", "")
+
+def local_addrs(port):
+    """Addresses at which other code in this process may reach this server"""
+    hosts = ["localhost", "127.0.0.1", "[::1]", "0.0.0.0", socket.gethostname(), socket.getfqdn()]
+    addrs = [f"{host}:{port}" for host in hosts]
+    addrs += [addr.strip() for addr in LOCAL_SERVICE_ADDRS.split(',') if addr.strip()]
+    return list(dict.fromkeys(addrs))
+
 def serve():
     """
     Run all microservices in a single server process.
@@ -25,34 +47,49 @@ def serve():
     - replication_service.py
     - api_gateway.py
     """
+    # Once, before any worker serves data written by an older version
+    shared_data.migrate_legacy_acls()
+    if prefork.is_supervisor():
+        return prefork.supervise("UnifiedServer")
+    tracing.set_service_name("UnifiedServer")
     port = os.environ.get("PORT", "50051")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=20))
+    server = channels.create_server("UnifiedServer", 20,
+                                    interceptors=[metrics.ServerInterceptor(), tracing.ServerInterceptor()],
+                                    options=prefork.SERVER_OPTIONS)
+
+    servicers = {
+        'SecretManagementService': SecretManagementServiceImpl(),
+        'SecretRetrievalService': SecretRetrievalServiceImpl(),
+        'AccessControlService': AccessControlServiceImpl(),
+        'ReplicationService': ReplicationServiceImpl(),
+    }
 
     # Register all microservices in one server
     vault_pb2_grpc.add_SecretManagementServiceServicer_to_server(
-        SecretManagementServiceImpl(), server
+        servicers['SecretManagementService'], server
     )
     vault_pb2_grpc.add_SecretRetrievalServiceServicer_to_server(
-        SecretRetrievalServiceImpl(), server
+        servicers['SecretRetrievalService'], server
     )
     vault_pb2_grpc.add_AccessControlServiceServicer_to_server(
-        AccessControlServiceImpl(), server
+        servicers['AccessControlService'], server
     )
     vault_pb2_grpc.add_ReplicationServiceServicer_to_server(
-        ReplicationServiceImpl(), server
+        servicers['ReplicationService'], server
     )
 
+    if INPROC_CALLS:
+        addrs = local_addrs(port)
+        for name, servicer in servicers.items():
+            channels.register_local(addrs, name, servicer)
+
     server.add_insecure_port(f'[::]:{port}')
-    print(f"=" * 60)
-    print(f"Unified gRPC Server started on port {port}")
-    print(f"Running all microservices in single process:")
-    print(f"  - SecretManagementService")
-    print(f"  - SecretRetrievalService")
-    print(f"  - AccessControlService")
-    print(f"  - ReplicationService")
-    print(f"=" * 60)
+    log.info("Unified gRPC Server started", port=port, services=list(servicers),
+             inproc_calls=INPROC_CALLS)
     server.start()
-    server.wait_for_termination()
+    metrics.serve("UnifiedServer")
+    profiling.serve("UnifiedServer")
+    prefork.run(server, "UnifiedServer")
 
 if __name__ == '__main__':
     serve()
\ No newline at end of file
@@ -0,0 +1,111 @@
+# hash_ring.py
+# Consistent-hash ring for sharding secrets across nodes
+#
+# With REPLICATION_FACTOR=N (N > 0) each secret is owned by the first N
+# distinct nodes clockwise from hash(secret_id) on a ring of virtual nodes,
+# and only those nodes store and replicate it. Adding a node adds capacity
+# and moves roughly 1/n of the keys, instead of adding one more full copy.
+# REPLICATION_FACTOR=0 (the default) keeps full replication to every node.
+import bisect
+import hashlib
+import os
+
+REPLICATION_FACTOR = int(os.environ.get("REPLICATION_FACTOR", "0"))
+RING_VNODES = int(os.environ.get("RING_VNODES", "64"))
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+def parse_nodes(spec):
+    """
+    Parse "node1=host:port,node2=host:port" into {node_id: addr}. Entries
+    without a "node_id=" prefix use the address itself as the node id, so
+    plain address lists keep working.
+    """
+    nodes = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        node_id, sep, addr = entry.partition('=')
+        nodes[node_id if sep else entry] = addr if sep else entry
+    return nodes
+
+class HashRing:
+    """Ring of virtual nodes; every node appears vnodes times"""
+
+    def __init__(self, node_ids=(), vnodes=RING_VNODES):
+        self.vnodes = vnodes
+        self._hashes = []   # sorted vnode positions
+        self._owners = []   # node id at the same index
+        self.nodes = set()
+        for node_id in node_ids:
+            self.add_node(node_id)
+
+    def add_node(self, node_id):
+        if node_id in self.nodes:
+            return
+        self.nodes.add(node_id)
+        for i in range(self.vnodes):
+            position = _hash(f"{node_id}#{i}")
+            index = bisect.bisect(self._hashes, position)
+            self._hashes.insert(index, position)
+            self._owners.insert(index, node_id)
+
+    def remove_node(self, node_id):
+        if node_id not in self.nodes:
+            return
+        self.nodes.discard(node_id)
+        keep = [(h, n) for h, n in zip(self._hashes, self._owners) if n != node_id]
+        self._hashes = [h for h, _ in keep]
+        self._owners = [n for _, n in keep]
+
+    def preference_list(self, key, count):
+        """First count distinct nodes clockwise from the key's position"""
+        if not self._hashes:
+            return []
+        count = min(count, len(self.nodes))
+        owners = []
+        index = bisect.bisect(self._hashes, _hash(key))
+        for step in range(len(self._hashes)):
+            node_id = self._owners[(index + step) % len(self._owners)]
+            if node_id not in owners:
+                owners.append(node_id)
+                if len(owners) == count:
+                    break
+        return owners
+
+class ShardMap:
+    """
+    Maps a secret id to the nodes that should hold it. local_node is this
+    node's id (None for the gateway); peers maps the other node ids to the
+    address of the service to call on that node.
+    """
+
+    def __init__(self, peers, local_node=None, replication_factor=REPLICATION_FACTOR,
+                 vnodes=RING_VNODES):
+        self.peers = dict(peers)
+        self.local_node = local_node
+        self.replication_factor = replication_factor
+        node_ids = list(self.peers) + ([local_node] if local_node else [])
+        self.ring = HashRing(node_ids, vnodes)
+
+    @property
+    def sharded(self):
+        return self.replication_factor > 0
+
+    def owners(self, secret_id):
+        """Owning node ids, primary first. Every node when not sharded."""
+        if not self.sharded:
+            return ([self.local_node] if self.local_node else []) + list(self.peers)
+        return self.ring.preference_list(secret_id, self.replication_factor)
+
+    def is_owner(self, secret_id):
+        return self.local_node in self.owners(secret_id)
+
+    def owner_addrs(self, secret_id):
+        """Addresses of the owning nodes other than this one, primary first"""
+        return [self.peers[n] for n in self.owners(secret_id) if n != self.local_node]
+
+    def all_addrs(self):
+        return list(self.peers.values())
@@ -0,0 +1,178 @@
+# hdr_histogram.py
+# High Dynamic Range histogram of latencies
+#
+# Same bucket layout as HdrHistogram: values are grouped into power-of-two
+# buckets, each split into enough linear sub-buckets to keep every recorded
+# value within the requested number of significant decimal digits. Memory
+# depends on the range of values, not on how many are recorded, so a
+# benchmark can record millions of latencies and still report exact-enough
+# p99.99s. Histograms from several processes merge by adding counts.
+#
+# Counts are kept sparsely (index -> count), since latencies of one
+# operation cover only a small part of the trackable range.
+import base64
+import bisect
+import collections
+import json
+import math
+import zlib
+
+class HdrHistogram:
+    """Histogram of integer values (e.g. microseconds) with bounded relative error"""
+
+    def __init__(self, lowest=1, highest=3_600_000_000, significant_figures=3):
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_figures = significant_figures
+        largest_single_unit = 2 * 10 ** significant_figures
+        sub_bucket_count_magnitude = math.ceil(math.log2(largest_single_unit))
+        self._half_magnitude = max(sub_bucket_count_magnitude, 1) - 1
+        self._unit_magnitude = int(math.floor(math.log2(lowest)))
+        self._sub_bucket_count = 1 << (self._half_magnitude + 1)
+        self._half_count = self._sub_bucket_count // 2
+        self._sub_bucket_mask = (self._sub_bucket_count - 1) << self._unit_magnitude
+        self.counts = collections.Counter()     # counts index -> count
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value):
+        bucket = ((value | self._sub_bucket_mask).bit_length()
+                  - (self._unit_magnitude + self._half_magnitude + 1))
+        sub_bucket = value >> (bucket + self._unit_magnitude)
+        return ((bucket + 1) << self._half_magnitude) + (sub_bucket - self._half_count)
+
+    def _bucket_of(self, index):
+        bucket = (index >> self._half_magnitude) - 1
+        sub_bucket = (index & (self._half_count - 1)) + self._half_count
+        if bucket < 0:
+            sub_bucket -= self._half_count
+            bucket = 0
+        return bucket, sub_bucket
+
+    def lowest_equivalent(self, index):
+        bucket, sub_bucket = self._bucket_of(index)
+        return sub_bucket << (bucket + self._unit_magnitude)
+
+    def highest_equivalent(self, index):
+        """Largest value that falls into the same sub-bucket as index"""
+        bucket, _ = self._bucket_of(index)
+        return self.lowest_equivalent(index) + (1 << (bucket + self._unit_magnitude)) - 1
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += count
+        if self.total == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.total += count
+
+    def record_corrected(self, value, expected_interval):
+        """
+        Record value, plus the samples a closed-loop load generator failed to
+        send while waiting for it: one per expected_interval of the stall,
+        each waiting that much less (coordinated omission correction).
+        """
+        self.record(value)
+        if expected_interval <= 0:
+            return
+        missing = value - expected_interval
+        while missing >= expected_interval:
+            self.record(missing)
+            missing -= expected_interval
+
+    def add(self, other):
+        """Merge another histogram with the same layout into this one"""
+        if other.total == 0:
+            return
+        self.counts.update(other.counts)
+        self.min = other.min if self.total == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.total += other.total
+
+    def value_at_percentile(self, percentile):
+        if self.total == 0:
+            return 0
+        target = max(math.ceil(percentile / 100 * self.total), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.highest_equivalent(index), self.max)
+        return self.max
+
+    def count_at_or_below(self, value):
+        if self.total == 0:
+            return 0
+        limit = self._index(min(max(int(value), 0), self.highest))
+        return sum(count for index, count in self.counts.items() if index <= limit)
+
+    def mean(self):
+        if self.total == 0:
+            return 0.0
+        total = sum((self.lowest_equivalent(i) + self.highest_equivalent(i)) / 2 * count
+                    for i, count in self.counts.items())
+        return min(total / self.total, self.max)
+
+    def percentile_spectrum(self, ticks_per_half_distance=5):
+        """
+        [(percentile, value, count at or below value)], densest towards the
+        tail: ticks_per_half_distance points per halving of the distance to
+        100%, as in HdrHistogram's percentile distribution output.
+        """
+        if self.total == 0:
+            return []
+        indexes = sorted(self.counts)
+        cumulative = []
+        seen = 0
+        for index in indexes:
+            seen += self.counts[index]
+            cumulative.append(seen)
+
+        spectrum = []
+        percentile = 0.0
+        while True:
+            target = max(math.ceil(percentile / 100 * self.total), 1)
+            position = bisect.bisect_left(cumulative, target)
+            value = min(self.highest_equivalent(indexes[position]), self.max)
+            spectrum.append((percentile, value, cumulative[position]))
+            if cumulative[position] >= self.total:
+                break
+            half_distance = 2 ** (int(math.log2(100 / (100 - percentile))) + 1)
+            percentile += 100 / (half_distance * ticks_per_half_distance)
+        spectrum.append((100.0, self.max, self.total))
+        return spectrum
+
+    def format_hgrm(self, scale=1.0):
+        """Percentile distribution in HdrHistogram's .hgrm text format; values divided by scale"""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        for percentile, value, count in self.percentile_spectrum():
+            fraction = percentile / 100
+            inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1 else f"{'Infinity':>14}"
+            lines.append(f"{value / scale:12.3f} {fraction:14.12f} {count:10d} {inverse}")
+        lines.append(f"#[Mean    = {self.mean() / scale:12.3f}, Max           = {self.max / scale:12.3f}]")
+        lines.append(f"#[Total count    = {self.total:12d}, SubBuckets     = {self._sub_bucket_count:12d}]")
+        return "\n".join(lines) + "\n"
+
+    def encode(self):
+        """Compact JSON-safe form, for passing between processes or storing in results"""
+        pairs = sorted(self.counts.items())
+        return {
+            'lowest': self.lowest,
+            'highest': self.highest,
+            'significant_figures': self.significant_figures,
+            'min': self.min,
+            'max': self.max,
+            'counts': base64.b64encode(zlib.compress(json.dumps(pairs).encode('utf-8'))).decode('ascii'),
+        }
+
+    @classmethod
+    def decode(cls, encoded):
+        histogram = cls(encoded['lowest'], encoded['highest'], encoded['significant_figures'])
+        for index, count in json.loads(zlib.decompress(base64.b64decode(encoded['counts']))):
+            histogram.counts[index] = count
+            histogram.total += count
+        histogram.min = encoded['min']
+        histogram.max = encoded['max']
+        return histogram
@@ -0,0 +1,72 @@
+# hlc.py
+# Hybrid logical clock used to version every secret and ACL mutation
+#
+# A version is "<physical ms>.<logical counter>.<node id>", zero-padded so
+# that plain string comparison orders versions correctly. Replicas apply a
+# mutation only if its version is newer than what they hold (last-writer-wins),
+# which makes replication idempotent and safe to reorder, retry or parallelize.
+import os
+import socket
+import threading
+import time
+
+NODE_ID = os.environ.get("NODE_ID") or socket.gethostname()
+
+def encode(physical_ms, logical, node_id):
+    return f"{physical_ms:015d}.{logical:06d}.{node_id}"
+
+def decode(version):
+    """Return (physical_ms, logical, node_id) for a version string"""
+    physical, logical, node_id = version.split('.', 2)
+    return int(physical), int(logical), node_id
+
+def is_newer(version, than):
+    """True if version orders strictly after than. Empty/missing versions are oldest."""
+    return (version or '') > (than or '')
+
+def physical_ms(version):
+    return decode(version)[0] if version else 0
+
+class HybridLogicalClock:
+    """Monotonic clock that stays ahead of every version it has observed"""
+
+    def __init__(self, node_id=NODE_ID):
+        self.node_id = node_id
+        self._physical = 0
+        self._logical = 0
+        self._lock = threading.Lock()
+
+    def now(self):
+        """Version for a new local mutation"""
+        wall = int(time.time() * 1000)
+        with self._lock:
+            if wall > self._physical:
+                self._physical, self._logical = wall, 0
+            else:
+                self._logical += 1
+            return encode(self._physical, self._logical, self.node_id)
+
+    def observe(self, version):
+        """Advance past a version received from another node"""
+        if not version:
+            return
+        remote_physical, remote_logical, _ = decode(version)
+        wall = int(time.time() * 1000)
+        with self._lock:
+            physical = max(self._physical, remote_physical, wall)
+            if physical == self._physical and physical == remote_physical:
+                logical = max(self._logical, remote_logical) + 1
+            elif physical == self._physical:
+                logical = self._logical + 1
+            elif physical == remote_physical:
+                logical = remote_logical + 1
+            else:
+                logical = 0
+            self._physical, self._logical = physical, logical
+
+# Shared by every service in the process. Worker processes of one node
+# (see prefork.py) each get their own id so they never issue the same version,
+# including a worker and its replacement, which get different generations.
+WORKER_ID = os.environ.get("PREFORK_WORKER_ID", "")
+GENERATION = os.environ.get("PREFORK_GENERATION", "")
+clock = HybridLogicalClock(f"{NODE_ID}-{WORKER_ID}-g{GENERATION}" if WORKER_ID else NODE_ID)
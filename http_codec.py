@@ -0,0 +1,134 @@
+# http_codec.py
+# Fast serialization and response compression for http_server.py
+#
+# JSON is encoded and decoded with orjson when it is installed (several
+# times faster than the stdlib json module, which remains the fallback).
+# Clients that list application/msgpack ahead of JSON in their Accept header
+# get MessagePack responses instead, and may send MessagePack request
+# bodies; the nodes use this between themselves. Responses of at least
+# HTTP_COMPRESSION_MIN_BYTES are compressed with the first of
+# HTTP_COMPRESSION's encodings the client accepts. Brotli needs the brotli
+# package.
+#
+# orjson, msgpack and brotli are all optional: without them the server
+# speaks plain JSON, and gzip only.
+import gzip
+import json
+import os
+
+from flask import request
+from flask.json.provider import JSONProvider
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings to compress responses with, in order of preference ("" = never)
+HTTP_COMPRESSION = os.environ.get("HTTP_COMPRESSION", "br,gzip")
+# Smaller responses aren't worth compressing (about one packet)
+HTTP_COMPRESSION_MIN_BYTES = int(os.environ.get("HTTP_COMPRESSION_MIN_BYTES", "1400"))
+HTTP_GZIP_LEVEL = int(os.environ.get("HTTP_GZIP_LEVEL", "5"))
+HTTP_BROTLI_QUALITY = int(os.environ.get("HTTP_BROTLI_QUALITY", "4"))
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack')
+
+_ENCODERS = {'gzip': lambda data: gzip.compress(data, HTTP_GZIP_LEVEL)}
+if brotli is not None:
+    _ENCODERS['br'] = lambda data: brotli.compress(data, quality=HTTP_BROTLI_QUALITY)
+_encodings = [e.strip() for e in HTTP_COMPRESSION.split(',') if e.strip() in _ENCODERS]
+
+# Accept header for requests to other nodes
+ACCEPT = f"{MSGPACK}, {JSON};q=0.9" if msgpack is not None else JSON
+
+def dumps(obj):
+    """JSON-encode obj to bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def decode(content_type, data):
+    """Body of a request or response, by its content type"""
+    if (content_type or '').split(';')[0].strip() in MSGPACK_TYPES:
+        if msgpack is None:
+            raise ValueError("MessagePack body, but msgpack is not installed")
+        return msgpack.unpackb(data)
+    return loads(data)
+
+def decode_response(response):
+    """Body of a requests.Response from another node"""
+    return decode(response.headers.get('Content-Type'), response.content)
+
+def request_data(silent=False):
+    """
+    Body of the current request, JSON or MessagePack (like request.json).
+    silent=True returns None instead of failing on a missing or bad body.
+    """
+    if request.mimetype not in MSGPACK_TYPES:
+        return request.get_json(silent=silent)
+    if msgpack is None:
+        if silent:
+            return None
+        raise UnsupportedMediaType("MessagePack is not supported by this node")
+    try:
+        return msgpack.unpackb(request.get_data())
+    except ValueError:
+        if silent:
+            return None
+        raise BadRequest("Invalid MessagePack body")
+
+def _response_type():
+    if msgpack is None:
+        return JSON
+    return request.accept_mimetypes.best_match((JSON,) + MSGPACK_TYPES, default=JSON)
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider: orjson for jsonify() and request.json, MessagePack if the client prefers it"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = _response_type()
+        body = msgpack.packb(obj) if mimetype in MSGPACK_TYPES else dumps(obj)
+        return self._app.response_class(body, mimetype=mimetype)
+
+def compress(response):
+    """after_request hook: compress the body if it is large enough and the client accepts an encoding"""
+    if (not _encodings or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.status_code in (204, 304)):
+        return response
+    data = response.get_data()
+    if len(data) < HTTP_COMPRESSION_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    for encoding in _encodings:
+        if request.accept_encodings[encoding]:
+            response.set_data(_ENCODERS[encoding](data))
+            response.headers['Content-Encoding'] = encoding
+            break
+    return response
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(compress)
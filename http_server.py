@@ -1,34 +1,170 @@
 # http_server.py
 # Monolithic HTTP/REST server implementing all 5 functional requirements
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
 import requests
-import threading
-from datetime import datetime
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import http_codec
+import logs
+import metrics
+import persistence
+import profiling
+import quorum
+import records
+import tracing
+import snapshot
+from hash_ring import ShardMap, parse_nodes
+from hlc import clock, NODE_ID
+from memory_store import MemoryStore
+from records import Secret
+
+log = logs.get_logger("HTTP")
+replica_log = logs.get_logger("HTTP-Replication")
 
 app = Flask(__name__)
-
-# In-memory data store for this node
-# Structure: { secret_id: { user_id, secret_name, data, created_at, updated_at } }
-vault = {}
+# Request counts, latency and in-flight requests per route, at /metrics
+metrics.instrument_flask(app)
+# orjson/MessagePack bodies and compressed responses (see http_codec.py)
+http_codec.init_app(app)
+# A span per request, continuing the caller's trace (see tracing.py)
+tracing.instrument_flask(app)
+# /debug/pprof/profile and /debug/pprof/heap, if PROFILING_ENABLED (see profiling.py)
+profiling.instrument_flask(app)
+
+# In-memory data store for this node. Every record carries a hybrid logical
+# clock version and writes are applied last-writer-wins (see memory_store.py).
+# With PERSIST_DIR set it's restored from disk on startup and its writes are
+# logged there (see persistence.py).
+store = MemoryStore()
+
+# Structure: { secret_id: Secret(user_id, secret_name, data, created_at, updated_at, version) }
+vault = store.secrets
 
 # Access control database
-# Structure: { secret_id: { owner_id, shared_with: [user_id1, user_id2] } }
-access_control = {}
+# Structure: { secret_id: Access(owner_id, shared_with={user_id1, user_id2}, version) }
+access_control = store.access
+
+# Keys changed since startup, for serving snapshot deltas to new replicas
+changelog = store.changelog
+
+# Other nodes in the cluster. With "node_id=url" entries and REPLICATION_FACTOR > 0
+# each secret lives only on the nodes that own it (see hash_ring.py); requests for
+# a secret this node doesn't own are proxied to an owner.
+cluster = ShardMap(parse_nodes(os.environ.get("OTHER_NODES", "")), local_node=NODE_ID)
+OTHER_NODES = cluster.all_addrs()
 
-# List of other nodes in the cluster
-OTHER_NODES = os.environ.get("OTHER_NODES", "").split(',') if os.environ.get("OTHER_NODES") else []
+# Node to copy the dataset from on startup (e.g. http://http-node1:5000)
+BOOTSTRAP_FROM = os.environ.get("BOOTSTRAP_FROM", "")
+BOOTSTRAP_ATTEMPTS = int(os.environ.get("BOOTSTRAP_ATTEMPTS", "5"))
+
+# Replication fans out to all nodes in parallel; versioned writes make the
+# delivery order irrelevant.
+replication_pool = ThreadPoolExecutor(max_workers=max(len(OTHER_NODES), 1))
+# Separate pool for sharded list fan-out so reads never queue behind replication
+scatter_pool = ThreadPoolExecutor(max_workers=max(len(OTHER_NODES), 1))
 
 # --- Helper for Replication ---
-def replicate_to_nodes(action, data):
-    """Sends operations to all other nodes."""
-    for node_url in OTHER_NODES:
-        if not node_url: continue
+def peer_span(method, node_url, path):
+    """Client span around a request to another node"""
+    return tracing.span(f"{method} {path}", tracing.CLIENT,
+                        {'http.request.method': method, 'server.address': node_url})
+
+def replicate_to_node(node_url, action, data):
+    try:
+        with peer_span('POST', node_url, '/replicate'):
+            response = requests.post(f"{node_url}/replicate",
+                                     data=http_codec.dumps({"action": action, "data": data}),
+                                     headers={'Content-Type': http_codec.JSON, **tracing.headers()}, timeout=2)
+            response.raise_for_status()
+        log.sampled("http.replicated", "Replicated", action=action, peer=node_url)
+        return True
+    except requests.exceptions.RequestException as e:
+        log.warning("Failed to replicate", action=action, peer=node_url, error=str(e))
+        return False
+
+def replicate_to_nodes(action, data, level=quorum.ONE):
+    """
+    Sends operations to the other nodes that hold the secret, in parallel,
+    and waits until the consistency level is met. Returns (acknowledged,
+    required), counting this node's own write.
+    """
+    secret_id = data['secret_id']
+    calls = {node_url: replication_pool.submit(tracing.wrap(replicate_to_node), node_url, action, data)
+             for node_url in cluster.owner_addrs(secret_id)}
+    return quorum.await_acks(calls, 1 if cluster.is_owner(secret_id) else 0, level)
+
+def consistency_level(default):
+    """Consistency level from ?consistency= or the JSON body's "consistency" field"""
+    body = http_codec.request_data(silent=True) or {}
+    return quorum.parse_level(request.args.get('consistency') or body.get('consistency'), default)
+
+def level_not_met(level, acked, needed):
+    return jsonify({
+        "error": f"Consistency level {level} not met: {acked} of {needed} replicas acknowledged",
+        "success": False
+    }), 503
+
+def fetch_from_node(node_url, secret_id):
+    with peer_span('GET', node_url, '/fetch/<secret_id>'):
+        response = requests.get(f"{node_url}/fetch/{secret_id}",
+                                headers={'Accept': http_codec.ACCEPT, **tracing.headers()}, timeout=2)
+        response.raise_for_status()
+    body = http_codec.decode_response(response)
+    return body['version'], records.secret_from_dict(body['secret'])
+
+def read_secret(secret_id, level):
+    """
+    Read a secret from as many replicas as level requires and return the
+    newest copy (None if missing or deleted), repairing replicas that
+    answered with an older version. Returns (secret, replicas_answered, required).
+    """
+    responses = {}
+    if cluster.is_owner(secret_id):
+        responses[NODE_ID] = store.get_secret_versioned(secret_id)
+    peers = cluster.owner_addrs(secret_id)
+    needed = quorum.required(level, len(peers) + len(responses))
+    if len(responses) < needed:
+        calls = {node_url: scatter_pool.submit(tracing.wrap(fetch_from_node), node_url, secret_id)
+                 for node_url in peers}
+        responses.update(quorum.collect(calls, needed - len(responses)))
+    if len(responses) < needed:
+        return None, len(responses), needed
+
+    version, secret, stale = quorum.resolve(responses)
+    if stale:
+        if secret is None:
+            action, data = "delete", {"secret_id": secret_id, "version": version}
+        else:
+            action, data = "update", dict(secret.to_dict(), secret_id=secret_id)
+        for node in stale:
+            if node == NODE_ID:
+                apply_mutation(action, data)
+            else:
+                replication_pool.submit(tracing.wrap(replicate_to_node), node, action, data)
+        log.info("Read repair", secret_id=secret_id, version=version, stale_nodes=len(stale))
+    return secret, len(responses), needed
+
+def forward_to_owner(secret_id):
+    """Proxy the current request to the first reachable node that owns secret_id."""
+    for node_url in cluster.owner_addrs(secret_id):
         try:
-            requests.post(f"{node_url}/replicate", json={"action": action, "data": data}, timeout=2)
-            print(f"Replicated {action} to {node_url}")
+            with peer_span(request.method, node_url, request.url_rule.rule):
+                upstream = requests.request(
+                    request.method, f"{node_url}{request.full_path}",
+                    data=request.get_data(),
+                    headers={'Content-Type': request.content_type or http_codec.JSON,
+                             'Accept': request.headers.get('Accept', '*/*'), **tracing.headers()},
+                    timeout=5
+                )
         except requests.exceptions.RequestException as e:
-            print(f"Failed to replicate to {node_url}: {e}")
+            log.warning("Owner unreachable", owner=node_url, secret_id=secret_id, error=str(e))
+            continue
+        return Response(upstream.content, status=upstream.status_code,
+                        content_type=upstream.headers.get('Content-Type'))
+    return jsonify({"error": "No owner of this secret is reachable"}), 503
 
 
 # --- API Endpoints ---
@@ -37,7 +173,7 @@ def replicate_to_nodes(action, data):
 @app.route('/secrets', methods=['POST'])
 def add_secret():
     """Add a new secret to the vault."""
-    data = request.json
+    data = http_codec.request_data()
     user_id = data.get('user_id')
     secret_name = data.get('secret_name')
     secret_data = data.get('data')
@@ -46,25 +182,23 @@ def add_secret():
     if not all([user_id, secret_name, secret_data, secret_id]):
         return jsonify({"error": "Missing required fields"}), 400
 
-    timestamp = datetime.utcnow().isoformat()
-    vault[secret_id] = {
-        'user_id': user_id,
-        'secret_name': secret_name,
-        'data': secret_data,
-        'created_at': timestamp,
-        'updated_at': timestamp
-    }
-    print(f"[HTTP] Added secret {secret_id} for user {user_id}")
+    try:
+        level = consistency_level(quorum.WRITE_CONSISTENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not cluster.is_owner(secret_id):
+        return forward_to_owner(secret_id)
+
+    timestamp = records.now()
+    secret = Secret(user_id, secret_name, secret_data, timestamp, timestamp, clock.now())
+    store.put_secret(secret_id, secret)
+    log.sampled("secret.added", "Added secret", secret_id=secret_id, user_id=user_id)
 
     # Replicate to other nodes
-    threading.Thread(target=replicate_to_nodes, args=("add", {
-        "secret_id": secret_id,
-        "user_id": user_id,
-        "secret_name": secret_name,
-        "data": secret_data,
-        "created_at": timestamp,
-        "updated_at": timestamp
-    })).start()
+    acked, needed = replicate_to_nodes("add", dict(secret.to_dict(), secret_id=secret_id), level)
+    if acked < needed:
+        return level_not_met(level, acked, needed)
 
     return jsonify({
         "secret_id": secret_id,
@@ -81,21 +215,34 @@ def retrieve_secret(secret_id):
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
 
-    if secret_id not in vault:
-        return jsonify({"error": "Secret not found"}), 404
+    try:
+        level = consistency_level(quorum.READ_CONSISTENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    secret = vault[secret_id]
+    if not cluster.is_owner(secret_id):
+        return forward_to_owner(secret_id)
+
+    secret, answered, needed = read_secret(secret_id, level)
+    if answered < needed:
+        return jsonify({
+            "error": f"Consistency level {level} not met: {answered} of {needed} replicas answered"
+        }), 503
+
+    if secret is None:
+        return jsonify({"error": "Secret not found"}), 404
 
     # Check access permission
-    if secret['user_id'] != user_id:
+    if secret.user_id != user_id:
         # Check if shared
-        if secret_id not in access_control or user_id not in access_control[secret_id].get('shared_with', []):
+        access = access_control.get(secret_id)
+        if access is None or user_id not in access.shared_with:
             return jsonify({"error": "Access denied"}), 403
 
-    print(f"[HTTP] Retrieved secret {secret_id} for user {user_id}")
+    log.sampled("secret.retrieved", "Retrieved secret", secret_id=secret_id, user_id=user_id)
     return jsonify({
         "secret_id": secret_id,
-        "data": secret['data'],
+        "data": secret.data,
         "success": True
     })
 
@@ -103,34 +250,40 @@ def retrieve_secret(secret_id):
 @app.route('/secrets/<secret_id>', methods=['PUT'])
 def update_secret(secret_id):
     """Update an existing secret."""
-    data = request.json
+    data = http_codec.request_data()
     user_id = data.get('user_id')
     new_data = data.get('data')
 
     if not all([user_id, new_data]):
         return jsonify({"error": "Missing required fields"}), 400
 
+    try:
+        level = consistency_level(quorum.WRITE_CONSISTENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not cluster.is_owner(secret_id):
+        return forward_to_owner(secret_id)
+
     if secret_id not in vault:
         return jsonify({"error": "Secret not found"}), 404
 
     secret = vault[secret_id]
 
     # Verify ownership
-    if secret['user_id'] != user_id:
+    if secret.user_id != user_id:
         return jsonify({"error": "Only owner can update secret"}), 403
 
-    timestamp = datetime.utcnow().isoformat()
-    vault[secret_id]['data'] = new_data
-    vault[secret_id]['updated_at'] = timestamp
+    clock.observe(secret.version)
+    updated = secret.replace(data=new_data, updated_at=records.now(), version=clock.now())
+    store.put_secret(secret_id, updated)
 
-    print(f"[HTTP] Updated secret {secret_id}")
+    log.sampled("secret.updated", "Updated secret", secret_id=secret_id)
 
-    # Replicate update
-    threading.Thread(target=replicate_to_nodes, args=("update", {
-        "secret_id": secret_id,
-        "data": new_data,
-        "updated_at": timestamp
-    })).start()
+    # Replicate update (full record, so it applies even before the add arrives)
+    acked, needed = replicate_to_nodes("update", dict(updated.to_dict(), secret_id=secret_id), level)
+    if acked < needed:
+        return level_not_met(level, acked, needed)
 
     return jsonify({
         "secret_id": secret_id,
@@ -147,25 +300,36 @@ def delete_secret(secret_id):
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
 
+    try:
+        level = consistency_level(quorum.WRITE_CONSISTENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not cluster.is_owner(secret_id):
+        return forward_to_owner(secret_id)
+
     if secret_id not in vault:
         return jsonify({"error": "Secret not found"}), 404
 
     secret = vault[secret_id]
 
     # Verify ownership
-    if secret['user_id'] != user_id:
+    if secret.user_id != user_id:
         return jsonify({"error": "Only owner can delete secret"}), 403
 
-    del vault[secret_id]
-    if secret_id in access_control:
-        del access_control[secret_id]
+    clock.observe(secret.version)
+    version = clock.now()
+    store.delete_secret(secret_id, version)
 
-    print(f"[HTTP] Deleted secret {secret_id}")
+    log.sampled("secret.deleted", "Deleted secret", secret_id=secret_id)
 
     # Replicate deletion
-    threading.Thread(target=replicate_to_nodes, args=("delete", {
-        "secret_id": secret_id
-    })).start()
+    acked, needed = replicate_to_nodes("delete", {
+        "secret_id": secret_id,
+        "version": version
+    }, level)
+    if acked < needed:
+        return level_not_met(level, acked, needed)
 
     return jsonify({
         "secret_id": secret_id,
@@ -182,71 +346,88 @@ def list_secrets():
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
 
-    user_secrets = []
-
-    for secret_id, secret in vault.items():
-        # Check if user is owner
-        is_owner = secret['user_id'] == user_id
-
-        # Check if secret is shared with user
-        is_shared = False
-        if secret_id in access_control:
-            is_shared = user_id in access_control[secret_id].get('shared_with', [])
-
-        if is_owner or is_shared:
-            user_secrets.append({
-                'secret_id': secret_id,
-                'secret_name': secret['secret_name'],
-                'created_at': secret['created_at'],
-                'updated_at': secret['updated_at'],
-                'is_shared': is_shared
-            })
-
-    print(f"[HTTP] Listed {len(user_secrets)} secrets for user {user_id}")
+    # Secrets the user owns or that are shared with them, from the store's
+    # reverse indexes rather than a scan of the whole vault
+    user_secrets = [{
+        'secret_id': secret_id,
+        'secret_name': secret.secret_name,
+        'created_at': records.to_iso(secret.created_at),
+        'updated_at': records.to_iso(secret.updated_at),
+        'is_shared': is_shared
+    } for secret_id, secret, is_shared in store.secrets_for_user(user_id)]
+
+    # Sharded: every node only holds its own keys, so gather from all of them
+    # (peers are asked with local=1 so they don't fan out again)
+    if cluster.sharded and not request.args.get('local'):
+        merged = {s['secret_id']: s for s in user_secrets}
+        for peer_secrets in scatter_pool.map(tracing.wrap(lambda url: _list_from_peer(url, user_id)), OTHER_NODES):
+            for secret in peer_secrets:
+                current = merged.get(secret['secret_id'])
+                if current is None or secret['updated_at'] > current['updated_at']:
+                    merged[secret['secret_id']] = secret
+        user_secrets = list(merged.values())
+
+    log.sampled("secret.listed", "Listed secrets", count=len(user_secrets), user_id=user_id)
     return jsonify({
         "secrets": user_secrets,
         "total_count": len(user_secrets)
     })
 
+def _list_from_peer(node_url, user_id):
+    try:
+        with peer_span('GET', node_url, '/secrets'):
+            response = requests.get(f"{node_url}/secrets", params={"user_id": user_id, "local": 1},
+                                    headers={'Accept': http_codec.ACCEPT, **tracing.headers()}, timeout=5)
+            response.raise_for_status()
+        return http_codec.decode_response(response).get('secrets', [])
+    except requests.exceptions.RequestException as e:
+        log.warning("Failed to list secrets", peer=node_url, error=str(e))
+        return []
+
 # Requirement 5: Share Secret
 @app.route('/secrets/<secret_id>/share', methods=['POST'])
 def share_secret(secret_id):
     """Share a secret with another user."""
-    data = request.json
+    data = http_codec.request_data()
     owner_id = data.get('owner_id')
     target_user_id = data.get('target_user_id')
 
     if not all([owner_id, target_user_id]):
         return jsonify({"error": "Missing required fields"}), 400
 
+    try:
+        level = consistency_level(quorum.WRITE_CONSISTENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not cluster.is_owner(secret_id):
+        return forward_to_owner(secret_id)
+
     if secret_id not in vault:
         return jsonify({"error": "Secret not found"}), 404
 
     secret = vault[secret_id]
 
     # Verify ownership
-    if secret['user_id'] != owner_id:
+    if secret.user_id != owner_id:
         return jsonify({"error": "Only owner can share secret"}), 403
 
-    # Initialize access control
-    if secret_id not in access_control:
-        access_control[secret_id] = {
-            'owner_id': owner_id,
-            'shared_with': []
-        }
+    # Add target user (creating the access control entry if needed)
+    clock.observe(secret.version)
+    version = clock.now()
+    store.merge_share(secret_id, owner_id, target_user_id, version)
 
-    # Add target user
-    if target_user_id not in access_control[secret_id]['shared_with']:
-        access_control[secret_id]['shared_with'].append(target_user_id)
-
-    print(f"[HTTP] Shared secret {secret_id} with user {target_user_id}")
+    log.sampled("secret.shared", "Shared secret", secret_id=secret_id, target_user_id=target_user_id)
 
     # Replicate share
-    threading.Thread(target=replicate_to_nodes, args=("share", {
+    acked, needed = replicate_to_nodes("share", {
         "secret_id": secret_id,
         "owner_id": owner_id,
-        "target_user_id": target_user_id
-    })).start()
+        "target_user_id": target_user_id,
+        "version": version
+    }, level)
+    if acked < needed:
+        return level_not_met(level, acked, needed)
 
     return jsonify({
         "message": f"Secret shared successfully with user {target_user_id}",
@@ -257,46 +438,140 @@ def share_secret(secret_id):
 @app.route('/replicate', methods=['POST'])
 def handle_replication():
     """Internal endpoint for receiving replicated data."""
-    req_data = request.json
-    action = req_data.get('action')
-    data = req_data.get('data')
-
-    if action == 'add':
-        vault[data['secret_id']] = {
-            'user_id': data['user_id'],
-            'secret_name': data['secret_name'],
-            'data': data['data'],
-            'created_at': data['created_at'],
-            'updated_at': data['updated_at']
-        }
-        print(f"[HTTP-Replication] Added secret {data['secret_id']}")
-
-    elif action == 'update':
-        if data['secret_id'] in vault:
-            vault[data['secret_id']]['data'] = data['data']
-            vault[data['secret_id']]['updated_at'] = data['updated_at']
-            print(f"[HTTP-Replication] Updated secret {data['secret_id']}")
+    req_data = http_codec.request_data()
+    apply_mutation(req_data.get('action'), req_data.get('data'))
+    return jsonify({"message": "Replication successful"}), 200
+
+def apply_mutation(action, data):
+    """Apply a replicated (or read-repair) mutation last-writer-wins"""
+    # Mutations from nodes that predate versioning are stamped on arrival
+    version = data.get('version') or clock.now()
+    clock.observe(version)
+
+    if action in ('add', 'update'):
+        # Both carry the full record; the newest version wins regardless of
+        # the order in which they arrive
+        applied = store.put_secret(data['secret_id'], Secret(
+            data['user_id'], data['secret_name'], data['data'],
+            data['created_at'], data['updated_at'], version
+        ))
+        if applied:
+            replica_log.sampled("replication.applied", "Applied", action=action, secret_id=data['secret_id'])
+        else:
+            replica_log.sampled("replication.stale", "Ignored stale write", action=action, secret_id=data['secret_id'])
 
     elif action == 'delete':
-        if data['secret_id'] in vault:
-            del vault[data['secret_id']]
-        if data['secret_id'] in access_control:
-            del access_control[data['secret_id']]
-        print(f"[HTTP-Replication] Deleted secret {data['secret_id']}")
+        store.delete_secret(data['secret_id'], version)
+        replica_log.sampled("replication.applied", "Applied", action=action, secret_id=data['secret_id'])
 
     elif action == 'share':
         secret_id = data['secret_id']
-        if secret_id not in access_control:
-            access_control[secret_id] = {
-                'owner_id': data['owner_id'],
-                'shared_with': []
-            }
-        if data['target_user_id'] not in access_control[secret_id]['shared_with']:
-            access_control[secret_id]['shared_with'].append(data['target_user_id'])
-        print(f"[HTTP-Replication] Shared secret {secret_id}")
-
-    return jsonify({"message": "Replication successful"}), 200
+        store.merge_share(secret_id, data['owner_id'], data['target_user_id'], version)
+        replica_log.sampled("replication.applied", "Applied", action=action, secret_id=secret_id)
+
+@app.route('/fetch/<secret_id>', methods=['GET'])
+def fetch_secret(secret_id):
+    """Internal endpoint for quorum reads: this node's versioned copy of a secret."""
+    version, secret = store.get_secret_versioned(secret_id)
+    return jsonify({"version": version, "secret": records.to_dict(secret)})
+
+@app.route('/snapshot', methods=['GET'])
+def stream_snapshot():
+    """
+    Internal endpoint for bootstrapping a new replica. Streams newline-delimited
+    JSON batches ({"is_delta", "watermark", "secrets", "access", "tombstones",
+    "last"}) through one deflate stream, flushed after each batch. Tombstones
+    map deleted secret ids to their deletion version. ?since=<watermark> asks
+    for the delta only; without it (or if the changelog no longer reaches back
+    that far) a full snapshot is sent first. Only a complete stream ends with
+    a batch marked "last".
+    """
+    since = request.args.get('since', '')
+    delta = changelog.changes_since(since) if since else None
+
+    def generate():
+        nonlocal since, delta
+        compressor = zlib.compressobj(snapshot.SNAPSHOT_COMPRESSION_LEVEL)
+
+        def frame(is_delta, watermark, secrets, access, tombstones=None, last=False):
+            secrets, access = snapshot.batch_to_dicts(secrets, access)
+            line = http_codec.dumps({'is_delta': is_delta, 'watermark': watermark,
+                                     'secrets': secrets, 'access': access,
+                                     'tombstones': tombstones or {}, 'last': last})
+            return compressor.compress(line + b'\n') + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        if delta is None:
+            since = changelog.watermark()
+            for records in snapshot.iter_batches(list(vault.items())):
+                yield frame(False, since, records, {})
+            for records in snapshot.iter_batches(list(access_control.items())):
+                yield frame(False, since, {}, records)
+            with store.lock:
+                tombstones = list(store.tombstones.items())
+            for records in snapshot.iter_batches(tombstones):
+                yield frame(False, since, {}, {}, records)
+            delta = changelog.changes_since(since)
+            if delta is None:
+                # No final frame: the client treats the stream as incomplete and retries
+                log.warning("Changelog trimmed during snapshot", since=since)
+                yield compressor.flush()
+                return
+
+        keys, watermark = delta
+        keys = sorted(keys)
+        for i in range(0, len(keys), snapshot.SNAPSHOT_CHUNK_RECORDS):
+            batch = keys[i:i + snapshot.SNAPSHOT_CHUNK_RECORDS]
+            secrets = {sid: vault.get(sid) for kind, sid in batch if kind == 'secret'}
+            access = {sid: access_control.get(sid) for kind, sid in batch if kind == 'access'}
+            # Deleted secrets carry their deletion version, so a late write can't revive them
+            tombstones = {sid: version for sid, secret in secrets.items()
+                          if secret is None and (version := store.tombstones.get(sid))}
+            yield frame(True, watermark, secrets, access, tombstones)
+        yield frame(True, watermark, {}, {}, last=True) + compressor.flush()
+        log.info("Streamed snapshot/delta", watermark=watermark)
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Content-Encoding': 'deflate'})
+
+def bootstrap_from(node_url):
+    """
+    Copy another node's dataset into this node before serving traffic,
+    retrying with backoff if the stream fails or ends incomplete
+    """
+    delay = 1.0
+    for attempt in range(1, BOOTSTRAP_ATTEMPTS + 1):
+        try:
+            return _bootstrap_once(node_url)
+        except (requests.RequestException, ValueError) as e:
+            if attempt == BOOTSTRAP_ATTEMPTS:
+                raise
+            log.warning("Bootstrap failed, retrying", source=node_url, attempt=attempt,
+                        delay=delay, error=str(e))
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+def _bootstrap_once(node_url):
+    records = 0
+    watermark = ''
+    with requests.get(f"{node_url}/snapshot", stream=True, timeout=30) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            batch = http_codec.loads(line)
+            store.apply_batch(*snapshot.batch_from_dicts(batch['secrets'], batch['access']),
+                              tombstones=batch.get('tombstones'))
+            records += len(batch['secrets']) + len(batch['access'])
+            watermark = batch['watermark']
+            if batch.get('last'):
+                log.info("Bootstrapped", records=records, source=node_url, watermark=watermark)
+                return watermark
+    raise ValueError("Snapshot stream ended before its last batch")
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    persistence.restore(store)
+    if BOOTSTRAP_FROM:
+        bootstrap_from(BOOTSTRAP_FROM)
+    # No reloader: it would run the restore and bootstrap above a second time
+    app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False)
\ No newline at end of file
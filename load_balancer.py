@@ -0,0 +1,280 @@
+# load_balancer.py
+# Client-side load balancing across the upstream replicas of a service
+#
+# Each call goes to the better of two randomly chosen healthy endpoints
+# (power of two choices), scored by outstanding requests times the
+# endpoint's latency EWMA. An endpoint is ejected for a while after
+# LB_EJECT_FAILURES consecutive connection failures, or when its latency
+# EWMA exceeds LB_EJECT_LATENCY_FACTOR times the median of its peers.
+# Ejection time doubles on each repeat, and at most LB_MAX_EJECT_PERCENT of
+# the endpoints are ejected at once.
+#
+# Idempotent reads can be hedged: if the first endpoint hasn't answered
+# within the method's recent p95 latency, the request is also sent to a
+# second endpoint and the first answer wins. Hedges are limited to
+# LB_HEDGE_MAX_PERCENT of calls so a slow cluster isn't hit with twice
+# the load.
+import collections
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+
+import grpc
+
+import channels
+import logs
+
+LB_EWMA_ALPHA = float(os.environ.get("LB_EWMA_ALPHA", "0.3"))
+LB_EJECT_FAILURES = int(os.environ.get("LB_EJECT_FAILURES", "5"))
+LB_EJECT_LATENCY_FACTOR = float(os.environ.get("LB_EJECT_LATENCY_FACTOR", "3"))
+LB_EJECT_MIN_LATENCY = float(os.environ.get("LB_EJECT_MIN_LATENCY", "0.05"))
+LB_EJECT_TIME = float(os.environ.get("LB_EJECT_TIME", "10"))
+LB_EJECT_MAX_TIME = float(os.environ.get("LB_EJECT_MAX_TIME", "300"))
+LB_MAX_EJECT_PERCENT = int(os.environ.get("LB_MAX_EJECT_PERCENT", "50"))
+LB_HEDGE_MAX_PERCENT = float(os.environ.get("LB_HEDGE_MAX_PERCENT", "10"))
+LB_HEDGE_MIN_DELAY = float(os.environ.get("LB_HEDGE_MIN_DELAY", "0.005"))
+# Hedge delay used until a method has enough latency samples for a p95
+LB_HEDGE_DEFAULT_DELAY = float(os.environ.get("LB_HEDGE_DEFAULT_DELAY", "0.05"))
+
+# Calls an endpoint must complete before its latency can mark it an outlier
+_MIN_SAMPLES = 10
+# Per-method latency window for the hedge delay, and how often it's recomputed
+_HEDGE_WINDOW = 1000
+_HEDGE_RECOMPUTE_EVERY = 50
+# Unused hedge allowance carried over between calls
+_HEDGE_MAX_TOKENS = 10
+
+# Errors that count against an endpoint and let the call move to another
+# one. Application errors (NOT_FOUND, PERMISSION_DENIED, ...) mean the
+# endpoint is healthy and are returned as-is. DEADLINE_EXCEEDED is not
+# retried either: with propagated deadlines it means the caller's time is
+# up, and it only feeds the endpoint's latency.
+FAILOVER_CODES = (grpc.StatusCode.UNAVAILABLE,)
+
+def parse_addrs(spec):
+    """Split "host1:port,host2:port" into a list of addresses"""
+    return [addr.strip() for addr in spec.split(',') if addr.strip()]
+
+class Endpoint:
+    """Load and health of one upstream address"""
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.outstanding = 0
+        self.latency = None     # EWMA of call latency, seconds
+        self.samples = 0
+        self.failures = 0       # consecutive
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def score(self):
+        # Expected wait behind the calls already in flight. Endpoints without
+        # a measurement yet score 0 so they get probed.
+        return (self.outstanding + 1) * (self.latency or 0.0)
+
+class LoadBalancer:
+    def __init__(self, addrs, name="LoadBalancer"):
+        self.name = name
+        self.log = logs.get_logger(name)
+        self.endpoints = {addr: Endpoint(addr) for addr in addrs}
+        self._lock = threading.Lock()
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=_HEDGE_WINDOW))
+        self._sample_counts = collections.Counter()
+        self._hedge_delays = {}
+        self._hedge_tokens = _HEDGE_MAX_TOKENS
+
+    @property
+    def addrs(self):
+        return list(self.endpoints)
+
+    def _candidates(self, candidates):
+        candidates = list(dict.fromkeys(candidates or self.endpoints))
+        with self._lock:
+            for addr in candidates:
+                self.endpoints.setdefault(addr, Endpoint(addr))
+        return candidates
+
+    def _pick(self, candidates, tried):
+        now = time.monotonic()
+        pool = [self.endpoints[addr] for addr in candidates if addr not in tried]
+        # If every candidate is ejected, use them anyway rather than fail
+        healthy = [e for e in pool if e.ejected_until <= now] or pool
+        choices = random.sample(healthy, 2) if len(healthy) > 2 else healthy
+        return min(choices, key=Endpoint.score)
+
+    def call(self, stub_class, method, request, timeout, candidates=None):
+        """
+        Invoke method on the best endpoint among candidates (default: all)
+        within timeout seconds in total, moving on to another endpoint if
+        one is unreachable. Raises the last grpc.RpcError if none answered.
+        """
+        candidates = self._candidates(candidates)
+        deadline = time.monotonic() + timeout
+        tried = set()
+        while True:
+            endpoint = self._pick(candidates, tried)
+            tried.add(endpoint.addr)
+            try:
+                return self._invoke(endpoint, stub_class, method, request, deadline)
+            except grpc.RpcError as e:
+                if (e.code() not in FAILOVER_CODES or len(tried) == len(candidates)
+                        or time.monotonic() >= deadline):
+                    raise
+                self.log.warning("Call failed, trying another endpoint", method=method, endpoint=endpoint.addr,
+                                 code=e.code().name)
+
+    def _invoke(self, endpoint, stub_class, method, request, deadline):
+        with self._lock:
+            endpoint.outstanding += 1
+        start = time.monotonic()
+        code = grpc.StatusCode.OK
+        try:
+            stub = stub_class(channels.get_channel(endpoint.addr))
+            return getattr(stub, method)(request, timeout=max(deadline - start, 0))
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        finally:
+            self._record(endpoint, method, time.monotonic() - start, code)
+
+    def hedged_call(self, stub_class, method, request, timeout, candidates=None):
+        """
+        Like call(), for idempotent methods only: if the first endpoint
+        hasn't answered within the method's p95 latency, send the request
+        to a second endpoint as well and return whichever answers first.
+        """
+        candidates = self._candidates(candidates)
+        if len(candidates) < 2:
+            return self.call(stub_class, method, request, timeout, candidates)
+
+        deadline = time.monotonic() + timeout
+        outcomes = queue.Queue()
+        calls, tried = [], set()
+
+        def launch():
+            endpoint = self._pick(candidates, tried)
+            tried.add(endpoint.addr)
+            calls.append(self._start(endpoint, stub_class, method, request, deadline, outcomes))
+            return endpoint
+
+        first = launch()
+        hedge_at = time.monotonic() + self._hedge_delay(method)
+        hedged = False
+        try:
+            while True:
+                # Once there is nothing left to hedge, block: every call
+                # launched has a deadline, so an outcome always arrives
+                wait = None if hedged or len(tried) == len(candidates) else max(hedge_at - time.monotonic(), 0)
+                try:
+                    endpoint, response, error = outcomes.get(timeout=wait)
+                except queue.Empty:
+                    hedged = True
+                    if self._take_hedge_token():
+                        second = launch()
+                        self.log.sampled("lb.hedged", "Hedged call", method=method, slow=first.addr, hedge=second.addr)
+                    continue
+                if error is None:
+                    return response
+                if error.code() not in FAILOVER_CODES:
+                    raise error
+                if not all(call.done() for call in calls):
+                    continue  # the other half of the hedge may still answer
+                if len(tried) == len(candidates) or time.monotonic() >= deadline:
+                    raise error
+                self.log.warning("Call failed, trying another endpoint", method=method, endpoint=endpoint.addr,
+                                 code=error.code().name)
+                first = launch()
+                hedge_at = time.monotonic() + self._hedge_delay(method)
+        finally:
+            # The loser of a hedge is no longer needed
+            for call in calls:
+                call.cancel()
+
+    def _start(self, endpoint, stub_class, method, request, deadline, outcomes):
+        """Start an asynchronous call; its outcome is put on outcomes when done"""
+        with self._lock:
+            endpoint.outstanding += 1
+        start = time.monotonic()
+        stub = stub_class(channels.get_channel(endpoint.addr))
+        future = getattr(stub, method).future(request, timeout=max(deadline - start, 0))
+
+        def done(future):
+            if future.cancelled():
+                self._record(endpoint, method, 0, grpc.StatusCode.CANCELLED)
+                return
+            code = future.code()
+            self._record(endpoint, method, time.monotonic() - start, code)
+            if code == grpc.StatusCode.OK:
+                outcomes.put((endpoint, future.result(), None))
+            else:
+                outcomes.put((endpoint, None, future.exception()))
+
+        future.add_done_callback(done)
+        return future
+
+    def _hedge_delay(self, method):
+        with self._lock:
+            return self._hedge_delays.get(method, LB_HEDGE_DEFAULT_DELAY)
+
+    def _take_hedge_token(self):
+        with self._lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    def _record(self, endpoint, method, latency, code):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if code == grpc.StatusCode.CANCELLED:
+                return  # the losing half of a hedge; says nothing about the endpoint
+            if code in FAILOVER_CODES:
+                endpoint.failures += 1
+                if endpoint.failures >= LB_EJECT_FAILURES:
+                    self._eject(endpoint, f"{endpoint.failures} consecutive failures")
+                return
+
+            # Every answered call (and timeouts, as a lower bound) is a latency sample
+            self._hedge_tokens = min(self._hedge_tokens + LB_HEDGE_MAX_PERCENT / 100, _HEDGE_MAX_TOKENS)
+            samples = self._latencies[method]
+            samples.append(latency)
+            self._sample_counts[method] += 1
+            if self._sample_counts[method] % _HEDGE_RECOMPUTE_EVERY == 0:
+                p95 = statistics.quantiles(samples, n=20)[-1]
+                self._hedge_delays[method] = max(p95, LB_HEDGE_MIN_DELAY)
+
+            endpoint.failures = 0
+            endpoint.samples += 1
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += LB_EWMA_ALPHA * (latency - endpoint.latency)
+            if self._is_latency_outlier(endpoint):
+                self._eject(endpoint, f"latency {endpoint.latency * 1000:.1f}ms")
+
+    def _is_latency_outlier(self, endpoint):
+        # Caller holds self._lock
+        if endpoint.samples < _MIN_SAMPLES or endpoint.latency < LB_EJECT_MIN_LATENCY:
+            return False
+        now = time.monotonic()
+        peers = [e.latency for e in self.endpoints.values()
+                 if e is not endpoint and e.latency is not None and e.ejected_until <= now]
+        return bool(peers) and endpoint.latency > LB_EJECT_LATENCY_FACTOR * statistics.median(peers)
+
+    def _eject(self, endpoint, reason):
+        # Caller holds self._lock
+        now = time.monotonic()
+        ejected = sum(1 for e in self.endpoints.values() if e.ejected_until > now)
+        if (ejected + 1) * 100 > LB_MAX_EJECT_PERCENT * len(self.endpoints):
+            return
+        duration = min(LB_EJECT_TIME * 2 ** endpoint.ejections, LB_EJECT_MAX_TIME)
+        endpoint.ejections += 1
+        endpoint.ejected_until = now + duration
+        # Start over when it comes back, so it gets probed again
+        endpoint.failures = 0
+        endpoint.samples = 0
+        endpoint.latency = None
+        self.log.warning("Ejected endpoint", endpoint=endpoint.addr, seconds=round(duration), reason=reason)
@@ -0,0 +1,182 @@
+# logs.py
+# Structured, asynchronous logging for the services
+#
+# Request handlers hand log records to a bounded in-memory queue and move
+# on; a background thread formats them (JSON lines by default) and writes
+# them to stdout. A handler never waits on stdout or on a slow container
+# log pipe: if the writer falls behind and the queue fills, records are
+# dropped and the number dropped is logged once there is room again.
+#
+# Events that happen on every request (a secret retrieved, a write
+# replicated, a call routed) are logged with sampled(), which keeps only a
+# configurable fraction of them: LOG_SAMPLE_RATE for all such events, or
+# per event with LOG_SAMPLE_RATES="secret.retrieved=0.01,gateway.routed=0".
+# Sampled records carry their sample_rate, so counts can be scaled back up.
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text" ("[Service] message key=value")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Fraction of sampled (hot-path) events logged, unless LOG_SAMPLE_RATES says otherwise
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+# Records waiting to be written; beyond this they are dropped
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+_ROOT = "vault"
+# Functions returning extra fields for every record (e.g. the current trace)
+_context_providers = []
+
+def parse_sample_rates(spec):
+    """Parse "event=rate,..." into {event: rate}"""
+    rates = {}
+    for entry in spec.split(','):
+        if entry.strip():
+            event, rate = entry.split('=', 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+_sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+
+def add_context(provider):
+    """Call provider() for every record and add the fields it returns"""
+    _context_providers.append(provider)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name[len(_ROOT) + 1:],
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"[{record.name[len(_ROOT) + 1:]}] {record.getMessage()}"
+        fields = getattr(record, 'fields', {})
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.levelno >= logging.WARNING:
+            line = f"{record.levelname}: {line}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without ever blocking the caller"""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread; only freeze what the
+        # caller might still change
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            notice = logging.makeLogRecord({
+                'name': f"{_ROOT}.Logging", 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Dropped {dropped} log records, writer fell behind",
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                self.dropped += dropped
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full at exit; wait for room rather than fail
+        self.queue.put(self._sentinel, timeout=5)
+
+def _configure():
+    records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    listener = _QueueListener(records, stream)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger(_ROOT)
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_QueueHandler(records))
+    root.propagate = False
+
+_configure()
+
+class Logger:
+    """Structured logger: log.info("Added secret", secret_id=..., user_id=...)"""
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = logging.getLogger(f"{_ROOT}.{name}")
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        for provider in _context_providers:
+            fields.update(provider())
+        self._logger.log(level, msg, extra={'fields': fields}, exc_info=exc_info)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg, **fields):
+        """An error with the traceback of the exception being handled"""
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+    def sampled(self, event, msg, **fields):
+        """An INFO event on a hot path, logged at its sample rate"""
+        rate = _sample_rates.get(event, LOG_SAMPLE_RATE)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return
+        fields['event'] = event
+        if rate < 1:
+            fields['sample_rate'] = rate
+        self._log(logging.INFO, msg, fields)
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+def get_logger(name):
+    """The logger for a service or component, by the name it logs under"""
+    logger = _loggers.get(name)
+    if logger is None:
+        with _loggers_lock:
+            logger = _loggers.setdefault(name, Logger(name))
+    return logger
@@ -0,0 +1,214 @@
+# memory_store.py
+# In-memory versioned store for secrets and access control lists
+#
+# Used by http_server and data_service, which keep their data in process
+# memory. Mutations are applied last-writer-wins by hybrid logical clock
+# version (see hlc.py), mirroring the Redis-backed functions in shared_data.
+# With persistence.restore() attached, changes are also written ahead to disk.
+# Records are never modified in place once stored, only replaced by a changed
+# copy, so a shallow copy of the tables is a consistent snapshot.
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import hlc
+import snapshot
+from records import Access, to_dict
+
+TOMBSTONE_TTL = int(os.environ.get("TOMBSTONE_TTL", str(7 * 24 * 3600)))
+
+_NONE = frozenset()
+
+def _index(index, user_id, secret_id):
+    index.setdefault(user_id, set()).add(secret_id)
+
+def _unindex(index, user_id, secret_id):
+    secret_ids = index.get(user_id)
+    if secret_ids is not None:
+        secret_ids.discard(secret_id)
+        if not secret_ids:
+            del index[user_id]
+
+class MemoryStore:
+    def __init__(self):
+        # { secret_id: records.Secret }
+        self.secrets = {}
+        # { secret_id: records.Access }
+        self.access = {}
+        # Reverse indexes { user_id: {secret_id, ...} } of the secrets each
+        # user owns and of those shared with them, so listing a user's
+        # secrets is O(k) in what they can see rather than a scan of the store
+        self.owned = {}
+        self.shared = {}
+        # { secret_id: deletion version }, oldest first so expiry is cheap
+        self.tombstones = OrderedDict()
+        self.changelog = snapshot.ChangeLog()
+        self.lock = threading.RLock()
+        # persistence.Journal, if the store is persisted
+        self.journal = None
+
+    @contextmanager
+    def _writing(self):
+        """Hold the lock for a write, then wait until what it logged, if anything, is on disk"""
+        with self.lock:
+            before = self.journal.written if self.journal is not None else 0
+            yield
+            if self.journal is None or self.journal.written == before:
+                return
+            logged = self.journal.written
+            self.journal.maybe_snapshot()
+        self.journal.sync(logged)
+
+    def _changed(self, kind, secret_id):
+        """Record a changed key in the changelog and, if persisted, its new state in the log"""
+        self.changelog.record(kind, secret_id)
+        if self.journal is not None:
+            table = self.secrets if kind == 'secret' else self.access
+            self.journal.write(kind, secret_id, to_dict(table.get(secret_id)))
+
+    def _deleted_at(self, secret_id):
+        return self.tombstones.get(secret_id, '')
+
+    def get_secret_versioned(self, secret_id):
+        """Return (version, secret); secret is None if missing or deleted"""
+        with self.lock:
+            secret = self.secrets.get(secret_id)
+            if secret:
+                return secret.version, secret
+            return self._deleted_at(secret_id), None
+
+    def put_secret(self, secret_id, record):
+        """Store a Secret unless a newer version or deletion is held. Returns True if stored."""
+        with self._writing():
+            current = self.secrets.get(secret_id)
+            latest = max(current.version if current else '', self._deleted_at(secret_id))
+            if not hlc.is_newer(record.version, latest):
+                return False
+            self._set_secret(secret_id, current, record)
+            self._changed('secret', secret_id)
+            return True
+
+    def _set_secret(self, secret_id, current, record):
+        if current is not None and current.user_id != record.user_id:
+            _unindex(self.owned, current.user_id, secret_id)
+        self.secrets[secret_id] = record
+        _index(self.owned, record.user_id, secret_id)
+
+    def _drop_secret(self, secret_id):
+        secret = self.secrets.pop(secret_id, None)
+        if secret is not None:
+            _unindex(self.owned, secret.user_id, secret_id)
+
+    def _set_access(self, secret_id, record):
+        current = self.access.get(secret_id)
+        for user_id in (current.shared_with - record.shared_with) if current else ():
+            _unindex(self.shared, user_id, secret_id)
+        self.access[secret_id] = record
+        for user_id in record.shared_with:
+            _index(self.shared, user_id, secret_id)
+
+    def _drop_access(self, secret_id):
+        access = self.access.pop(secret_id, None)
+        for user_id in access.shared_with if access else ():
+            _unindex(self.shared, user_id, secret_id)
+
+    def delete_secret(self, secret_id, version):
+        """Delete a secret and its ACL as of version, leaving a tombstone. Returns True if applied."""
+        with self._writing():
+            if not self._delete(secret_id, version):
+                return False
+            self._expire_tombstones()
+            return True
+
+    def _delete(self, secret_id, version):
+        if not hlc.is_newer(version, self._deleted_at(secret_id)):
+            return False
+        secret = self.secrets.get(secret_id)
+        if secret and not hlc.is_newer(secret.version, version):
+            self._drop_secret(secret_id)
+            self._changed('secret', secret_id)
+        access = self.access.get(secret_id)
+        if access and not hlc.is_newer(access.version, version):
+            self._drop_access(secret_id)
+            self._changed('access', secret_id)
+        self._set_tombstone(secret_id, version)
+        return True
+
+    def _set_tombstone(self, secret_id, version):
+        self.tombstones[secret_id] = version
+        self.tombstones.move_to_end(secret_id)
+        if self.journal is not None:
+            self.journal.write('tombstone', secret_id, version)
+
+    def _expire_tombstones(self):
+        cutoff = hlc.physical_ms(hlc.clock.now()) - TOMBSTONE_TTL * 1000
+        while self.tombstones:
+            secret_id, version = next(iter(self.tombstones.items()))
+            if hlc.physical_ms(version) >= cutoff:
+                break
+            del self.tombstones[secret_id]
+
+    def merge_share(self, secret_id, owner_id, target_user_id, version):
+        """Grant target_user_id access unless the secret was deleted after version"""
+        with self._writing():
+            if not hlc.is_newer(version, self._deleted_at(secret_id)):
+                return False
+            current = self.access.get(secret_id)
+            access = current.copy() if current else Access(owner_id)
+            changed = access.grant(target_user_id)
+            if changed:
+                _index(self.shared, target_user_id, secret_id)
+            if hlc.is_newer(version, access.version):
+                access.version = version
+            self.access[secret_id] = access
+            self._changed('access', secret_id)
+            return changed
+
+    def apply_batch(self, secrets, access, tombstones=None):
+        """
+        Merge a snapshot or delta batch of records and {secret_id: deletion
+        version} tombstones, last-writer-wins like the writes above: secrets
+        older than what is held are ignored, ACLs are merged as unions, and
+        a deletion (None) only takes effect through its tombstone.
+        """
+        with self._writing():
+            for secret_id, version in (tombstones or {}).items():
+                self._delete(secret_id, version)
+            for secret_id, record in secrets.items():
+                current = self.secrets.get(secret_id)
+                latest = max(current.version if current else '', self._deleted_at(secret_id))
+                if record is not None and (not latest or hlc.is_newer(record.version, latest)):
+                    self._set_secret(secret_id, current, record)
+                    self._changed('secret', secret_id)
+            for secret_id, record in access.items():
+                deleted_at = self._deleted_at(secret_id)
+                if record is None or (deleted_at and not hlc.is_newer(record.version, deleted_at)):
+                    continue
+                current = self.access.get(secret_id)
+                if current is None:
+                    self._set_access(secret_id, record)
+                else:
+                    merged = current.copy()
+                    for user_id in record.shared_with:
+                        if merged.grant(user_id):
+                            _index(self.shared, user_id, secret_id)
+                    merged.groups |= record.groups
+                    if hlc.is_newer(record.version, merged.version):
+                        merged.version = record.version
+                    self.access[secret_id] = merged
+                self._changed('access', secret_id)
+
+    def secrets_for_user(self, user_id):
+        """[(secret_id, secret, is_shared)] for the secrets user_id owns or that are shared with them"""
+        with self.lock:
+            result = []
+            for secret_id in self.owned.get(user_id, _NONE) | self.shared.get(user_id, _NONE):
+                secret = self.secrets.get(secret_id)
+                if secret is None:
+                    continue
+                access = self.access.get(secret_id)
+                is_shared = access is not None and user_id in access.shared_with
+                if secret.user_id == user_id or is_shared:
+                    result.append((secret_id, secret, is_shared))
+            return result
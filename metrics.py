@@ -0,0 +1,246 @@
+# metrics.py
+# Prometheus metrics shared by all services
+#
+# gRPC servers record every call through ServerInterceptor (calls by status
+# code, latency, calls in flight), http_server.py records its routes through
+# Flask hooks, shared_data's Redis client times each command, and the
+# hinted-handoff log reports per-peer queue depth, lag, send latency and
+# failures, and the in-memory stores' write-ahead log its fsync time and
+# batch size. The gateway's response caches count hits, misses and
+# invalidations, singleflight groups how many calls ran or were coalesced,
+# and admission control the calls it rejected.
+#
+# Each process serves its metrics at :METRICS_PORT/metrics; http_server.py
+# serves them at /metrics on its own port instead. A prefork worker N uses
+# METRICS_PORT + N, since a scrape of a port the workers share would reach
+# whichever worker the kernel picked.
+import os
+import threading
+import time
+
+import grpc
+import redis
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+
+import logs
+import prefork
+
+# Port the gRPC services serve /metrics on (0 = don't serve)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+# Seconds to keep retrying a metrics port that is in use
+_METRICS_BIND_ATTEMPTS = 60
+
+# Seconds, from in-process calls and Redis commands up to RPC timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+RPC_REQUESTS = Counter('vault_rpc_requests', "gRPC calls handled, by status code",
+                       ['service', 'method', 'code'])
+RPC_LATENCY = Histogram('vault_rpc_latency_seconds', "gRPC call handling time",
+                        ['service', 'method'], buckets=LATENCY_BUCKETS)
+RPC_IN_FLIGHT = Gauge('vault_rpc_in_flight', "gRPC calls being handled", ['service', 'method'])
+
+HTTP_REQUESTS = Counter('vault_http_requests', "HTTP requests handled, by status",
+                        ['route', 'method', 'status'])
+HTTP_LATENCY = Histogram('vault_http_latency_seconds', "HTTP request handling time",
+                         ['route', 'method'], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge('vault_http_in_flight', "HTTP requests being handled", ['route', 'method'])
+
+REDIS_LATENCY = Histogram('vault_redis_latency_seconds', "Redis round trip, per command or pipeline",
+                          ['command'], buckets=LATENCY_BUCKETS)
+
+REPLICATION_SENDS = Counter('vault_replication_sends', "Mutations sent to peer Replication Services",
+                            ['peer', 'kind', 'outcome'])
+REPLICATION_LATENCY = Histogram('vault_replication_send_seconds', "Time to deliver a mutation to a peer",
+                                ['peer'], buckets=LATENCY_BUCKETS)
+
+WAL_FSYNC_LATENCY = Histogram('vault_wal_fsync_seconds', "Write-ahead log fsync time",
+                              buckets=LATENCY_BUCKETS)
+WAL_FSYNC_BATCH = Histogram('vault_wal_fsync_entries', "Log entries made durable by one fsync (group commit)",
+                            buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+
+CACHE_LOOKUPS = Counter('vault_cache_lookups', "Response cache lookups, by result (hit or miss)",
+                        ['cache', 'result'])
+CACHE_INVALIDATIONS = Counter('vault_cache_invalidations', "Response cache entries dropped by writes",
+                              ['cache'])
+
+SINGLEFLIGHT_CALLS = Counter('vault_singleflight_calls',
+                             "Calls through a singleflight group, by outcome (executed or coalesced)",
+                             ['group', 'outcome'])
+
+ADMISSION_REJECTED = Counter('vault_admission_rejected', "Calls rejected by admission control, by limit hit",
+                             ['server', 'method', 'limit'])
+
+def serve(name):
+    """Serve this process's metrics over HTTP (in a background thread)"""
+    if not METRICS_PORT:
+        return
+    port = METRICS_PORT + int(prefork.WORKER_ID or 0)
+    try:
+        start_http_server(port)
+    except OSError as e:
+        # e.g. a worker being replaced hasn't released it yet; keep trying
+        logs.get_logger(name).warning("Metrics port unavailable, retrying", port=port, error=str(e))
+        threading.Thread(target=_retry_serve, args=(name, port), daemon=True).start()
+        return
+    logs.get_logger(name).info("Metrics served at /metrics", port=port)
+
+def _retry_serve(name, port):
+    for _ in range(_METRICS_BIND_ATTEMPTS):
+        time.sleep(1)
+        try:
+            start_http_server(port)
+        except OSError:
+            continue
+        logs.get_logger(name).info("Metrics served at /metrics", port=port)
+        return
+    logs.get_logger(name).warning("Metrics not served, port unavailable", port=port)
+
+# --- gRPC ---
+
+def _status(context, failed):
+    code = context.code()
+    if code is None:
+        return 'UNKNOWN' if failed else 'OK'
+    return code.name
+
+class ServerInterceptor(grpc.ServerInterceptor):
+    """Counts and times the unary and server-streaming calls of a gRPC server"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return handler
+        # "/vault.SecretManagementService/AddSecret"
+        service, _, method = handler_call_details.method.lstrip('/').partition('/')
+        service = service.rsplit('.', 1)[-1]
+        in_flight = RPC_IN_FLIGHT.labels(service, method)
+        latency = RPC_LATENCY.labels(service, method)
+
+        def finish(context, start, failed):
+            in_flight.dec()
+            latency.observe(time.perf_counter() - start)
+            RPC_REQUESTS.labels(service, method, _status(context, failed)).inc()
+
+        if handler.unary_unary is not None:
+            behavior = handler.unary_unary
+
+            def observe(request, context):
+                in_flight.inc()
+                start, failed = time.perf_counter(), True
+                try:
+                    response = behavior(request, context)
+                    failed = False
+                    return response
+                finally:
+                    finish(context, start, failed)
+
+            return grpc.unary_unary_rpc_method_handler(
+                observe,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
+        if handler.unary_stream is not None:
+            behavior = handler.unary_stream
+
+            def observe_stream(request, context):
+                # Timed until the last message is sent
+                in_flight.inc()
+                start, failed = time.perf_counter(), True
+                try:
+                    yield from behavior(request, context)
+                    failed = False
+                finally:
+                    finish(context, start, failed)
+
+            return grpc.unary_stream_rpc_method_handler(
+                observe_stream,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+        return handler
+
+# --- HTTP (Flask) ---
+
+def instrument_flask(app):
+    """Record every request to a Flask app, and serve the metrics at /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request():
+        g.metrics_labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method)
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.labels(*g.metrics_labels).inc()
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        labels = g.pop('metrics_labels', None)
+        if labels is None:
+            return
+        HTTP_IN_FLIGHT.labels(*labels).dec()
+        HTTP_LATENCY.labels(*labels).observe(time.perf_counter() - g.pop('metrics_start'))
+        HTTP_REQUESTS.labels(*labels, str(g.pop('metrics_status', 500))).inc()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+# --- Redis ---
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that times each command, and each pipeline/transaction as one round trip"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(str(args[0]).upper()).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def timed_execute(raise_on_error=True):
+            start = time.perf_counter()
+            try:
+                return execute(raise_on_error)
+            finally:
+                REDIS_LATENCY.labels('MULTI' if pipe.transaction else 'PIPELINE').observe(
+                    time.perf_counter() - start)
+
+        pipe.execute = timed_execute
+        return pipe
+
+# --- Replication ---
+
+class _ReplicationLogCollector:
+    """Per-peer backlog of a ReplicationLog, read at scrape time"""
+
+    def __init__(self, log):
+        self.log = log
+        self._peers = set()     # so drained peers report 0 rather than vanishing
+
+    def collect(self):
+        depth = GaugeMetricFamily('vault_replication_queue_depth',
+                                  "Mutations waiting in the hinted-handoff log", labels=['peer'])
+        lag = GaugeMetricFamily('vault_replication_lag_seconds',
+                                "Age of the oldest mutation not yet delivered to the peer", labels=['peer'])
+        backlog = self.log.backlog()
+        self._peers.update(backlog)
+        now = time.time()
+        for peer in sorted(self._peers):
+            count, oldest = backlog.get(peer, (0, None))
+            depth.add_metric([peer], count)
+            lag.add_metric([peer], max(now - oldest, 0.0) if oldest else 0.0)
+        yield depth
+        yield lag
+
+def register_replication_log(log):
+    REGISTRY.register(_ReplicationLogCollector(log))
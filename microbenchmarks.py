@@ -0,0 +1,346 @@
+# microbenchmarks.py
+# In-process benchmarks of the storage, crypto and serialization hot paths
+#
+# Where performance_test.py measures whole requests, these time one
+# component at a time, so a slowdown can be traced to its cause: PBKDF2 key
+# derivation and AES-GCM in CryptoUtils, JSON encoding of secret records,
+# protobuf (de)serialization of SecretMetadata, the Redis round trip, and
+# the shared_data functions built on it. Redis is a local server (a
+# dedicated db, MICROBENCH_REDIS_DB) or an in-memory fakeredis.
+#
+# Each benchmark is calibrated to run enough loops per sample to be timed
+# reliably, warmed up, then sampled several times (as pyperf does); the
+# median time per call is what's compared. Results can be saved as a
+# baseline, and later runs compared against it: anything slower than the
+# baseline by more than --threshold is flagged as a regression, and the
+# exit status is 1 so CI can fail on it.
+#
+# Examples:
+#   python microbenchmarks.py --save-baseline
+#   python microbenchmarks.py --check --threshold 0.15
+#   python microbenchmarks.py --redis fake -k protobuf -k json
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import redis
+
+import hlc
+import http_codec
+import records
+import shared_data
+import vault_pb2
+from crypto_utils import CryptoUtils
+from records import Access, Secret
+
+RESULTS_DIR = os.environ.get("BENCH_RESULTS_DIR", "benchmark_results")
+BASELINE_PATH = os.environ.get("MICROBENCH_BASELINE", os.path.join(RESULTS_DIR, "microbench_baseline.json"))
+# Redis database the benchmarks write to, so they don't touch the vault's data
+MICROBENCH_REDIS_DB = int(os.environ.get("MICROBENCH_REDIS_DB", "15"))
+
+KEY_PREFIX = "microbench-"
+
+BENCHMARKS = []     # (name, setup); setup(env) returns the function to time
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+class Environment:
+    """What the benchmarks run against"""
+
+    def __init__(self, redis_client, payload_size):
+        self.redis = redis_client
+        self.crypto = CryptoUtils("microbench-password")
+        self.plaintext = os.urandom(payload_size // 2).hex()
+        self.encrypted = self.crypto.encrypt(self.plaintext)
+        now = records.now()
+        self.secret = Secret("user-1", "Benchmark secret", self.encrypted, now, now, hlc.clock.now())
+
+    def listing_entry(self, i=0):
+        return {
+            'secret_id': f"{KEY_PREFIX}{i:06d}",
+            'secret_name': self.secret.secret_name,
+            'created_at': records.to_iso(self.secret.created_at),
+            'updated_at': records.to_iso(self.secret.updated_at),
+            'is_shared': i % 2 == 1,
+        }
+
+    def metadata(self, i=0):
+        return vault_pb2.SecretMetadata(
+            secret_id=f"{KEY_PREFIX}{i:06d}",
+            secret_name=self.secret.secret_name,
+            created_at=records.to_iso(self.secret.created_at),
+            updated_at=records.to_iso(self.secret.updated_at),
+            is_shared=i % 2 == 1
+        )
+
+# --- Crypto ---
+
+@benchmark("crypto.pbkdf2")
+def _pbkdf2(env):
+    return lambda: CryptoUtils("microbench-password")
+
+@benchmark("crypto.encrypt")
+def _encrypt(env):
+    return lambda: env.crypto.encrypt(env.plaintext)
+
+@benchmark("crypto.decrypt")
+def _decrypt(env):
+    return lambda: env.crypto.decrypt(env.encrypted)
+
+# --- JSON records ---
+
+@benchmark("json.encode_secret")
+def _json_encode(env):
+    return lambda: json.dumps(env.secret.to_dict())
+
+@benchmark("json.decode_secret")
+def _json_decode(env):
+    encoded = json.dumps(env.secret.to_dict())
+    return lambda: Secret.from_dict(json.loads(encoded))
+
+@benchmark("records.access_check_1000")
+def _access_check(env):
+    # Membership test against a secret shared with 1000 users
+    access = Access("user-1", (f"user-{i}" for i in range(1000)))
+    return lambda: "user-999" in access.shared_with
+
+@benchmark("json.encode_list_100")
+def _json_encode_list(env):
+    # http_server's list_secrets response
+    listing = {'secrets': [env.listing_entry(i) for i in range(100)], 'total_count': 100}
+    return lambda: json.dumps(listing).encode('utf-8')
+
+@benchmark("http_codec.encode_list_100")
+def _codec_encode_list(env):
+    # orjson when installed, else the stdlib fallback
+    listing = {'secrets': [env.listing_entry(i) for i in range(100)], 'total_count': 100}
+    return lambda: http_codec.dumps(listing)
+
+@benchmark("http_codec.decode_list_100")
+def _codec_decode_list(env):
+    encoded = http_codec.dumps({'secrets': [env.listing_entry(i) for i in range(100)], 'total_count': 100})
+    return lambda: http_codec.loads(encoded)
+
+# --- Protobuf ---
+
+@benchmark("protobuf.metadata_serialize")
+def _metadata_serialize(env):
+    metadata = env.metadata()
+    return metadata.SerializeToString
+
+@benchmark("protobuf.metadata_parse")
+def _metadata_parse(env):
+    encoded = env.metadata().SerializeToString()
+    return lambda: vault_pb2.SecretMetadata.FromString(encoded)
+
+@benchmark("protobuf.list_build_serialize_100")
+def _list_serialize(env):
+    # What ListSecrets does per call: build the metadata, then encode
+    return lambda: vault_pb2.ListSecretsResponse(
+        secrets=[env.metadata(i) for i in range(100)], total_count=100
+    ).SerializeToString()
+
+@benchmark("protobuf.list_parse_100")
+def _list_parse(env):
+    encoded = vault_pb2.ListSecretsResponse(
+        secrets=[env.metadata(i) for i in range(100)], total_count=100
+    ).SerializeToString()
+    return lambda: vault_pb2.ListSecretsResponse.FromString(encoded)
+
+# --- Redis and shared_data ---
+
+@benchmark("redis.ping")
+def _redis_ping(env):
+    return env.redis.ping
+
+@benchmark("redis.get")
+def _redis_get(env):
+    key = f"secret:{KEY_PREFIX}get"
+    env.redis.set(key, json.dumps(env.secret.to_dict()))
+    return lambda: env.redis.get(key)
+
+@benchmark("shared_data.set_secret")
+def _set_secret(env):
+    secret_id = f"{KEY_PREFIX}set"
+    return lambda: shared_data.set_secret(secret_id, env.secret)
+
+@benchmark("shared_data.get_secret")
+def _get_secret(env):
+    secret_id = f"{KEY_PREFIX}get"
+    shared_data.set_secret(secret_id, env.secret)
+    return lambda: shared_data.get_secret(secret_id)
+
+@benchmark("shared_data.put_secret_if_newer")
+def _put_if_newer(env):
+    secret_id = f"{KEY_PREFIX}put"
+
+    def put():
+        # A new version each call, so every call writes
+        shared_data.put_secret_if_newer(secret_id, env.secret.replace(version=hlc.clock.now()))
+    return put
+
+# --- Runner ---
+
+def _time(fn, loops):
+    """Seconds for loops calls, with the garbage collector off as timeit does"""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def calibrate(fn, min_time):
+    """Loops per sample so that one sample takes at least min_time seconds"""
+    loops = 1
+    while True:
+        elapsed = _time(fn, loops)
+        if elapsed >= min_time:
+            return loops
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+def run_benchmark(fn, samples, min_time):
+    loops = calibrate(fn, min_time)
+    _time(fn, loops)    # warm-up
+    times = [_time(fn, loops) / loops * 1e6 for _ in range(samples)]
+    return {
+        'loops': loops,
+        'samples': samples,
+        'median_us': statistics.median(times),
+        'mean_us': statistics.mean(times),
+        'stdev_us': statistics.stdev(times) if samples > 1 else 0.0,
+        'min_us': min(times),
+    }
+
+def connect_redis(mode):
+    """Redis client for the benchmarks, and which kind it is"""
+    if mode in ('local', 'auto'):
+        client = redis.Redis(host=shared_data.REDIS_HOST, port=6379, db=MICROBENCH_REDIS_DB,
+                             decode_responses=True)
+        try:
+            client.ping()
+            return client, 'local'
+        except redis.exceptions.ConnectionError:
+            if mode == 'local':
+                raise
+            print(f"[Microbench] No Redis at {shared_data.REDIS_HOST}, using fakeredis")
+    import fakeredis     # optional, only for running without a Redis server
+    return fakeredis.FakeRedis(decode_responses=True), 'fake'
+
+def cleanup(client):
+    keys = list(client.scan_iter(f"*{KEY_PREFIX}*"))
+    if keys:
+        client.delete(*keys)
+
+def format_time(us):
+    if us >= 1000:
+        return f"{us / 1000:.2f} ms"
+    return f"{us:.2f} us"
+
+def run(args):
+    client, redis_mode = connect_redis(args.redis)
+    # shared_data's functions use its module-level client
+    shared_data.r = client
+    env = Environment(client, args.payload_size)
+    selected = [(name, setup) for name, setup in BENCHMARKS
+                if not args.k or any(pattern in name for pattern in args.k)]
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'redis': redis_mode,
+            'payload_size': args.payload_size,
+        },
+        'benchmarks': {}
+    }
+    print(f"{'benchmark':<36} {'median':>12} {'stdev':>8} {'loops':>8}")
+    try:
+        for name, setup in selected:
+            result = run_benchmark(setup(env), args.samples, args.min_time)
+            results['benchmarks'][name] = result
+            spread = result['stdev_us'] / result['median_us'] * 100 if result['median_us'] else 0.0
+            print(f"{name:<36} {format_time(result['median_us']):>12} {spread:>7.1f}% {result['loops']:>8}")
+    finally:
+        cleanup(client)
+    return results
+
+def check(results, baseline, threshold):
+    """Print changes against the baseline; returns the names of regressed benchmarks"""
+    if baseline['meta'].get('redis') != results['meta']['redis']:
+        print(f"\nNote: baseline used {baseline['meta'].get('redis')} Redis, "
+              f"this run {results['meta']['redis']}")
+    print(f"\n{'benchmark':<36} {'baseline':>12} {'now':>12} {'change':>9}")
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            print(f"{name:<36} {'-':>12} {format_time(result['median_us']):>12}      new")
+            continue
+        change = result['median_us'] / base['median_us'] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  improved"
+        print(f"{name:<36} {format_time(base['median_us']):>12} {format_time(result['median_us']):>12} "
+              f"{change * 100:>+8.1f}%{flag}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the vault's hot paths")
+    parser.add_argument('-k', action='append', metavar='PATTERN',
+                        help="only benchmarks whose name contains PATTERN (repeatable)")
+    parser.add_argument('--redis', choices=('auto', 'local', 'fake'), default='auto',
+                        help="local Redis at REDIS_HOST, fakeredis, or local if reachable")
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--min-time', type=float, default=0.1, help="seconds per sample, at least")
+    parser.add_argument('--payload-size', type=int, default=64, help="bytes of secret plaintext")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--check', action='store_true', help="compare against the baseline")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="slowdown of the median that counts as a regression (0.10 = 10%%)")
+    parser.add_argument('--output', help="also write the results to this file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run(args)
+
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {path}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; create one with --save-baseline")
+            return 1
+        with open(args.baseline) as f:
+            regressions = check(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}: "
+                  f"{', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
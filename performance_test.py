@@ -1,205 +1,837 @@
 # performance_test.py
+# Load-testing suite for the HTTP/REST and gRPC architectures
+#
+# Drives all five operations (add, retrieve, update/delete, list, share)
+# with a configurable read/write mix, either closed-loop (N workers issuing
+# requests back to back) or open-loop (requests started at a constant
+# arrival rate, whether or not earlier ones have finished). Each run warms up
+# first, then measures for a fixed duration against a preloaded dataset;
+# several dataset sizes can be benchmarked in one invocation. Results are
+# printed as percentile tables and written as JSON for comparing runs.
+#
+# Latencies go into HDR histograms (hdr_histogram.py) rather than sample
+# lists, and are measured from when each request was meant to start, so
+# queueing behind a slow response shows up in the tail instead of being
+# hidden by the load generator slowing down (coordinated omission). Load can
+# be spread over several processes (--processes), whose histograms are
+# merged; each run's percentile spectrum is also written in HdrHistogram's
+# .hgrm format.
+#
+# Examples:
+#   python performance_test.py --target grpc --mix read-heavy --duration 30
+#   python performance_test.py --mode open --rate 500 --dataset-sizes 1000,100000
+#   python performance_test.py --mode open --rate 2000 --processes 4
+#   python performance_test.py --compare before.json after.json
+#   python performance_test.py --plot results.json
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 import grpc
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import numpy as np
-import matplotlib.pyplot as plt
-import json
-import os
 
 # --- Import your project's gRPC and crypto files ---
 import vault_pb2
 import vault_pb2_grpc
 from crypto_utils import CryptoUtils
+from hdr_histogram import HdrHistogram
 
 # --- Configuration ---
-# General settings
-NUM_REQUESTS = 200  # Total requests to send in the workload
-CONCURRENT_USERS = 10 # Number of parallel threads to simulate users
-RESULTS_FILE = 'performance_results.json' # File to store results between runs
-
 # HTTP endpoint
-HTTP_BASE_URL = "http://localhost:5001"
+HTTP_BASE_URL = os.environ.get("BENCH_HTTP_URL", "http://localhost:5001")
 
 # gRPC endpoint
-GRPC_GATEWAY_ADDRESS = "localhost:50050"
+GRPC_GATEWAY_ADDRESS = os.environ.get("BENCH_GRPC_ADDR", "localhost:50050")
+# Compression of the benchmark's requests to the gateway (none, gzip, deflate);
+# the services' own setting is GRPC_COMPRESSION (see channels.py)
+GRPC_COMPRESSION = os.environ.get("BENCH_GRPC_COMPRESSION", "none")
+GRPC_COMPRESSIONS = {
+    'none': grpc.Compression.NoCompression,
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+}
+
+RESULTS_DIR = os.environ.get("BENCH_RESULTS_DIR", "benchmark_results")
+REQUEST_TIMEOUT = 10
+
+OPERATIONS = ('add', 'retrieve', 'update', 'delete', 'list', 'share')
+
+# Operation weights of the predefined mixes; any single operation name is
+# also a mix, as is an explicit "retrieve=80,add=20"
+MIXES = {
+    'read-heavy': {'retrieve': 85, 'list': 10, 'add': 2, 'update': 2, 'delete': 0.5, 'share': 0.5},
+    'balanced': {'retrieve': 40, 'list': 10, 'add': 20, 'update': 20, 'delete': 5, 'share': 5},
+    'write-heavy': {'retrieve': 10, 'list': 5, 'add': 40, 'update': 35, 'delete': 5, 'share': 5},
+}
+
+# Upper bounds (ms) of the latency histogram buckets in the results
+HISTOGRAM_BOUNDS_MS = [0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+# Distinct encrypted payloads sent by the benchmark, so that client-side
+# encryption isn't part of the measured time
+PAYLOAD_POOL_SIZE = 256
+
+# Seconds load processes may take to start up and build their payloads
+PROCESS_START_TIMEOUT = 120
+
+def parse_mix(spec):
+    """Parse a mix name or "op=weight,..." into {op: weight}"""
+    if spec in MIXES:
+        return dict(MIXES[spec])
+    if spec in OPERATIONS:
+        return {spec: 1}
+    weights = {}
+    for entry in spec.split(','):
+        op, _, weight = entry.partition('=')
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{op}' in mix '{spec}'")
+        weights[op] = float(weight or 1)
+    return weights
+
+def secret_id_for(index):
+    return f"bench-{index:010d}"
+
+def owner_of(index, users):
+    return f"bench-user-{index % users}"
+
+# --- Clients ---
+
+class HttpClient:
+    """The five operations against the HTTP/REST architecture"""
+    name = 'HTTP/REST'
+
+    def __init__(self, base_url=HTTP_BASE_URL):
+        self.base_url = base_url
+        self._local = threading.local()
+
+    @property
+    def _session(self):
+        # One keep-alive session per thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def available(self):
+        try:
+            requests.get(self.base_url, timeout=1)
+            return True
+        except requests.exceptions.RequestException:
+            return False
+
+    def _ok(self, response):
+        return response.status_code < 400
+
+    def add(self, user_id, secret_id, name, data):
+        return self._ok(self._session.post(f"{self.base_url}/secrets", json={
+            'secret_id': secret_id, 'user_id': user_id, 'secret_name': name, 'data': data
+        }, timeout=REQUEST_TIMEOUT))
+
+    def retrieve(self, user_id, secret_id):
+        return self._ok(self._session.get(f"{self.base_url}/secrets/{secret_id}",
+                                          params={'user_id': user_id}, timeout=REQUEST_TIMEOUT))
+
+    def update(self, user_id, secret_id, data):
+        return self._ok(self._session.put(f"{self.base_url}/secrets/{secret_id}",
+                                          json={'user_id': user_id, 'data': data}, timeout=REQUEST_TIMEOUT))
+
+    def delete(self, user_id, secret_id):
+        return self._ok(self._session.delete(f"{self.base_url}/secrets/{secret_id}",
+                                             params={'user_id': user_id}, timeout=REQUEST_TIMEOUT))
+
+    def list(self, user_id):
+        return self._ok(self._session.get(f"{self.base_url}/secrets",
+                                          params={'user_id': user_id}, timeout=REQUEST_TIMEOUT))
+
+    def share(self, owner_id, secret_id, target_user_id):
+        return self._ok(self._session.post(f"{self.base_url}/secrets/{secret_id}/share", json={
+            'owner_id': owner_id, 'target_user_id': target_user_id
+        }, timeout=REQUEST_TIMEOUT))
 
-# --- Test Functions ---
+    def close(self):
+        pass
 
-# Initialize a crypto utility for encrypting data
-crypto = CryptoUtils("benchmark-password")
+class GrpcClient:
+    """The five operations against the gRPC gateway"""
+    name = 'gRPC'
 
-def perform_http_add_secret():
-    """Performs a single HTTP POST request to add a secret."""
-    secret_value = str(uuid.uuid4())
-    payload = {
-        "secret_id": str(uuid.uuid4()),
-        "user_id": "benchmark_user",
-        "secret_name": "PerfTestSecret",
-        "data": crypto.encrypt(secret_value)
+    def __init__(self, addr=GRPC_GATEWAY_ADDRESS, compression=GRPC_COMPRESSION):
+        self.addr = addr
+        self.channel = grpc.insecure_channel(addr, compression=GRPC_COMPRESSIONS[compression])
+        self.management = vault_pb2_grpc.SecretManagementServiceStub(self.channel)
+        self.retrieval = vault_pb2_grpc.SecretRetrievalServiceStub(self.channel)
+        self.access = vault_pb2_grpc.AccessControlServiceStub(self.channel)
+
+    def available(self):
+        try:
+            grpc.channel_ready_future(self.channel).result(timeout=1)
+            return True
+        except grpc.FutureTimeoutError:
+            return False
+
+    def _call(self, method, request):
+        try:
+            return method(request, timeout=REQUEST_TIMEOUT).success
+        except grpc.RpcError:
+            return False
+
+    def add(self, user_id, secret_id, name, data):
+        return self._call(self.management.AddSecret, vault_pb2.AddSecretRequest(
+            user_id=user_id, secret_id=secret_id, secret_name=name, data=data))
+
+    def retrieve(self, user_id, secret_id):
+        return self._call(self.retrieval.RetrieveSecret, vault_pb2.RetrieveSecretRequest(
+            user_id=user_id, secret_id=secret_id))
+
+    def update(self, user_id, secret_id, data):
+        return self._call(self.management.UpdateSecret, vault_pb2.UpdateSecretRequest(
+            user_id=user_id, secret_id=secret_id, data=data))
+
+    def delete(self, user_id, secret_id):
+        return self._call(self.management.DeleteSecret, vault_pb2.DeleteSecretRequest(
+            user_id=user_id, secret_id=secret_id))
+
+    def list(self, user_id):
+        try:
+            self.retrieval.ListSecrets(vault_pb2.ListSecretsRequest(user_id=user_id), timeout=REQUEST_TIMEOUT)
+            return True
+        except grpc.RpcError:
+            return False
+
+    def share(self, owner_id, secret_id, target_user_id):
+        return self._call(self.access.ShareSecret, vault_pb2.ShareSecretRequest(
+            owner_id=owner_id, secret_id=secret_id, target_user_id=target_user_id))
+
+    def close(self):
+        self.channel.close()
+
+# --- Latency recording ---
+
+def _micros(seconds):
+    return int(seconds * 1_000_000)
+
+def _new_histogram():
+    # 1 us to 1 hour at 3 significant digits
+    return HdrHistogram(1, 3_600_000_000, 3)
+
+class LatencyRecorder:
+    """
+    Per-operation HDR histograms of response time (from when the request was
+    meant to start) and service time (from when it was actually sent), plus
+    completion and error counts. Memory doesn't grow with the sample count,
+    and recorders from several processes merge exactly.
+    """
+
+    def __init__(self, expected_interval=0.0):
+        self._lock = threading.Lock()
+        # Closed loop without a schedule: seconds between a worker's requests
+        # when nothing stalls; each stall is backfilled with the requests it
+        # held back (0 = no correction)
+        self.expected_interval = expected_interval
+        self.response = collections.defaultdict(_new_histogram)
+        self.service = collections.defaultdict(_new_histogram)
+        self.completed = collections.Counter()
+        self.errors = collections.Counter()
+
+    def record(self, op, ok, started, finished, intended=None):
+        if not ok:
+            with self._lock:
+                self.errors[op] += 1
+            return
+        service = _micros(finished - started)
+        response = _micros(finished - (started if intended is None else intended))
+        with self._lock:
+            self.completed[op] += 1
+            self.service[op].record(service)
+            if intended is None and self.expected_interval:
+                self.response[op].record_corrected(response, _micros(self.expected_interval))
+            else:
+                self.response[op].record(response)
+
+    def merge(self, other):
+        with self._lock:
+            for op, histogram in other.response.items():
+                self.response[op].add(histogram)
+            for op, histogram in other.service.items():
+                self.service[op].add(histogram)
+            self.completed.update(other.completed)
+            self.errors.update(other.errors)
+
+    def encode(self):
+        with self._lock:
+            return {
+                'completed': dict(self.completed),
+                'errors': dict(self.errors),
+                'response': {op: h.encode() for op, h in self.response.items()},
+                'service': {op: h.encode() for op, h in self.service.items()},
+            }
+
+    @classmethod
+    def decode(cls, encoded):
+        recorder = cls()
+        recorder.completed.update(encoded['completed'])
+        recorder.errors.update(encoded['errors'])
+        for op, h in encoded['response'].items():
+            recorder.response[op] = HdrHistogram.decode(h)
+        for op, h in encoded['service'].items():
+            recorder.service[op] = HdrHistogram.decode(h)
+        return recorder
+
+    def histograms(self):
+        """{op: (response, service)}, plus an 'all' entry merging every operation"""
+        with self._lock:
+            ops = sorted(set(self.completed) | set(self.errors))
+            result = {op: (self.response[op], self.service[op]) for op in ops}
+        merged = (_new_histogram(), _new_histogram())
+        for response, service in result.values():
+            merged[0].add(response)
+            merged[1].add(service)
+        result['all'] = merged
+        return result
+
+    def summary(self, elapsed):
+        """Per-operation stats (latencies in ms), plus an 'all' entry"""
+        with self._lock:
+            completed = dict(self.completed)
+            errors = dict(self.errors)
+        completed['all'] = sum(completed.values())
+        errors['all'] = sum(errors.values())
+        return {op: _stats(response, service, completed.get(op, 0), errors.get(op, 0), elapsed)
+                for op, (response, service) in self.histograms().items()}
+
+def _stats(response, service, completed, errors, elapsed):
+    ms = lambda micros: micros / 1000
+    histogram, below = [], 0
+    for bound in HISTOGRAM_BOUNDS_MS:
+        count = response.count_at_or_below(bound * 1000)
+        histogram.append([bound, count - below])
+        below = count
+    histogram.append([None, response.total - below])
+    return {
+        'count': completed,
+        'errors': errors,
+        'throughput': completed / elapsed if elapsed else 0.0,
+        # Response time: what a client arriving on schedule would have seen
+        'latency_ms': {
+            'mean': ms(response.mean()),
+            'p50': ms(response.value_at_percentile(50)),
+            'p90': ms(response.value_at_percentile(90)),
+            'p99': ms(response.value_at_percentile(99)),
+            'p999': ms(response.value_at_percentile(99.9)),
+            'p9999': ms(response.value_at_percentile(99.99)),
+            'max': ms(response.max),
+        },
+        # Service time: from sending the request to its response
+        'service_ms': {
+            'p50': ms(service.value_at_percentile(50)),
+            'p99': ms(service.value_at_percentile(99)),
+            'max': ms(service.max),
+        },
+        # [upper bound in ms (None = overflow), count]; counts include
+        # coordinated-omission backfill
+        'histogram': histogram,
+        # Full response time histogram, for merging runs and percentile spectra
+        'hdr': response.encode(),
     }
-    start_time = time.monotonic()
-    try:
-        response = requests.post(f"{HTTP_BASE_URL}/secrets", json=payload, timeout=10)
-        response.raise_for_status()
-        latency = time.monotonic() - start_time
-        return latency
-    except requests.exceptions.RequestException as e:
-        # Suppress errors during benchmark runs for cleaner output
-        return None
-
-def perform_grpc_add_secret(stub):
-    """Performs a single gRPC call to add a secret."""
-    secret_value = str(uuid.uuid4())
-    request = vault_pb2.AddSecretRequest(
-        user_id="benchmark_user",
-        secret_name="PerfTestSecret",
-        data=crypto.encrypt(secret_value)
-    )
-    start_time = time.monotonic()
-    try:
-        response = stub.AddSecret(request, timeout=10)
-        if not response.success:
-            return None # Failed request
-        latency = time.monotonic() - start_time
-        return latency
-    except (grpc.RpcError, Exception):
-        # Suppress errors during benchmark runs
-        return None
 
+# --- Workload ---
+
+class Workload:
+    """Picks operations by weight and builds their arguments against the dataset"""
+
+    def __init__(self, client, mix, dataset_size, users, payloads):
+        self.client = client
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.dataset_size = dataset_size
+        self.users = users
+        self.payloads = payloads
+        # Secrets added during the run; deletes remove these so the dataset
+        # itself stays intact for later runs
+        self.created = collections.deque()
+        self._local = threading.local()
 
-def run_benchmark(test_function, num_requests, num_concurrent_users):
+    @property
+    def rng(self):
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            rng = self._local.rng = random.Random()
+        return rng
+
+    def run_one(self, recorder, intended=None):
+        """
+        Send one request; intended is when it was scheduled to start, so that
+        time spent waiting for a free worker counts towards its latency
+        """
+        rng = self.rng
+        op = rng.choices(self.ops, self.weights)[0]
+        index = rng.randrange(self.dataset_size)
+        user_id, secret_id = owner_of(index, self.users), secret_id_for(index)
+        payload = rng.choice(self.payloads)
+
+        if op == 'delete':
+            try:
+                user_id, secret_id = self.created.popleft()
+            except IndexError:
+                op = 'add'  # nothing of our own to delete yet
+        if op == 'add':
+            secret_id = f"bench-run-{uuid.uuid4()}"
+
+        start = time.monotonic()
+        try:
+            if op == 'add':
+                ok = self.client.add(user_id, secret_id, "BenchSecret", payload)
+            elif op == 'retrieve':
+                ok = self.client.retrieve(user_id, secret_id)
+            elif op == 'update':
+                ok = self.client.update(user_id, secret_id, payload)
+            elif op == 'delete':
+                ok = self.client.delete(user_id, secret_id)
+            elif op == 'list':
+                ok = self.client.list(user_id)
+            else:
+                target = f"bench-user-{rng.randrange(self.users)}"
+                ok = self.client.share(user_id, secret_id, target)
+        except requests.exceptions.RequestException:
+            ok = False
+        finished = time.monotonic()
+
+        if op == 'add' and ok:
+            self.created.append((user_id, secret_id))
+        if recorder is not None:
+            recorder.record(op, ok, start, finished, intended)
+
+def make_payloads(size):
+    crypto = CryptoUtils("benchmark-password")
+    return [crypto.encrypt(os.urandom(size // 2).hex()) for _ in range(PAYLOAD_POOL_SIZE)]
+
+def load_dataset(client, start, end, users, payloads, concurrency):
+    """Add secrets start..end-1 (deterministic ids, so a larger size extends a smaller one)"""
+    if end <= start:
+        return
+    print(f"  Loading secrets {start:,}..{end - 1:,} with {concurrency} workers")
+    began = time.monotonic()
+    failed = 0
+    chunk = max((end - start) // concurrency, 1)
+
+    def load(lo, hi):
+        failures = 0
+        for index in range(lo, hi):
+            if not client.add(owner_of(index, users), secret_id_for(index), f"Secret{index}",
+                              payloads[index % len(payloads)]):
+                failures += 1
+        return failures
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        parts = [executor.submit(load, lo, min(lo + chunk, end)) for lo in range(start, end, chunk)]
+        failed = sum(part.result() for part in parts)
+    elapsed = time.monotonic() - began
+    print(f"  Loaded {end - start - failed:,} secrets in {elapsed:.1f}s "
+          f"({(end - start) / elapsed:.0f}/s, {failed} failed)")
+
+# --- Load generation ---
+
+def run_closed_loop(workload, concurrency, warmup, duration, rate=None):
+    """
+    concurrency workers, each sending its next request when the last one
+    returns. With rate, each worker keeps to a schedule of rate/concurrency
+    requests per second and latency is measured from the scheduled start, so
+    a stall is charged to every request it delayed (as wrk2 does). Without,
+    the usual gap between a worker's requests is taken from the warm-up and
+    the recorder backfills the requests each stall held back.
     """
-    Runs a benchmark for a given test function.
-    Returns avg_latency (float) and throughput (float).
+    warm = LatencyRecorder()
+    measuring = threading.Event()
+    begin = time.monotonic()
+    measure_from = begin + warmup
+    stop_at = measure_from + duration
+    interval = concurrency / rate if rate else 0.0
+
+    def worker(offset):
+        next_start = begin + offset
+        while True:
+            intended = None
+            if interval:
+                delay = next_start - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                intended, next_start = next_start, next_start + interval
+            if time.monotonic() >= stop_at:
+                return
+            workload.run_one(recorder if measuring.is_set() else warm, intended)
+
+    recorder = LatencyRecorder()
+    # Spread the workers' schedules over one interval
+    threads = [threading.Thread(target=worker, args=(i * interval / concurrency,), daemon=True)
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(max(measure_from - time.monotonic(), 0))
+    if not interval:
+        recorder.expected_interval = warm.histograms()['all'][1].value_at_percentile(50) / 1_000_000
+    measuring.set()
+    for thread in threads:
+        thread.join()
+    return recorder
+
+def run_open_loop(workload, rate, max_inflight, warmup, duration):
     """
-    latencies = []
-    total_start_time = time.monotonic()
-
-    grpc_channel = None
-    if "grpc" in test_function.__name__:
-        grpc_channel = grpc.insecure_channel(GRPC_GATEWAY_ADDRESS)
-        grpc_stub = vault_pb2_grpc.SecretManagementServiceStub(grpc_channel)
-
-    with ThreadPoolExecutor(max_workers=num_concurrent_users) as executor:
-        if "grpc" in test_function.__name__:
-            futures = [executor.submit(test_function, grpc_stub) for _ in range(num_requests)]
-        else:
-            futures = [executor.submit(test_function) for _ in range(num_requests)]
-        
-        for future in as_completed(futures):
-            result = future.result()
-            if result is not None:
-                latencies.append(result)
-
-    total_time_taken = time.monotonic() - total_start_time
-    
-    if grpc_channel:
-        grpc_channel.close()
-
-    if not latencies:
-        return 0, 0
-
-    avg_latency = sum(latencies) / len(latencies)
-    throughput = len(latencies) / total_time_taken
-
-    return avg_latency, throughput
-
-
-def plot_results(results):
-    """Generates and saves bar charts for the benchmark results."""
-    labels = list(results.keys())
-    
+    Start rate requests per second on schedule, independent of completions.
+    Latency is measured from each request's scheduled start, so time spent
+    queued behind max_inflight or a late scheduler is included.
+    """
+    recorder = LatencyRecorder()
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+    interval = 1.0 / rate
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        sent = 0
+        while True:
+            intended = start + sent * interval
+            if intended >= stop_at:
+                break
+            delay = intended - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(workload.run_one, recorder if intended >= measure_from else None, intended)
+            sent += 1
+    return recorder
+
+def run_load(workload, mode, concurrency, rate, max_inflight, warmup, duration):
+    if mode == 'closed':
+        return run_closed_loop(workload, concurrency, warmup, duration, rate)
+    return run_open_loop(workload, rate, max_inflight, warmup, duration)
+
+CLIENTS = {HttpClient.name: HttpClient, GrpcClient.name: GrpcClient}
+
+def _load_process(spec, ready, results):
+    """Entry point of a load-generating process: run its share of the load, send back its recorder"""
+    client = CLIENTS[spec['target']](**spec['client_options'])
+    try:
+        workload = Workload(client, spec['mix'], spec['dataset_size'], spec['users'],
+                            make_payloads(spec['payload_size']))
+        # Start measuring together with the other processes
+        ready.wait(PROCESS_START_TIMEOUT)
+        results.put(run_load(workload, **spec['load']).encode())
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        client.close()
+
+def run_processes(processes, spec):
+    """
+    Split the load over processes separate Python processes (the GIL limits
+    what one can generate) and merge their histograms
+    """
+    load = spec['load']
+    context = multiprocessing.get_context('spawn')     # gRPC can't be forked once started
+    ready = context.Barrier(processes)
+    results = context.Queue()
+    workers = []
+    for i in range(processes):
+        share = dict(load,
+                     concurrency=load['concurrency'] // processes + (i < load['concurrency'] % processes),
+                     rate=load['rate'] / processes if load['rate'] else None,
+                     max_inflight=max(load['max_inflight'] // processes, 1))
+        workers.append(context.Process(target=_load_process, args=(dict(spec, load=share), ready, results),
+                                       daemon=True))
+    for worker in workers:
+        worker.start()
+
+    recorder = LatencyRecorder()
+    deadline = PROCESS_START_TIMEOUT + load['warmup'] + load['duration'] + REQUEST_TIMEOUT + 30
+    try:
+        for _ in workers:
+            encoded = results.get(timeout=deadline)
+            if 'error' in encoded:
+                print(f"  Load process failed: {encoded['error']}")
+                continue
+            recorder.merge(LatencyRecorder.decode(encoded))
+    except queue.Empty:
+        print("  Load processes did not finish in time; results are partial")
+    for worker in workers:
+        worker.join(5)
+        if worker.is_alive():
+            worker.terminate()
+    return recorder
+
+# --- Reporting ---
+
+def print_summary(summary):
+    print(f"    {'operation':<10} {'count':>8} {'errors':>7} {'req/s':>9} "
+          f"{'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'p999':>8} {'p9999':>8} {'max':>8} "
+          f"{'svc p99':>8}  (ms)")
+    for op, stats in summary.items():
+        lat = stats['latency_ms']
+        print(f"    {op:<10} {stats['count']:>8} {stats['errors']:>7} {stats['throughput']:>9.1f} "
+              f"{lat['mean']:>8.2f} {lat['p50']:>8.2f} {lat['p90']:>8.2f} {lat['p99']:>8.2f} "
+              f"{lat['p999']:>8.2f} {lat['p9999']:>8.2f} {lat['max']:>8.2f} "
+              f"{stats['service_ms']['p99']:>8.2f}")
+
+def write_spectra(directory, run):
+    """Write each operation's percentile spectrum of a run as an .hgrm file (values in ms)"""
+    os.makedirs(directory, exist_ok=True)
+    name = '_'.join(str(part) for part in run_key(run)).replace('/', '-')
+    for op, stats in run['operations'].items():
+        with open(os.path.join(directory, f"{name}_{op}.hgrm"), 'w') as f:
+            f.write(HdrHistogram.decode(stats['hdr']).format_hgrm(scale=1000))
+
+def run_key(run):
+    return (run['target'], run['mix'], run['dataset_size'], run['mode'])
+
+def compare(base_path, new_path):
+    """Print how each operation's latency and throughput changed between two result files"""
+    with open(base_path) as f:
+        base = {run_key(run): run for run in json.load(f)['runs']}
+    with open(new_path) as f:
+        new = {run_key(run): run for run in json.load(f)['runs']}
+
+    def change(old, now):
+        return f"{(now - old) / old * 100:+.1f}%" if old else "n/a"
+
+    for key in sorted(set(base) & set(new), key=str):
+        target, mix, size, mode = key
+        print(f"\n{target} | mix {mix} | {size:,} secrets | {mode} loop")
+        print(f"    {'operation':<10} {'p50 ms':>18} {'p99 ms':>18} {'p999 ms':>18} {'req/s':>20}")
+        for op, stats in new[key]['operations'].items():
+            old = base[key]['operations'].get(op)
+            if old is None:
+                continue
+            o, n = old['latency_ms'], stats['latency_ms']
+            print(f"    {op:<10} {n['p50']:>8.2f} {change(o['p50'], n['p50']):>9} "
+                  f"{n['p99']:>8.2f} {change(o['p99'], n['p99']):>9} "
+                  f"{n['p999']:>8.2f} {change(o['p999'], n['p999']):>9} "
+                  f"{stats['throughput']:>9.1f} {change(old['throughput'], stats['throughput']):>10}")
+    missing = set(base) ^ set(new)
+    if missing:
+        print(f"\n{len(missing)} runs appear in only one of the files")
+
+def plot_results(paths):
+    """Generates and saves comparison charts for the runs in the given result files."""
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            runs.extend(json.load(f)['runs'])
+    labels = [f"{run['target']}\n{run['mix']}, {run['dataset_size']:,}" for run in runs]
+    x = np.arange(len(runs))
+
     # --- Latency Chart ---
-    avg_latencies = [res['latency'] * 1000 for res in results.values()] # convert to ms
-    x = np.arange(len(labels))
-    width = 0.4
-    
-    fig, ax = plt.subplots(figsize=(8, 6))
-    rects = ax.bar(x, avg_latencies, width, color=['skyblue', 'lightcoral'])
-    
-    ax.set_ylabel('Average Latency (ms)')
-    ax.set_title(f'Latency Comparison (Lower is Better)\n{NUM_REQUESTS} requests, {CONCURRENT_USERS} concurrent users')
+    percentiles = ('p50', 'p90', 'p99', 'p999')
+    width = 0.8 / len(percentiles)
+    fig, ax = plt.subplots(figsize=(max(8, 2.5 * len(runs)), 6))
+    for i, p in enumerate(percentiles):
+        values = [run['operations']['all']['latency_ms'][p] for run in runs]
+        rects = ax.bar(x + (i - (len(percentiles) - 1) / 2) * width, values, width, label=p)
+        ax.bar_label(rects, fmt='%.1f', padding=2, fontsize=7)
+    ax.set_ylabel('Latency (ms)')
+    ax.set_yscale('log')
+    ax.set_title('Latency Percentiles, all operations (Lower is Better)')
     ax.set_xticks(x)
     ax.set_xticklabels(labels)
-    ax.bar_label(rects, fmt='%.2f ms', padding=3)
-    
+    ax.legend()
     fig.tight_layout()
     plt.savefig('latency_comparison.png')
-    print("\nSaved latency comparison graph to latency_comparison.png")
+    print("Saved latency comparison graph to latency_comparison.png")
     plt.close()
 
     # --- Throughput Chart ---
-    throughputs = [res['throughput'] for res in results.values()]
-    fig, ax = plt.subplots(figsize=(8, 6))
-    rects = ax.bar(x, throughputs, width, color=['skyblue', 'lightcoral'])
-    
+    fig, ax = plt.subplots(figsize=(max(8, 2.5 * len(runs)), 6))
+    rects = ax.bar(x, [run['operations']['all']['throughput'] for run in runs], 0.5, color='skyblue')
     ax.set_ylabel('Requests per Second')
-    ax.set_title(f'Throughput Comparison (Higher is Better)\n{NUM_REQUESTS} requests, {CONCURRENT_USERS} concurrent users')
+    ax.set_title('Throughput Comparison (Higher is Better)')
     ax.set_xticks(x)
     ax.set_xticklabels(labels)
-    ax.bar_label(rects, fmt='%.2f req/s', padding=3)
-    
+    ax.bar_label(rects, fmt='%.1f req/s', padding=3)
     fig.tight_layout()
     plt.savefig('throughput_comparison.png')
     print("Saved throughput comparison graph to throughput_comparison.png")
     plt.close()
 
+    # --- Percentile Spectrum Chart ---
+    # x is 1/(1-percentile) on a log scale, which spreads out the tail
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for run, label in zip(runs, labels):
+        spectrum = HdrHistogram.decode(run['operations']['all']['hdr']).percentile_spectrum()
+        points = [(1 / (1 - p / 100), value / 1000) for p, value, _ in spectrum if p < 100]
+        if points:
+            ax.plot(*zip(*points), label=label.replace('\n', ', '))
+    ticks = [0, 50, 90, 99, 99.9, 99.99, 99.999]
+    ax.set_xscale('log')
+    ax.set_xticks([1 / (1 - p / 100) for p in ticks])
+    ax.set_xticklabels([f"{p:g}%" for p in ticks])
+    ax.set_yscale('log')
+    ax.set_xlabel('Percentile')
+    ax.set_ylabel('Latency (ms)')
+    ax.set_title('Latency by Percentile, all operations (Lower is Better)')
+    ax.grid(True, which='major', alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    plt.savefig('latency_spectrum.png')
+    print("Saved latency percentile spectrum to latency_spectrum.png")
+    plt.close()
 
-if __name__ == "__main__":
-    print("Starting performance benchmark...")
-    
-    # Load previous results if they exist
-    results = {}
-    if os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, 'r') as f:
-            results = json.load(f)
+# --- Main ---
 
-    # --- Check which server is running ---
-    is_http_running, is_grpc_running = False, False
-    try:
-        requests.get(HTTP_BASE_URL, timeout=1)
-        is_http_running = True
-    except requests.exceptions.RequestException: pass
-    try:
-        with grpc.insecure_channel(GRPC_GATEWAY_ADDRESS) as channel:
-            grpc.channel_ready_future(channel).result(timeout=1)
-        is_grpc_running = True
-    except (grpc.FutureTimeoutError, grpc.RpcError): pass
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP and gRPC password vault")
+    parser.add_argument('--target', choices=('http', 'grpc', 'both', 'auto'), default='auto',
+                        help="system(s) to benchmark; auto = whichever is running")
+    parser.add_argument('--mix', action='append',
+                        help=f"operation mix: {', '.join(MIXES)}, an operation name, or "
+                             f"'op=weight,...' (repeatable; default read-heavy)")
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--concurrency', type=int, default=10, help="closed loop: concurrent workers")
+    parser.add_argument('--rate', type=float,
+                        help="requests per second: the arrival rate of the open loop (default 200); "
+                             "closed loop workers keep to a schedule at this total rate if given")
+    parser.add_argument('--max-inflight', type=int, default=200,
+                        help="open loop: most requests in flight at once")
+    parser.add_argument('--warmup', type=float, default=5, help="seconds of unmeasured load first")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds per run")
+    parser.add_argument('--grpc-compression', choices=tuple(GRPC_COMPRESSIONS), default=GRPC_COMPRESSION,
+                        help="compress requests to the gRPC gateway")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="processes to generate the load from; their histograms are merged")
+    parser.add_argument('--dataset-sizes', default="1000",
+                        help="comma-separated dataset sizes, e.g. 1000,100000,10000000")
+    parser.add_argument('--users', type=int, default=100, help="users the dataset is spread over")
+    parser.add_argument('--payload-size', type=int, default=64, help="bytes of secret plaintext")
+    parser.add_argument('--load-concurrency', type=int, default=32)
+    parser.add_argument('--skip-load', action='store_true',
+                        help="the dataset is already loaded (by an earlier run with the same sizes)")
+    parser.add_argument('--output', help="results file (default benchmark_results/<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two result files")
+    parser.add_argument('--plot', nargs='+', metavar='RESULTS', help="chart the runs in result files")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.plot:
+        plot_results(args.plot)
+        return
 
-    if not is_http_running and not is_grpc_running:
+    if args.mode == 'open' and not args.rate:
+        args.rate = 200
+    if args.mode == 'closed':
+        args.processes = min(args.processes, args.concurrency)
+    mixes = args.mix or ['read-heavy']
+    mix_weights = {mix: parse_mix(mix) for mix in mixes}
+    sizes = sorted(int(size) for size in args.dataset_sizes.split(','))
+
+    # --- Check which server is running ---
+    clients = []
+    if args.target in ('http', 'both', 'auto'):
+        clients.append(HttpClient())
+    if args.target in ('grpc', 'both', 'auto'):
+        clients.append(GrpcClient(compression=args.grpc_compression))
+    running = [client for client in clients if client.available()]
+    if args.target != 'auto' and len(running) < len(clients):
+        missing = ', '.join(c.name for c in clients if c not in running)
+        print(f"\nERROR: {missing} not reachable. Please start a system with 'docker-compose up'.")
+        return
+    if not running:
         print("\nERROR: No running server detected. Please start a system with 'docker-compose up'.")
-        if os.path.exists(RESULTS_FILE):
-            os.remove(RESULTS_FILE) # Clean up for next run
-            print(f"Cleared stale results file '{RESULTS_FILE}'.")
-
-    if is_http_running:
-        print(f"\n--- Benchmarking HTTP/REST ---")
-        latency, throughput = run_benchmark(perform_http_add_secret, NUM_REQUESTS, CONCURRENT_USERS)
-        if throughput > 0:
-            results['HTTP/REST'] = {'latency': latency, 'throughput': throughput}
-            print(f"  Average Latency: {latency * 1000:.2f} ms | Throughput: {throughput:.2f} req/s")
-    
-    if is_grpc_running:
-        print(f"\n--- Benchmarking gRPC ---")
-        latency, throughput = run_benchmark(perform_grpc_add_secret, NUM_REQUESTS, CONCURRENT_USERS)
-        if throughput > 0:
-            results['gRPC'] = {'latency': latency, 'throughput': throughput}
-            print(f"  Average Latency: {latency * 1000:.2f} ms | Throughput: {throughput:.2f} req/s")
-
-    # Save results to a file
-    with open(RESULTS_FILE, 'w') as f:
-        json.dump(results, f)
-
-    # If we have both results, plot them
-    if 'HTTP/REST' in results and 'gRPC' in results:
-        print("\n--- Both systems benchmarked. Generating Comparison Graphs ---")
-        plot_results(results)
-        os.remove(RESULTS_FILE) # Clean up for next run
-        print(f"Cleared results file '{RESULTS_FILE}'.")
-    elif results:
-        print("\nBenchmark completed for one system. Please run the other system and execute this script again.")
-    else:
-        print("\nBenchmark failed to collect any data.")
\ No newline at end of file
+        return
+
+    print("Starting performance benchmark...")
+    payloads = make_payloads(args.payload_size)
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'config': vars(args),
+        },
+        'runs': []
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    spectra_dir = os.path.splitext(output)[0] + '-hgrm'
+    load = {
+        'mode': args.mode,
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'max_inflight': args.max_inflight,
+        'warmup': args.warmup,
+        'duration': args.duration,
+    }
+
+    for client in running:
+        loaded = 0
+        for size in sizes:
+            print(f"\n--- Benchmarking {client.name}: {size:,} secrets ---")
+            if not args.skip_load:
+                load_dataset(client, loaded, size, args.users, payloads, args.load_concurrency)
+            loaded = size
+            for mix in mixes:
+                workload = Workload(client, mix_weights[mix], size, args.users, payloads)
+                shape = f"{args.concurrency} workers" if args.mode == 'closed' else ""
+                if args.rate:
+                    shape = ", ".join(filter(None, [shape, f"{args.rate:g} req/s"]))
+                if args.processes > 1:
+                    shape += f", {args.processes} processes"
+                print(f"  Mix {mix}, {args.mode} loop ({shape}): "
+                      f"{args.warmup:g}s warm-up, {args.duration:g}s measured")
+                if args.processes > 1:
+                    recorder = run_processes(args.processes, {
+                        'target': client.name,
+                        'client_options': ({'compression': args.grpc_compression}
+                                           if client.name == GrpcClient.name else {}),
+                        'mix': mix_weights[mix],
+                        'dataset_size': size,
+                        'users': args.users,
+                        'payload_size': args.payload_size,
+                        'load': load,
+                    })
+                else:
+                    recorder = run_load(workload, **load)
+                summary = recorder.summary(args.duration)
+                print_summary(summary)
+                run = {
+                    'target': client.name,
+                    'mix': mix,
+                    'weights': mix_weights[mix],
+                    'dataset_size': size,
+                    'mode': args.mode,
+                    'concurrency': args.concurrency if args.mode == 'closed' else None,
+                    'rate': args.rate,
+                    'processes': args.processes,
+                    'grpc_compression': args.grpc_compression if client.name == GrpcClient.name else None,
+                    'warmup': args.warmup,
+                    'duration': args.duration,
+                    # How latency accounts for requests delayed by slow ones
+                    'co_correction': ('intended-start' if args.rate else
+                                      'expected-interval' if args.warmup else 'none'),
+                    'operations': summary,
+                }
+                results['runs'].append(run)
+                write_spectra(spectra_dir, run)
+        client.close()
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved results to {output} and percentile spectra to {spectra_dir}/")
+    print(f"Compare runs with: python performance_test.py --compare <base.json> {output}")
+
+if __name__ == "__main__":
+    main()
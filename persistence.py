@@ -0,0 +1,259 @@
+# persistence.py
+# Write-ahead log and snapshots for the in-memory stores
+#
+# http_server and data_service keep their data in a MemoryStore (see
+# memory_store.py). With PERSIST_DIR set, every change the store makes is
+# also appended to a write-ahead log there, and every PERSIST_SNAPSHOT_EVERY
+# entries the whole store is written out as a compact snapshot, after which
+# the log segments it covers are deleted. On startup the snapshot is mapped
+# into memory and loaded, then the segments written since are replayed, so
+# restart time is bounded by the snapshot size plus one snapshot interval of
+# log, not by the length of the history.
+#
+# An entry holds the new state of a key, not the operation, so replaying it
+# twice is harmless. Writers append under the store lock and wait for the
+# fsync after releasing it; whichever waiting writer gets there first fsyncs
+# for all of them (group commit), so concurrent writes share one fsync.
+# Starting a snapshot only switches segments and copies the store's tables
+# (not their records) under the lock; the old segment is fsynced by the next
+# group commit and the snapshot is serialized and written in the background.
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import logs
+import metrics
+import snapshot
+from records import access_from_dict, secret_from_dict
+
+log = logs.get_logger("Persistence")
+
+# Directory for the log and snapshot ('' = keep data in memory only)
+PERSIST_DIR = os.environ.get("PERSIST_DIR", "")
+PERSIST_SNAPSHOT_EVERY = int(os.environ.get("PERSIST_SNAPSHOT_EVERY", "100000"))
+# How long a writer about to fsync waits for others to join its batch
+PERSIST_COMMIT_DELAY = float(os.environ.get("PERSIST_COMMIT_DELAY_MS", "0")) / 1000
+
+# A snapshot is _MAGIC, then length-prefixed frames: a zlib-compressed JSON
+# header {segment, tombstones}, then snapshot.encode_batch() payloads.
+_SNAPSHOT = "snapshot"
+_MAGIC = b"PVSNAP1\n"
+_FRAME = struct.Struct(">I")
+
+def _segment_path(directory, number):
+    return os.path.join(directory, f"wal-{number:08d}.log")
+
+def _segments(directory):
+    """Numbers of the log segments in directory, oldest first"""
+    return sorted(int(name[4:-4]) for name in os.listdir(directory)
+                  if name.startswith("wal-") and name.endswith(".log"))
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_frame(f, payload):
+    f.write(_FRAME.pack(len(payload)))
+    f.write(payload)
+
+def _frames(data, offset):
+    while offset < len(data):
+        (size,) = _FRAME.unpack_from(data, offset)
+        offset += _FRAME.size
+        yield data[offset:offset + size]
+        offset += size
+
+def write_snapshot(directory, segment, secrets, access, tombstones):
+    """
+    Write (secret_id, record) pairs and {secret_id: version} tombstones as
+    the snapshot replayed from log segment `segment` on. Replaces the
+    previous snapshot atomically.
+    """
+    path = os.path.join(directory, _SNAPSHOT)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC)
+        header = json.dumps({'segment': segment, 'tombstones': tombstones}, separators=(',', ':'))
+        _write_frame(f, zlib.compress(header.encode('utf-8')))
+        for batch in snapshot.iter_batches(secrets):
+            _write_frame(f, snapshot.encode_batch(batch, {}))
+        for batch in snapshot.iter_batches(access):
+            _write_frame(f, snapshot.encode_batch({}, batch))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(directory)
+
+def _load_snapshot(store, directory):
+    """Load the snapshot into store. Returns (first log segment to replay, records loaded)."""
+    path = os.path.join(directory, _SNAPSHOT)
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return 0, 0
+    records = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        frames = _frames(data, len(_MAGIC))
+        header = json.loads(zlib.decompress(next(frames)))
+        for payload in frames:
+            secrets, access, _, _ = snapshot.decode_batch(payload)
+            store.apply_batch(secrets, access)
+            records += len(secrets) + len(access)
+    store.apply_batch({}, {}, header['tombstones'])
+    return header['segment'], records
+
+def _replay(store, directory, segments):
+    """Apply the log segments to store. Returns the number of entries replayed."""
+    secrets, access, tombstones = {}, {}, {}
+    tables = {'secret': (secrets, secret_from_dict), 'access': (access, access_from_dict),
+              'tombstone': (tombstones, str)}
+    entries = 0
+    for number in segments:
+        with open(_segment_path(directory, number)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn write at the tail; nothing follows it
+                table, load = tables[entry['k']]
+                table[entry['id']] = load(entry['v']) if entry['v'] is not None else None
+                entries += 1
+    # Entries hold whole records, so only the last one of each key matters
+    store.apply_batch(secrets, access, tombstones)
+    return entries
+
+class Journal:
+    """A MemoryStore's write-ahead log, fsynced by group commit, and its snapshots"""
+
+    def __init__(self, store, directory, segment):
+        self.store = store
+        self.directory = directory
+        self._cond = threading.Condition()
+        self.written = 0       # sequence number of the last entry appended
+        self._durable = 0      # ... and of the last one known to be on disk
+        self._syncing = False
+        self._since_snapshot = 0
+        self._snapshotting = False
+        self._retired = []         # files of rotated-out segments, not yet fsynced
+        self._rotations = 0        # segments started since opening ...
+        self._dir_synced = 0       # ... and how many of their directory entries are durable
+        self._open(segment)
+        _fsync_dir(directory)
+
+    def _open(self, segment):
+        self.segment = segment
+        self._file = open(_segment_path(self.directory, segment), 'a')
+
+    def write(self, kind, key, value):
+        """Append an entry. The caller holds the store lock, so entries are in store order."""
+        line = json.dumps({'k': kind, 'id': key, 'v': value}, separators=(',', ':')) + '\n'
+        with self._cond:
+            self._file.write(line)
+            self.written += 1
+            self._since_snapshot += 1
+
+    def sync(self, seq):
+        """Wait until entry seq is on disk. Called without the store lock held."""
+        with self._cond:
+            while self._durable < seq:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                try:
+                    if PERSIST_COMMIT_DELAY:
+                        self._cond.wait(PERSIST_COMMIT_DELAY)
+                    target = self.written
+                    self._file.flush()
+                    retired, files = list(self._retired), self._retired + [self._file]
+                    rotations = self._rotations
+                    # Others keep appending (and rotating) while this one fsyncs
+                    self._cond.release()
+                    start = time.perf_counter()
+                    try:
+                        for f in files:
+                            os.fsync(f.fileno())
+                        if rotations > self._dir_synced:
+                            _fsync_dir(self.directory)
+                        for f in retired:
+                            f.close()
+                    finally:
+                        self._cond.acquire()
+                    metrics.WAL_FSYNC_LATENCY.observe(time.perf_counter() - start)
+                    metrics.WAL_FSYNC_BATCH.observe(target - self._durable)
+                    # Rotation only appends, so these are the ones just closed
+                    self._retired = self._retired[len(retired):]
+                    self._dir_synced = rotations
+                    self._durable = max(self._durable, target)
+                finally:
+                    self._syncing = False
+                    self._cond.notify_all()
+
+    def _rotate(self):
+        """Start a new segment, leaving the old one to the next sync(). Returns its number."""
+        with self._cond:
+            self._file.flush()
+            self._retired.append(self._file)
+            self._open(self.segment + 1)
+            self._rotations += 1
+            self._since_snapshot = 0
+            return self.segment
+
+    def maybe_snapshot(self):
+        """
+        Start writing a snapshot in the background once enough entries were
+        logged since the last one. The caller holds the store lock; the
+        tables are copied under it, serialized and written outside it.
+        """
+        if self._since_snapshot < PERSIST_SNAPSHOT_EVERY or self._snapshotting:
+            return
+        self._snapshotting = True
+        segment = self._rotate()
+        store = self.store
+        # Records are replaced, never modified in place, so the tables'
+        # entries are all that needs copying
+        secrets, access, tombstones = dict(store.secrets), dict(store.access), dict(store.tombstones)
+        threading.Thread(target=self._snapshot, args=(segment, secrets, access, tombstones),
+                         daemon=True, name="snapshot").start()
+
+    def _snapshot(self, segment, secrets, access, tombstones):
+        start = time.perf_counter()
+        try:
+            write_snapshot(self.directory, segment, secrets.items(), access.items(), tombstones)
+            for number in _segments(self.directory):
+                if number < segment:
+                    os.remove(_segment_path(self.directory, number))
+            log.info("Wrote snapshot", records=len(secrets) + len(access), segment=segment,
+                     seconds=round(time.perf_counter() - start, 3))
+        except OSError as e:
+            log.error("Snapshot failed, keeping the log", segment=segment, error=str(e))
+        finally:
+            self._snapshotting = False
+
+def restore(store, directory=PERSIST_DIR):
+    """
+    Load what was persisted in directory into store, then log the store's
+    writes there from now on. Returns the number of records and log entries
+    restored. Does nothing if directory is '' (persistence off).
+    """
+    if not directory:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    segment, records = _load_snapshot(store, directory)
+    segments = [number for number in _segments(directory) if number >= segment]
+    entries = _replay(store, directory, segments)
+    # Appending to the last segment could follow a torn entry; start a new one
+    journal = Journal(store, directory, max(segments, default=segment) + 1)
+    journal._since_snapshot = entries
+    store.journal = journal
+    log.info("Restored store", directory=directory, records=records, log_entries=entries,
+             seconds=round(time.perf_counter() - start, 3))
+    return records + entries
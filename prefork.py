@@ -0,0 +1,207 @@
+# prefork.py
+# Multi-process serving: WORKERS processes share one port via SO_REUSEPORT
+#
+# One Python process handles requests on one core at a time (the GIL), so
+# with WORKERS > 1 serve() becomes a supervisor that starts WORKERS copies
+# of the service, each binding the same port with SO_REUSEPORT; the kernel
+# spreads incoming connections across them. The supervisor restarts workers
+# that exit, replaces them one at a time on SIGHUP (rolling restart), and on
+# SIGTERM/SIGINT lets each worker drain: stop accepting calls and finish the
+# ones in flight for up to DRAIN_TIMEOUT seconds.
+#
+# Workers are started as fresh interpreters running the same command rather
+# than with os.fork(): gRPC can't be forked safely once it has started
+# threads, and the service modules start some at import.
+#
+# Anything a service keeps in process memory is per worker. Services that
+# store data in memory (data_service.py, http_server.py) must run with one
+# worker.
+#
+# Each worker keeps its hinted-handoff log in REPLICATION_LOG_DIR/worker-<id>.
+# A rolling restart stops a worker before starting its replacement, so the
+# two never share that directory or the worker's metrics port; the other
+# workers keep serving meanwhile. If WORKERS is lowered, the supervisor
+# moves the logs of the workers that no longer exist to the remaining ones;
+# a single process (WORKERS=1) takes over all of them in REPLICATION_LOG_DIR
+# itself (see replication_log.py).
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import logs
+
+WORKERS = int(os.environ.get("WORKERS", "1"))
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", "10"))
+# Set by the supervisor in each worker's environment
+WORKER_ID = os.environ.get("PREFORK_WORKER_ID", "")
+# Counts the workers the supervisor has started, so each gets a unique
+# clock id even while a worker and its replacement overlap (see hlc.py)
+GENERATION = os.environ.get("PREFORK_GENERATION", "")
+
+# Options for grpc.server() so that several processes can bind the port
+SERVER_OPTIONS = [("grpc.so_reuseport", 1)]
+
+# A worker that exits sooner than this after starting is restarted with backoff
+_MIN_UPTIME = 5.0
+_MAX_RESTART_DELAY = 30.0
+
+if WORKER_ID:
+    # Tell the workers' log lines apart
+    logs.add_context(lambda: {'worker': WORKER_ID})
+
+def is_supervisor():
+    """True if this process should supervise workers instead of serving"""
+    return WORKERS > 1 and not WORKER_ID
+
+def run(server, name):
+    """Serve until SIGTERM/SIGINT, then drain in-flight calls and return"""
+    log = logs.get_logger(name)
+
+    def drain(signum, frame):
+        log.info("Draining", timeout=DRAIN_TIMEOUT)
+        server.stop(DRAIN_TIMEOUT)
+
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, drain)
+        signal.signal(signal.SIGINT, drain)
+    if WORKER_ID:
+        threading.Thread(target=_exit_with_supervisor, args=(drain,), daemon=True).start()
+    server.wait_for_termination()
+    log.info("Stopped")
+
+def _exit_with_supervisor(drain):
+    # A worker whose supervisor died (e.g. SIGKILL) is re-parented; don't
+    # keep serving unsupervised
+    supervisor = os.getppid()
+    while os.getppid() == supervisor:
+        time.sleep(1)
+    drain(None, None)
+
+def _read_hints(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break  # torn write at the tail
+    return entries
+
+def adopt_hints(log_dir, workers, log):
+    """
+    Append the hint logs of workers >= workers to those of the remaining
+    workers, renumbered after the entries already there, so that nothing is
+    left unreplayed after WORKERS is lowered. With workers=1 (one process,
+    no supervisor) every worker's logs move into log_dir itself.
+    """
+    if not os.path.isdir(log_dir):
+        return
+    for name in os.listdir(log_dir):
+        if not name.startswith("worker-") or not name[7:].isdigit():
+            continue
+        if workers > 1 and int(name[7:]) < workers:
+            continue
+        source_dir = os.path.join(log_dir, name)
+        target_dir = os.path.join(log_dir, f"worker-{int(name[7:]) % workers}") if workers > 1 else log_dir
+        os.makedirs(target_dir, exist_ok=True)
+        for file_name in os.listdir(source_dir):
+            source = os.path.join(source_dir, file_name)
+            if not file_name.endswith('.log'):
+                os.remove(source)
+                continue
+            target = os.path.join(target_dir, file_name)
+            # The target log isn't in use: nothing has started replaying it yet
+            seq = max((e['seq'] for e in _read_hints(target)), default=0) if os.path.exists(target) else 0
+            entries = _read_hints(source)
+            with open(target, 'a') as f:
+                for entry in entries:
+                    seq += 1
+                    f.write(json.dumps(dict(entry, seq=seq)) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.remove(source)
+            log.info("Moved hints of removed worker", source=source, target=target, pending=len(entries))
+        os.rmdir(source_dir)
+
+class _Worker:
+    def __init__(self, worker_id, env):
+        self.worker_id = worker_id
+        self.started = time.monotonic()
+        self.process = subprocess.Popen([sys.executable] + sys.argv, env=env)
+
+def supervise(name):
+    """Run WORKERS worker processes until SIGTERM/SIGINT"""
+    log = logs.get_logger(name)
+    log_dir = os.environ.get("REPLICATION_LOG_DIR", "replication_log")
+    workers = {}
+    events = []     # signals received, handled by the loop below
+    generation = itertools.count(1)
+
+    def start(worker_id):
+        env = dict(os.environ, PREFORK_WORKER_ID=str(worker_id), PREFORK_GENERATION=str(next(generation)),
+                   # Each worker keeps its own hinted-handoff log
+                   REPLICATION_LOG_DIR=os.path.join(log_dir, f"worker-{worker_id}"))
+        worker = _Worker(worker_id, env)
+        log.info("Started worker", worker_id=worker_id, pid=worker.process.pid)
+        return worker
+
+    def reap(worker):
+        try:
+            worker.process.wait(DRAIN_TIMEOUT + 5)
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+            worker.process.wait()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: events.append('stop'))
+    signal.signal(signal.SIGINT, lambda signum, frame: events.append('stop'))
+    signal.signal(signal.SIGHUP, lambda signum, frame: events.append('reload'))
+
+    adopt_hints(log_dir, WORKERS, log)
+    log.info("Supervisor starting workers", pid=os.getpid(), workers=WORKERS)
+    for worker_id in range(WORKERS):
+        workers[worker_id] = start(worker_id)
+    restart_at = {}     # worker id -> when to restart an exited worker
+    restart_delays = {}
+
+    while 'stop' not in events:
+        time.sleep(0.5)
+        if 'reload' in events:
+            events.remove('reload')
+            log.info("Rolling restart", workers=WORKERS)
+            for worker_id, old in list(workers.items()):
+                # The other workers serve the port while this one is replaced.
+                # The old worker exits first: its replacement takes over its
+                # hint log and metrics port.
+                old.process.send_signal(signal.SIGTERM)
+                reap(old)
+                workers[worker_id] = start(worker_id)
+                time.sleep(1)
+
+        now = time.monotonic()
+        for worker_id, worker in list(workers.items()):
+            code = worker.process.poll()
+            if code is None:
+                continue
+            if worker_id not in restart_at:
+                # Back off if the worker keeps dying right after starting
+                delay = restart_delays.get(worker_id, 0.0)
+                delay = min(max(delay * 2, 1.0), _MAX_RESTART_DELAY) if now - worker.started < _MIN_UPTIME else 0.0
+                restart_delays[worker_id] = delay
+                restart_at[worker_id] = now + delay
+                log.warning("Worker exited, restarting", worker_id=worker_id, code=code, delay=delay)
+            if now >= restart_at[worker_id]:
+                del restart_at[worker_id]
+                workers[worker_id] = start(worker_id)
+
+    log.info("Stopping workers", workers=len(workers))
+    for worker in workers.values():
+        if worker.process.poll() is None:
+            worker.process.send_signal(signal.SIGTERM)
+    for worker in workers.values():
+        reap(worker)
@@ -0,0 +1,286 @@
+# profiling.py
+# On-demand CPU and allocation profiling of a running service
+#
+# Off unless PROFILING_ENABLED is set. Then the gRPC services answer on
+# PROFILING_HOST:PROFILING_PORT (a prefork worker N on PROFILING_PORT + N,
+# as with metrics), and http_server.py on its own port:
+#
+#   /debug/pprof/profile?seconds=30   sampling CPU profile
+#   /debug/pprof/heap?seconds=30      allocations made during the window and still live
+#
+# The CPU profiler runs on the requesting thread: PROFILE_HZ times a second it
+# reads the Python stack of every other thread (sys._current_frames()) and
+# charges it with the CPU time that thread used since the previous sample,
+# read from /proc, so worker threads waiting for work cost nothing.
+# mode=wall counts every thread in every sample instead (the default outside
+# Linux). The heap profile turns tracemalloc on for the window, unless it
+# was already on (PYTHONTRACEMALLOC). Nothing runs between requests, and
+# only one profile runs at a time.
+#
+# Output (format=...):
+#   collapsed  folded stacks ("a;b;c 42"), for flamegraph.pl, speedscope, inferno
+#   pstats     pstats data, for python -m pstats, snakeviz, gprof2dot (CPU only);
+#              call counts are sample counts
+#   snapshot   a tracemalloc snapshot, for tracemalloc.Snapshot.load() (heap only)
+#   text       the top functions / allocation sites
+#
+# Example:
+#   curl -o gateway.pstats 'localhost:6060/debug/pprof/profile?seconds=20&format=pstats'
+import collections
+import io
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import logs
+import prefork
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# The gRPC services' profiling endpoint; loopback only unless opened up
+PROFILING_HOST = os.environ.get("PROFILING_HOST", "127.0.0.1")
+PROFILING_PORT = int(os.environ.get("PROFILING_PORT", "6060"))
+# CPU samples per second
+PROFILE_HZ = int(os.environ.get("PROFILE_HZ", "100"))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "300"))
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "25"))
+
+_MAX_DEPTH = 128
+_TOP = 40
+_running = threading.Lock()
+
+class Busy(Exception):
+    """Another profile is being taken"""
+
+# --- CPU ---
+
+def _stack(frame):
+    """(filename, first line, function) of each frame, outermost first"""
+    stack = []
+    while frame is not None and len(stack) < _MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+def _cpu_ticks(native_id):
+    """User + system CPU time of a thread of this process, in clock ticks"""
+    try:
+        with open(f"/proc/self/task/{native_id}/stat", 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15; the command name before them may contain spaces
+    fields = stat[stat.rindex(b')') + 2:].split()
+    return int(fields[11]) + int(fields[12])
+
+def sample_cpu(seconds, hz=PROFILE_HZ, mode='cpu'):
+    """
+    Sample the other threads' stacks for seconds. Returns ({stack: weight},
+    seconds per unit of weight).
+    """
+    if mode == 'cpu' and _cpu_ticks(threading.get_native_id()) is None:
+        mode = 'wall'
+    counts = collections.Counter()
+    last_ticks = {}
+    me = threading.get_ident()
+    interval = 1.0 / hz
+    next_sample = time.monotonic()
+    deadline = next_sample + seconds
+    while next_sample < deadline:
+        native_ids = {thread.ident: thread.native_id for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if mode == 'wall':
+                counts[_stack(frame)] += 1
+                continue
+            ticks = _cpu_ticks(native_ids.get(ident))
+            if ticks is None:
+                continue
+            used = ticks - last_ticks.get(ident, ticks)
+            last_ticks[ident] = ticks
+            if used > 0:
+                counts[_stack(frame)] += used
+        next_sample += interval
+        time.sleep(max(next_sample - time.monotonic(), 0))
+    unit = 1.0 / os.sysconf('SC_CLK_TCK') if mode == 'cpu' else interval
+    return counts, unit
+
+class _SampledStats:
+    """Samples in the shape pstats.Stats loads from a profiler"""
+
+    def __init__(self, counts, unit):
+        self.stats = {}
+        for stack, weight in counts.items():
+            spent = weight * unit
+            seen_funcs, seen_calls = set(), set()
+            for depth, func in enumerate(stack):
+                leaf = depth == len(stack) - 1
+                calls, primitive, self_time, total, callers = self.stats.get(func, (0, 0, 0.0, 0.0, {}))
+                if func not in seen_funcs:
+                    # Recursive frames count once per sample
+                    seen_funcs.add(func)
+                    calls, primitive, total = calls + weight, primitive + weight, total + spent
+                if leaf:
+                    self_time += spent
+                if depth and (stack[depth - 1], func) not in seen_calls:
+                    seen_calls.add((stack[depth - 1], func))
+                    c_calls, c_primitive, c_self, c_total = callers.get(stack[depth - 1], (0, 0, 0.0, 0.0))
+                    callers[stack[depth - 1]] = (c_calls + weight, c_primitive + weight,
+                                                 c_self + (spent if leaf else 0.0), c_total + spent)
+                self.stats[func] = (calls, primitive, self_time, total, callers)
+
+    def create_stats(self):
+        pass
+
+def _short_path(filename):
+    for prefix in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+def _collapsed(weighted_stacks):
+    lines = (";".join(label.replace(';', ':') for label in stack) + f" {weight}"
+             for stack, weight in weighted_stacks)
+    return "\n".join(lines) + "\n"
+
+def cpu_profile(seconds, fmt='collapsed', mode='cpu', hz=PROFILE_HZ):
+    """A CPU profile in fmt, as (content type, file name, bytes)"""
+    counts, unit = sample_cpu(seconds, hz, mode)
+    if fmt == 'collapsed':
+        stacks = ((tuple(f"{name} ({_short_path(filename)}:{line})" for filename, line, name in stack), weight)
+                  for stack, weight in counts.most_common())
+        return 'text/plain', 'cpu.collapsed', _collapsed(stacks).encode()
+    stats = _SampledStats(counts, unit)
+    if fmt == 'pstats':
+        return 'application/octet-stream', 'cpu.pstats', marshal.dumps(stats.stats)
+    if fmt == 'text':
+        out = io.StringIO()
+        out.write(f"{sum(counts.values()) * unit:.2f}s of {mode} time sampled over {seconds:g}s\n")
+        if counts:
+            pstats.Stats(stats, stream=out).sort_stats('tottime').print_stats(_TOP)
+        return 'text/plain', 'cpu.txt', out.getvalue().encode()
+    raise ValueError(f"unknown CPU profile format {fmt!r}")
+
+# --- Allocations ---
+
+def heap_snapshot(seconds):
+    """tracemalloc snapshot of what was allocated in the next seconds and is still live"""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    return snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+def heap_profile(seconds, fmt='collapsed'):
+    """An allocation profile in fmt, as (content type, file name, bytes)"""
+    snapshot = heap_snapshot(seconds)
+    if fmt == 'collapsed':
+        # Bytes still allocated, by allocating stack
+        stacks = ((tuple(f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback), stat.size)
+                  for stat in snapshot.statistics('traceback'))
+        return 'text/plain', 'heap.collapsed', _collapsed(stacks).encode()
+    if fmt == 'snapshot':
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'heap.snapshot')
+            snapshot.dump(path)
+            with open(path, 'rb') as f:
+                return 'application/octet-stream', 'heap.snapshot', f.read()
+    if fmt == 'text':
+        stats = snapshot.statistics('lineno')
+        lines = [f"{sum(stat.size for stat in stats) / 1024:.1f} KiB in {sum(stat.count for stat in stats)} "
+                 f"blocks allocated over {seconds:g}s and still live"]
+        lines += [str(stat) for stat in stats[:_TOP]]
+        return 'text/plain', 'heap.txt', ("\n".join(lines) + "\n").encode()
+    raise ValueError(f"unknown heap profile format {fmt!r}")
+
+# --- Endpoints ---
+
+def _seconds(params, default):
+    seconds = float(params.get('seconds', default))
+    if not 0 <= seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+    return seconds
+
+def handle(kind, params):
+    """
+    Take the profile a /debug/pprof/<kind> request asks for. Returns
+    (status, content type, file name, body).
+    """
+    try:
+        if kind not in ('profile', 'heap'):
+            return 404, 'text/plain', None, b"Profiles: /debug/pprof/profile, /debug/pprof/heap\n"
+        if not _running.acquire(blocking=False):
+            raise Busy()
+        try:
+            if kind == 'profile':
+                result = cpu_profile(_seconds(params, 30), params.get('format', 'collapsed'),
+                                     params.get('mode', 'cpu'), int(params.get('hz', PROFILE_HZ)))
+            else:
+                result = heap_profile(_seconds(params, 30), params.get('format', 'collapsed'))
+        finally:
+            _running.release()
+    except ValueError as e:
+        return 400, 'text/plain', None, f"{e}\n".encode()
+    except Busy:
+        return 409, 'text/plain', None, b"A profile is already being taken\n"
+    return (200,) + result
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        prefix, _, kind = url.path.rstrip('/').rpartition('/')
+        if prefix != '/debug/pprof':
+            kind = ''
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        status, content_type, filename, body = handle(kind, params)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if filename:
+            self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logs.get_logger("Profiling").info("Request", request=format % args)
+
+def serve(name):
+    """Serve the profiling endpoints (in a background thread), if enabled"""
+    if not PROFILING_ENABLED:
+        return
+    port = PROFILING_PORT + int(prefork.WORKER_ID or 0)
+    try:
+        server = ThreadingHTTPServer((PROFILING_HOST, port), _Handler)
+    except OSError as e:
+        logs.get_logger(name).warning("Profiling not served, port unavailable", port=port, error=str(e))
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="profiling", daemon=True).start()
+    logs.get_logger(name).info("Profiling served at /debug/pprof", host=PROFILING_HOST, port=port)
+
+def instrument_flask(app):
+    """Serve the profiling endpoints from a Flask app, if enabled"""
+    if not PROFILING_ENABLED:
+        return
+    from flask import Response, request
+
+    @app.route('/debug/pprof/<kind>', methods=['GET'])
+    def pprof(kind):
+        status, content_type, filename, body = handle(kind, request.args.to_dict())
+        headers = {'Content-Disposition': f'attachment; filename="{filename}"'} if filename else {}
+        return Response(body, status=status, mimetype=content_type, headers=headers)
@@ -0,0 +1,90 @@
+# quorum.py
+# Tunable consistency levels for replicated reads and writes
+#
+# ONE completes once a single replica (normally this node) has the write or
+# has answered, QUORUM once a majority of the secret's replicas have, ALL
+# once every replica has. Replica calls are always issued concurrently; a
+# replica that misses a write keeps receiving it in the background. Reads
+# above ONE compare the versions the replicas returned and push the newest
+# copy to the ones that answered with an older one (read repair).
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import hlc
+import vault_pb2
+
+ONE, QUORUM, ALL = 'ONE', 'QUORUM', 'ALL'
+LEVELS = (ONE, QUORUM, ALL)
+
+# How long a write or read waits for replicas to reach its consistency level
+QUORUM_TIMEOUT = float(os.environ.get("QUORUM_TIMEOUT", "2"))
+
+def parse_level(value, default=ONE):
+    """Normalize a level name (e.g. from an HTTP parameter). Raises ValueError."""
+    if not value:
+        return default
+    level = str(value).upper()
+    if level not in LEVELS:
+        raise ValueError(f"Unknown consistency level {value!r}, expected one of {', '.join(LEVELS)}")
+    return level
+
+# Levels used when a request doesn't ask for one
+WRITE_CONSISTENCY = parse_level(os.environ.get("WRITE_CONSISTENCY"))
+READ_CONSISTENCY = parse_level(os.environ.get("READ_CONSISTENCY"))
+
+def from_proto(value, default):
+    """Level name for a vault_pb2.ConsistencyLevel value; DEFAULT maps to default"""
+    name = vault_pb2.ConsistencyLevel.Name(value)
+    return default if name == 'DEFAULT' else name
+
+def required(level, replica_count):
+    """Number of replicas that must respond for level"""
+    if level == ONE:
+        return min(1, replica_count)
+    if level == QUORUM:
+        return replica_count // 2 + 1
+    return replica_count
+
+def collect(calls, needed, timeout=QUORUM_TIMEOUT, ok=lambda result: True):
+    """
+    Wait until needed of calls ({replica: Future}) have succeeded, or can no
+    longer do so. A call succeeds if it didn't raise and ok(result) holds.
+    Returns {replica: result} for the successful calls seen by then; calls
+    still running are left to finish in the background.
+    """
+    replica_of = {call: replica for replica, call in calls.items()}
+    pending = set(replica_of)
+    results = {}
+    deadline = time.monotonic() + timeout
+    while pending and len(results) < needed <= len(results) + len(pending):
+        done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for call in done:
+            if call.exception() is None and ok(call.result()):
+                results[replica_of[call]] = call.result()
+    return results
+
+def await_acks(calls, local_acks, level, timeout=QUORUM_TIMEOUT):
+    """
+    Wait for enough replicas to acknowledge a write. calls maps every other
+    replica to a Future of whether it applied the write; local_acks is 1 if
+    this node stored it itself. Returns (acknowledged, required).
+    """
+    needed = required(level, len(calls) + local_acks)
+    acks = collect(calls, needed - local_acks, timeout, ok=bool)
+    return local_acks + len(acks), needed
+
+def resolve(responses):
+    """
+    Pick the newest of the replies to a read, {replica: (version, record)},
+    where record is None for a missing or deleted secret. Returns
+    (version, record, stale) with stale listing the replicas that answered
+    with an older version and should be repaired.
+    """
+    version, record = max(responses.values(), key=lambda response: response[0] or '')
+    stale = [replica for replica, (replica_version, _) in responses.items()
+             if hlc.is_newer(version, replica_version)]
+    return version, record, stale
@@ -0,0 +1,165 @@
+# records.py
+# Compact record types for secrets, their access control lists and groups
+#
+# Services hold secrets and ACLs as these __slots__ records rather than
+# dicts: no per-instance __dict__, user ids interned so every record owned
+# by or shared with a user points at one string, timestamps as integer
+# microseconds since the epoch instead of ISO strings, and shared_with as a
+# set so membership checks stay O(1) however widely a secret is shared.
+#
+# Outside the process (protobuf messages, HTTP bodies, Redis values,
+# snapshot batches) records keep their dict form with ISO-8601 timestamps,
+# so wire and storage formats are unchanged; from_dict()/to_dict() convert
+# at those boundaries. Stored secrets are replaced, never modified in place.
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def intern_id(user_id):
+    """One shared copy of each user id"""
+    return sys.intern(user_id) if user_id else ''
+
+def to_micros(timestamp):
+    """Epoch microseconds of an ISO-8601 timestamp (naive means UTC); ints pass through"""
+    if not timestamp:
+        return 0
+    if isinstance(timestamp, int):
+        return timestamp
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - _EPOCH) // _MICROSECOND
+
+def to_iso(micros):
+    """Inverse of to_micros, in the form datetime.utcnow().isoformat() gives"""
+    if not micros:
+        return ''
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+def now():
+    """The current time in epoch microseconds"""
+    return time.time_ns() // 1000
+
+class Secret:
+    __slots__ = ('user_id', 'secret_name', 'data', 'created_at', 'updated_at', 'version')
+
+    def __init__(self, user_id, secret_name, data, created_at=0, updated_at=0, version=''):
+        self.user_id = intern_id(user_id)
+        self.secret_name = secret_name
+        self.data = data
+        self.created_at = to_micros(created_at)
+        self.updated_at = to_micros(updated_at)
+        self.version = version or ''
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record.get('user_id'), record.get('secret_name', ''), record.get('data', ''),
+                   record.get('created_at'), record.get('updated_at'), record.get('version'))
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'secret_name': self.secret_name,
+            'data': self.data,
+            'created_at': to_iso(self.created_at),
+            'updated_at': to_iso(self.updated_at),
+            'version': self.version
+        }
+
+    def replace(self, **changes):
+        """A copy with some fields changed"""
+        copy = Secret.__new__(Secret)
+        for field in self.__slots__:
+            setattr(copy, field, getattr(self, field))
+        for field, value in changes.items():
+            setattr(copy, field, to_micros(value) if field in ('created_at', 'updated_at') else value)
+        return copy
+
+    def __repr__(self):
+        return f"Secret(user_id={self.user_id!r}, secret_name={self.secret_name!r}, version={self.version!r})"
+
+class Access:
+    __slots__ = ('owner_id', 'shared_with', 'groups', 'version')
+
+    def __init__(self, owner_id, shared_with=(), version='', groups=()):
+        self.owner_id = intern_id(owner_id)
+        self.shared_with = {intern_id(user_id) for user_id in shared_with}
+        self.groups = {intern_id(group_id) for group_id in groups}
+        self.version = version or ''
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record.get('owner_id'), record.get('shared_with', ()), record.get('version'),
+                   record.get('groups', ()))
+
+    def to_dict(self):
+        record = {
+            'owner_id': self.owner_id,
+            'shared_with': sorted(self.shared_with),
+            'version': self.version
+        }
+        if self.groups:
+            record['groups'] = sorted(self.groups)
+        return record
+
+    def grant(self, user_id):
+        """Add user_id to shared_with. Returns True if it wasn't there yet."""
+        if user_id in self.shared_with:
+            return False
+        self.shared_with.add(intern_id(user_id))
+        return True
+
+    def copy(self):
+        copy = Access.__new__(Access)
+        copy.owner_id, copy.version = self.owner_id, self.version
+        copy.shared_with, copy.groups = set(self.shared_with), set(self.groups)
+        return copy
+
+    def __repr__(self):
+        return (f"Access(owner_id={self.owner_id!r}, shared_with={len(self.shared_with)} users, "
+                f"groups={len(self.groups)}, version={self.version!r})")
+
+class Group:
+    """
+    A group of users a secret can be shared with. members and removed map
+    each user id to the version of its latest add or removal, so membership
+    changes merge last-writer-wins per member.
+    """
+    __slots__ = ('owner_id', 'members', 'removed', 'version')
+
+    def __init__(self, owner_id, members=None, removed=None, version=''):
+        self.owner_id = intern_id(owner_id)
+        self.members = {intern_id(user_id): v for user_id, v in (members or {}).items()}
+        self.removed = {intern_id(user_id): v for user_id, v in (removed or {}).items()}
+        self.version = version or ''
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record.get('owner_id'), record.get('members'), record.get('removed'), record.get('version'))
+
+    def to_dict(self):
+        return {
+            'owner_id': self.owner_id,
+            'members': self.members,
+            'removed': self.removed,
+            'version': self.version
+        }
+
+    def __repr__(self):
+        return f"Group(owner_id={self.owner_id!r}, members={len(self.members)}, version={self.version!r})"
+
+def secret_from_dict(record):
+    return Secret.from_dict(record) if record is not None else None
+
+def access_from_dict(record):
+    return Access.from_dict(record) if record is not None else None
+
+def group_from_dict(record):
+    return Group.from_dict(record) if record is not None else None
+
+def to_dict(record):
+    """A record's dict form; None stays None"""
+    return record.to_dict() if record is not None else None
@@ -0,0 +1,320 @@
+# replication_log.py
+# Durable per-peer outbound replication log (hinted handoff)
+#
+# When a peer's ReplicationService is unreachable the mutation is appended to
+# an on-disk log for that peer instead of being dropped. A background thread
+# replays the log with exponential backoff once the peer comes back. Before
+# each replay pass the log is compacted per secret_id so only the latest
+# state of a secret is resent after a long outage.
+#
+# Only failures that mean the peer is down or overloaded are retried; a
+# mutation the peer rejects outright would fail the same way forever, so it
+# is logged and dropped rather than blocking the mutations queued behind it.
+# A mutation the peer received but could not apply yet (success=False, e.g.
+# an update that arrived before its add) is kept and retried, up to
+# REPLICATION_MAX_REJECTIONS times.
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+import vault_pb2
+import vault_pb2_grpc
+import channels
+import hlc
+import logs
+import metrics
+import prefork
+import tracing
+
+log = logs.get_logger("ReplicationLog")
+
+REPLICATION_LOG_DIR = os.environ.get("REPLICATION_LOG_DIR", "replication_log")
+RETRY_BASE_DELAY = float(os.environ.get("REPLICATION_RETRY_BASE", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("REPLICATION_RETRY_MAX", "30"))
+REPLICATION_TIMEOUT = 2
+REPLICATION_FANOUT_WORKERS = int(os.environ.get("REPLICATION_FANOUT_WORKERS", "16"))
+REPLICATION_MAX_REJECTIONS = int(os.environ.get("REPLICATION_MAX_REJECTIONS", "20"))
+
+# Failures worth retrying: the peer is unreachable, slow or shedding load
+_RETRYABLE = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED,
+              grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+# Mutation kinds and the ReplicationService RPC that applies each of them
+_RPCS = {
+    'secret': ('ReplicateSecret', vault_pb2.ReplicateSecretRequest),
+    'update': ('ReplicateUpdate', vault_pb2.ReplicateUpdateRequest),
+    'delete': ('ReplicateDeletion', vault_pb2.ReplicateDeletionRequest),
+    'share': ('ReplicateShare', vault_pb2.ReplicateShareRequest),
+    'group_share': ('ReplicateGroupShare', vault_pb2.ReplicateGroupShareRequest),
+    'group_member': ('ReplicateGroupMember', vault_pb2.ReplicateGroupMemberRequest),
+}
+
+def send_mutation(addr, kind, payload, timeout=REPLICATION_TIMEOUT):
+    """Send one mutation to a peer's ReplicationService. Raises grpc.RpcError."""
+    method, request_cls = _RPCS[kind]
+    stub = channels.get_stub(vault_pb2_grpc.ReplicationServiceStub, addr)
+    start = time.perf_counter()
+    try:
+        response = getattr(stub, method)(request_cls(**payload), timeout=timeout)
+    except grpc.RpcError:
+        metrics.REPLICATION_SENDS.labels(addr, kind, 'failed').inc()
+        raise
+    metrics.REPLICATION_SENDS.labels(addr, kind, 'ok').inc()
+    metrics.REPLICATION_LATENCY.labels(addr).observe(time.perf_counter() - start)
+    return response.success
+
+def _subject(payload):
+    return payload.get('secret_id') or payload.get('group_id')
+
+def _version(entry):
+    return entry['payload'].get('version')
+
+def _keep_newest(table, key, entry):
+    current = table.get(key)
+    if current is None or hlc.is_newer(_version(entry), _version(current)):
+        table[key] = entry
+
+def compact(entries):
+    """
+    Collapse a peer's pending entries so only the latest state per secret_id
+    is resent, preserving the original order of the surviving entries.
+    "Latest" is by version, not by position: concurrent deliveries can
+    append an older mutation after a newer one.
+
+    - updates (and adds, deletes) of a secret keep only the newest
+    - a delete supersedes every add/update/share of that secret it is newer than
+    - duplicate shares of the same secret to the same user or group keep the newest
+    - group membership changes keep only the newest per group and user
+    """
+    latest = {}   # (secret_id, kind) -> newest entry of that kind
+    shares = {}   # (secret_id, target_user_id or group_id) -> newest share entry
+    members = {}  # (group_id, user_id) -> newest membership change
+
+    for entry in entries:
+        kind = entry['kind']
+        payload = entry['payload']
+
+        if kind == 'group_member':
+            _keep_newest(members, (payload['group_id'], payload['user_id']), entry)
+            continue
+        secret_id = payload['secret_id']
+        if kind == 'share':
+            _keep_newest(shares, (secret_id, payload['target_user_id']), entry)
+            continue
+        if kind == 'group_share':
+            _keep_newest(shares, (secret_id, 'group:' + payload['group_id']), entry)
+            continue
+        _keep_newest(latest, (secret_id, kind), entry)
+
+    # Drop whatever each secret's newest delete supersedes
+    for (secret_id, kind), delete in list(latest.items()):
+        if kind != 'delete':
+            continue
+        for table in (latest, shares):
+            for key in [k for k, e in table.items()
+                        if k[0] == secret_id and e is not delete and not hlc.is_newer(_version(e), _version(delete))]:
+                del table[key]
+
+    survivors = list(latest.values()) + list(shares.values()) + list(members.values())
+    survivors.sort(key=lambda e: e['seq'])
+    return survivors
+
+class ReplicationLog:
+    """Append-only hint log per peer address, replayed in the background."""
+
+    def __init__(self, directory=REPLICATION_LOG_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pending = {}     # addr -> list of entries, in append order
+        self._replayers = {}   # addr -> replay thread
+        self._seq = 0
+        self._fanout = ThreadPoolExecutor(max_workers=REPLICATION_FANOUT_WORKERS,
+                                          thread_name_prefix="replication-fanout")
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, addr):
+        return os.path.join(self.directory, addr.replace(':', '_').replace('/', '_') + '.log')
+
+    def _load(self):
+        """Recover hints written before a restart and resume replaying them"""
+        for name in os.listdir(self.directory):
+            if not name.endswith('.log'):
+                continue
+            entries = []
+            with open(os.path.join(self.directory, name)) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break  # torn write at the tail; later lines are unusable
+            if not entries:
+                continue
+            addr = entries[0]['addr']
+            self._pending[addr] = entries
+            self._seq = max(self._seq, max(e['seq'] for e in entries))
+            log.info("Recovered pending mutations", peer=addr, pending=len(entries))
+            self._start_replayer(addr)
+
+    def has_pending(self, addr):
+        with self._lock:
+            return bool(self._pending.get(addr))
+
+    def pending_count(self, addr=None):
+        with self._lock:
+            if addr is not None:
+                return len(self._pending.get(addr, []))
+            return sum(len(entries) for entries in self._pending.values())
+
+    def backlog(self):
+        """{addr: (pending mutations, when the oldest was logged)}"""
+        with self._lock:
+            return {addr: (len(entries), min((e.get('ts') for e in entries if e.get('ts')), default=None))
+                    for addr, entries in self._pending.items() if entries}
+
+    def append(self, addr, kind, payload):
+        """Durably record a mutation that could not be delivered to addr"""
+        with self._lock:
+            self._seq += 1
+            entry = {'seq': self._seq, 'addr': addr, 'kind': kind, 'payload': payload, 'ts': time.time()}
+            with open(self._path(addr), 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending.setdefault(addr, []).append(entry)
+            self._start_replayer(addr)
+
+    def _rewrite(self, addr):
+        """Atomically replace a peer's log file with its in-memory pending list"""
+        entries = self._pending.get(addr, [])
+        path = self._path(addr)
+        if not entries:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _start_replayer(self, addr):
+        # Caller holds self._lock
+        thread = self._replayers.get(addr)
+        if thread and thread.is_alive():
+            return
+        thread = threading.Thread(target=self._replay, args=(addr,), daemon=True)
+        self._replayers[addr] = thread
+        thread.start()
+
+    def _replay(self, addr):
+        delay = RETRY_BASE_DELAY
+        while True:
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+            with self._lock:
+                pending = self._pending.get(addr, [])
+                compacted = compact(pending)
+                self._pending[addr] = compacted
+                # Retries during a long outage usually find nothing to compact
+                if len(compacted) < len(pending):
+                    self._rewrite(addr)
+                batch = list(compacted)
+
+            delivered, dropped = set(), set()
+            for entry in batch:
+                kind, payload = entry['kind'], entry['payload']
+                try:
+                    if send_mutation(addr, kind, payload):
+                        delivered.add(entry['seq'])
+                        continue
+                except grpc.RpcError as e:
+                    if e.code() in _RETRYABLE:
+                        break
+                    log.error("Peer rejected mutation, dropping it", peer=addr, code=e.code().name,
+                              kind=kind, secret_id=_subject(payload))
+                    dropped.add(entry['seq'])
+                    continue
+                # Received but not applied; later mutations may depend on it, so wait
+                entry['rejections'] = entry.get('rejections', 0) + 1
+                if entry['rejections'] < REPLICATION_MAX_REJECTIONS:
+                    break
+                log.error("Peer could not apply mutation, dropping it", peer=addr, kind=kind,
+                          secret_id=_subject(payload), attempts=entry['rejections'])
+                dropped.add(entry['seq'])
+
+            with self._lock:
+                done = delivered | dropped
+                remaining = [e for e in self._pending.get(addr, []) if e['seq'] not in done]
+                self._pending[addr] = remaining
+                if done:
+                    self._rewrite(addr)
+                if delivered:
+                    log.info("Replayed mutations", peer=addr, replayed=len(delivered), pending=len(remaining))
+                if not remaining:
+                    del self._pending[addr]
+                    del self._replayers[addr]
+                    return
+
+            if len(done) < len(batch):
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+            else:
+                delay = RETRY_BASE_DELAY
+
+    def deliver(self, addr, kind, payload):
+        """
+        Send a mutation to addr, or log it for later replay if the peer is
+        unreachable. While hints are pending for a peer, new mutations are
+        queued behind them so the peer sees them in order.
+        Returns True if the mutation was delivered now.
+        """
+        with tracing.span("replication.deliver", attributes={'peer': addr, 'kind': kind}) as span:
+            if self.has_pending(addr):
+                span.set_attribute('outcome', 'queued')
+                self.append(addr, kind, payload)
+                return False
+            try:
+                applied = send_mutation(addr, kind, payload)
+            except grpc.RpcError as e:
+                if e.code() not in _RETRYABLE:
+                    log.error("Peer rejected mutation", peer=addr, code=e.code().name,
+                              kind=kind, secret_id=_subject(payload))
+                    span.set_attribute('outcome', 'rejected')
+                    return False
+                log.warning("Peer unavailable, logging mutation", peer=addr, code=e.code().name,
+                            kind=kind, secret_id=_subject(payload))
+                span.set_attribute('outcome', 'hinted')
+                self.append(addr, kind, payload)
+                return False
+            if not applied:
+                log.warning("Peer could not apply mutation yet, logging it", peer=addr,
+                            kind=kind, secret_id=_subject(payload))
+                span.set_attribute('outcome', 'hinted')
+                self.append(addr, kind, payload)
+                return False
+            span.set_attribute('outcome', 'delivered')
+            return True
+
+    def submit_all(self, addrs, kind, payload):
+        """
+        Start delivering a mutation to every peer concurrently. Safe because
+        each mutation is versioned and peers apply last-writer-wins.
+        Returns {addr: Future of delivered_now}.
+        """
+        return {addr: self._fanout.submit(tracing.wrap(self.deliver), addr, kind, payload)
+                for addr in addrs if addr}
+
+# Shared by every service in the process. A single process first takes over
+# the logs a multi-worker run left in worker-<id>/ (the supervisor does the
+# same for its workers before starting them)
+if not prefork.WORKER_ID and not prefork.is_supervisor():
+    prefork.adopt_hints(REPLICATION_LOG_DIR, 1, log)
+hint_log = ReplicationLog()
+metrics.register_replication_log(hint_log)
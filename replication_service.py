@@ -1,12 +1,34 @@
 # replication_service.py
 # Microservice responsible for: Internal replication across nodes
-from concurrent import futures
 import grpc
 import os
 
 import vault_pb2
 import vault_pb2_grpc
+import prefork
+import logs
+import channels
+import metrics
+import profiling
+import tracing
 import shared_data
+import snapshot
+from hlc import clock
+from records import Secret, to_iso
+from snapshot import SNAPSHOT_CHUNK_RECORDS
+
+log = logs.get_logger("Replication")
+
+# Address of an existing node's Replication Service to copy data from on startup
+BOOTSTRAP_FROM = os.environ.get("BOOTSTRAP_FROM", "")
+
+def _chunk(is_delta, watermark, secrets, access, groups=None, tombstones=None):
+    return vault_pb2.SnapshotChunk(
+        is_delta=is_delta,
+        watermark=watermark,
+        payload=snapshot.encode_batch(secrets, access, groups, tombstones),
+        record_count=len(secrets) + len(access) + len(groups or ()) + len(tombstones or ())
+    )
 
 class ReplicationServiceImpl(vault_pb2_grpc.ReplicationServiceServicer):
     """
@@ -17,80 +39,190 @@ class ReplicationServiceImpl(vault_pb2_grpc.ReplicationServiceServicer):
     def ReplicateSecret(self, request, context):
         """Receive and store replicated secret from another node"""
         secret_id = request.secret_id
+        version = request.version or clock.now()
+        clock.observe(version)
 
-        shared_data.set_secret(secret_id, {
-            'user_id': request.user_id,
-            'secret_name': request.secret_name,
-            'data': request.data,
-            'created_at': request.created_at,
-            'updated_at': request.created_at
-        })
+        applied = shared_data.put_secret_if_newer(secret_id, Secret(
+            request.user_id, request.secret_name, request.data,
+            request.created_at, request.created_at, version
+        ))
 
-        print(f"[Replication] Replicated secret {secret_id} for user {request.user_id}")
+        if applied:
+            log.sampled("replication.applied", "Applied", action="add", secret_id=secret_id, user_id=request.user_id)
+        else:
+            log.sampled("replication.stale", "Ignored stale write", action="add", secret_id=secret_id, version=version)
 
         return vault_pb2.ReplicateSecretResponse(success=True)
 
     def ReplicateUpdate(self, request, context):
         """Receive and apply secret update from another node"""
         secret_id = request.secret_id
+        version = request.version or clock.now()
+        clock.observe(version)
 
         secret = shared_data.get_secret(secret_id)
         if not secret:
-            print(f"[Replication] Warning: Cannot update non-existent secret {secret_id}")
-            return vault_pb2.ReplicateUpdateResponse(success=False)
+            if not request.user_id:
+                log.warning("Cannot update non-existent secret", secret_id=secret_id)
+                return vault_pb2.ReplicateUpdateResponse(success=False)
+            # The add hasn't arrived yet; the update carries the whole record
+            secret = Secret(request.user_id, request.secret_name, '', request.created_at)
 
-        secret['data'] = request.data
-        secret['updated_at'] = request.updated_at
-        shared_data.set_secret(secret_id, secret)
+        secret = secret.replace(data=request.data, updated_at=request.updated_at, version=version)
 
-        print(f"[Replication] Replicated update for secret {secret_id}")
+        if shared_data.put_secret_if_newer(secret_id, secret):
+            log.sampled("replication.applied", "Applied", action="update", secret_id=secret_id)
+        else:
+            log.sampled("replication.stale", "Ignored stale write", action="update", secret_id=secret_id, version=version)
 
         return vault_pb2.ReplicateUpdateResponse(success=True)
 
     def ReplicateDeletion(self, request, context):
         """Receive and apply secret deletion from another node"""
         secret_id = request.secret_id
+        version = request.version or clock.now()
+        clock.observe(version)
 
-        shared_data.delete_secret(secret_id)
-        shared_data.delete_access_control(secret_id)
-        print(f"[Replication] Replicated deletion of secret {secret_id}")
+        shared_data.delete_secret_if_newer(secret_id, version)
+        log.sampled("replication.applied", "Applied", action="delete", secret_id=secret_id)
 
         return vault_pb2.ReplicateDeletionResponse(success=True)
 
     def ReplicateShare(self, request, context):
         """Receive and apply share operation from another node"""
         secret_id = request.secret_id
-        owner_id = request.owner_id
         target_user_id = request.target_user_id
+        version = request.version or clock.now()
+        clock.observe(version)
 
-        # Initialize access control entry if doesn't exist
-        access_control = shared_data.get_access_control(secret_id)
-        if not access_control:
-            access_control = {
-                'owner_id': owner_id,
-                'shared_with': []
-            }
-
-        # Add target user to shared list
-        if target_user_id not in access_control['shared_with']:
-            access_control['shared_with'].append(target_user_id)
-
-        shared_data.set_access_control(secret_id, access_control)
+        # Grants are merged as a set union; only a newer deletion rejects them
+        shared_data.merge_share(secret_id, request.owner_id, target_user_id, version)
 
-        print(f"[Replication] Replicated share of secret {secret_id} with user {target_user_id}")
+        log.sampled("replication.applied", "Applied", action="share", secret_id=secret_id, target_user_id=target_user_id)
 
         return vault_pb2.ReplicateShareResponse(success=True)
 
+    def ReplicateGroupShare(self, request, context):
+        """Receive and apply a share with a group from another node"""
+        secret_id = request.secret_id
+        version = request.version or clock.now()
+        clock.observe(version)
+
+        shared_data.merge_group_share(secret_id, request.owner_id, request.group_id, version)
+
+        log.sampled("replication.applied", "Applied", action="group_share", secret_id=secret_id, group_id=request.group_id)
+
+        return vault_pb2.ReplicateGroupShareResponse(success=True)
+
+    def ReplicateGroupMember(self, request, context):
+        """Receive and apply a group membership change from another node"""
+        group_id = request.group_id
+        version = request.version or clock.now()
+        clock.observe(version)
+
+        # Adds and removals of one member are merged last-writer-wins
+        if shared_data.merge_group_member(group_id, request.owner_id, request.user_id, request.member, version):
+            log.sampled("replication.applied", "Applied", action="group_member", group_id=group_id, user_id=request.user_id)
+        else:
+            log.sampled("replication.stale", "Ignored stale write", action="group_member", group_id=group_id, version=version)
+
+        return vault_pb2.ReplicateGroupMemberResponse(success=True)
+
+    def FetchSecret(self, request, context):
+        """Return this node's versioned copy of a secret, for quorum reads"""
+        version, secret = shared_data.get_secret_versioned(request.secret_id)
+        if secret is None:
+            return vault_pb2.FetchSecretResponse(found=False, version=version)
+        return vault_pb2.FetchSecretResponse(
+            found=True,
+            version=version,
+            user_id=secret.user_id,
+            secret_name=secret.secret_name,
+            data=secret.data,
+            created_at=to_iso(secret.created_at),
+            updated_at=to_iso(secret.updated_at)
+        )
+
+    def Snapshot(self, request, context):
+        """Stream this node's dataset, then the writes made since it was taken"""
+        since = request.since_watermark
+        delta = shared_data.changes_since(since) if since else None
+
+        if delta is None:
+            # Take the watermark first: anything written while scanning shows
+            # up again in the delta, and re-applying it is harmless.
+            since = shared_data.current_watermark()
+            sent = 0
+            for records in shared_data.iter_batches('secret', SNAPSHOT_CHUNK_RECORDS):
+                sent += len(records)
+                yield _chunk(False, since, records, {})
+            for records in shared_data.iter_batches('access', SNAPSHOT_CHUNK_RECORDS):
+                sent += len(records)
+                yield _chunk(False, since, {}, records)
+            for records in shared_data.iter_batches('group', SNAPSHOT_CHUNK_RECORDS):
+                sent += len(records)
+                yield _chunk(False, since, {}, {}, records)
+            for records in shared_data.iter_batches('tombstone', SNAPSHOT_CHUNK_RECORDS):
+                sent += len(records)
+                yield _chunk(False, since, {}, {}, tombstones=records)
+            log.info("Streamed snapshot", records=sent, watermark=since)
+
+            delta = shared_data.changes_since(since)
+            if delta is None:
+                context.abort(grpc.StatusCode.ABORTED,
+                              "Changelog trimmed during snapshot, retry")
+
+        keys, watermark = delta
+        secret_ids = sorted(secret_id for kind, secret_id in keys if kind == 'secret')
+        access_ids = sorted(secret_id for kind, secret_id in keys if kind == 'access')
+        group_ids = sorted(group_id for kind, group_id in keys if kind == 'group')
+        for i in range(0, max(len(secret_ids), len(access_ids), len(group_ids)), SNAPSHOT_CHUNK_RECORDS):
+            secrets = shared_data.get_many('secret', secret_ids[i:i + SNAPSHOT_CHUNK_RECORDS])
+            access = shared_data.get_many('access', access_ids[i:i + SNAPSHOT_CHUNK_RECORDS])
+            groups = shared_data.get_many('group', group_ids[i:i + SNAPSHOT_CHUNK_RECORDS])
+            # Deleted secrets carry their deletion version, so a late write can't revive them
+            tombstones = shared_data.get_many('tombstone', [sid for sid, secret in secrets.items() if secret is None])
+            yield _chunk(True, watermark, secrets, access, groups, tombstones)
+        log.info("Streamed delta", keys=len(keys), since=since)
+
+        yield vault_pb2.SnapshotChunk(is_delta=True, watermark=watermark, last=True)
+
+def bootstrap_from(addr, since_watermark=""):
+    """Copy another node's dataset into local storage. Returns the donor watermark."""
+    watermark = since_watermark
+    records = 0
+    with channels.create_channel(addr) as channel:
+        stub = vault_pb2_grpc.ReplicationServiceStub(channel)
+        for chunk in stub.Snapshot(vault_pb2.SnapshotRequest(since_watermark=since_watermark)):
+            if chunk.payload:
+                shared_data.apply_batch(*snapshot.decode_batch(chunk.payload))
+                records += chunk.record_count
+            watermark = chunk.watermark
+    log.info("Bootstrapped", records=records, source=addr, watermark=watermark)
+    return watermark
+
 def serve():
+    # Once, before any worker serves data written by an older version
+    shared_data.migrate_legacy_acls()
+    # Workers share the node's Redis; fill it before any of them serves
+    if BOOTSTRAP_FROM and not prefork.WORKER_ID:
+        bootstrap_from(BOOTSTRAP_FROM)
+    if prefork.is_supervisor():
+        return prefork.supervise("Replication")
+    tracing.set_service_name("Replication")
     port = os.environ.get("PORT", "50054")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = channels.create_server("Replication", 10,
+                                    interceptors=[metrics.ServerInterceptor(), tracing.ServerInterceptor()],
+                                    options=prefork.SERVER_OPTIONS)
     vault_pb2_grpc.add_ReplicationServiceServicer_to_server(
         ReplicationServiceImpl(), server
     )
     server.add_insecure_port(f'[::]:{port}')
-    print(f"[Replication] Service started on port {port}")
+    log.info("Service started", port=port)
     server.start()
-    server.wait_for_termination()
+    metrics.serve("Replication")
+    profiling.serve("Replication")
+    prefork.run(server, "Replication")
 
 if __name__ == '__main__':
     serve()
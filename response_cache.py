@@ -0,0 +1,134 @@
+# response_cache.py
+# Short-lived cache for gateway read responses, invalidated by writes
+#
+# Entries carry tags ("user", user_id) and ("secret", secret_id) naming
+# everything the response depends on, so a write can drop exactly the
+# responses it affects: updating a shared secret, for example, invalidates
+# the cached lists of every user the secret appears in. Gateways share
+# invalidations over a Redis pub/sub channel, so a write forwarded by one
+# gateway also clears the caches of the others.
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+import redis
+
+import logs
+import metrics
+
+log = logs.get_logger("CacheBus")
+
+class ResponseCache:
+    """TTL + LRU cache of responses, invalidated by tag"""
+
+    def __init__(self, name, ttl, max_entries=10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()       # key -> (expires_at, value, tags)
+        self._tagged = defaultdict(set)     # tag -> keys
+        self._epoch = 0                     # bumped by every invalidation
+        self._lock = threading.Lock()
+        self._hits = metrics.CACHE_LOOKUPS.labels(name, 'hit')
+        self._misses = metrics.CACHE_LOOKUPS.labels(name, 'miss')
+        self._invalidations = metrics.CACHE_INVALIDATIONS.labels(name)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @property
+    def epoch(self):
+        """Read before fetching a response and pass it to put()"""
+        with self._lock:
+            return self._epoch
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self._misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            self._hits.inc()
+            return entry[1]
+
+    def put(self, key, value, tags=(), epoch=None):
+        """
+        Cache value under key. If anything was invalidated since epoch was
+        read, the value may predate that write and is not cached.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._remove(key)
+            tags = frozenset(tags)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tagged[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._epoch += 1
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._remove(key)
+                    self._invalidations.inc()
+
+    def _remove(self, key):
+        # Caller holds self._lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+def tags_for(users=(), secrets=()):
+    return [('user', u) for u in users if u] + [('secret', s) for s in secrets if s]
+
+class InvalidationBus:
+    """Redis pub/sub channel over which gateways share cache invalidations"""
+
+    def __init__(self, host, channel, on_invalidate):
+        self.channel = channel
+        self.origin = str(uuid.uuid4())
+        self._on_invalidate = on_invalidate
+        self._redis = redis.Redis(host=host, port=6379, decode_responses=True)
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def publish(self, users=(), secrets=()):
+        message = json.dumps({'origin': self.origin, 'users': list(users), 'secrets': list(secrets)})
+        try:
+            self._redis.publish(self.channel, message)
+        except redis.RedisError as e:
+            log.warning("Failed to publish invalidation", error=str(e))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    event = json.loads(message['data'])
+                    if event.get('origin') != self.origin:
+                        self._on_invalidate(event.get('users', []), event.get('secrets', []))
+            except (redis.RedisError, ValueError) as e:
+                # Entries can be stale until their TTL while disconnected
+                log.warning("Subscription lost, reconnecting", error=str(e))
+                time.sleep(1)
@@ -1,70 +1,80 @@
 # secret_management_service.py
 # Microservice responsible for: Add Secret, Update Secret, Delete Secret
-from concurrent import futures
 import grpc
 import os
 import json
-import threading
-from datetime import datetime
 
 import vault_pb2
 import vault_pb2_grpc
+import prefork
+import logs
+import channels
+import metrics
+import profiling
+import tracing
+import quorum
+import records
 import shared_data
-
-# Replication service addresses
-REPLICATION_SERVICE_ADDRS = os.environ.get("REPLICATION_NODES", "").split(',')
-
-def replicate_secret(secret_id, user_id, secret_name, data, created_at):
+from deadlines import budget
+from hash_ring import ShardMap, parse_nodes
+from hlc import clock, NODE_ID
+from records import Secret
+from replication_log import hint_log
+
+log = logs.get_logger("SecretManagement")
+
+# Replication service addresses ("node_id=host:port" entries enable sharding,
+# see hash_ring.py). Each secret is sent only to the nodes that own it.
+replicas = ShardMap(parse_nodes(os.environ.get("REPLICATION_NODES", "")), local_node=NODE_ID)
+
+def _report(addr, delivered, action, secret_id):
+    if delivered:
+        log.sampled("secret.replicated", "Replicated", action=action, secret_id=secret_id, peer=addr)
+    else:
+        log.warning("Queued for unavailable peer", action=action, secret_id=secret_id, peer=addr)
+
+def _replicate(kind, action, payload, level, timeout):
+    """
+    Send a mutation to the secret's other replicas concurrently and wait
+    until level is met, for at most timeout seconds. Replicas that miss it
+    get it via hinted handoff.
+    Returns (acknowledged, required), counting the local write.
+    """
+    secret_id = payload['secret_id']
+    calls = hint_log.submit_all(replicas.owner_addrs(secret_id), kind, payload)
+    for addr, call in calls.items():
+        call.add_done_callback(lambda call, addr=addr: _report(addr, call.result(), action, secret_id))
+    return quorum.await_acks(calls, 1 if replicas.is_owner(secret_id) else 0, level, timeout)
+
+def replicate_secret(secret_id, user_id, secret_name, data, created_at, version, level=quorum.ONE,
+                     timeout=quorum.QUORUM_TIMEOUT):
     """Replicate secret to other nodes via Replication Service"""
-    for addr in REPLICATION_SERVICE_ADDRS:
-        if not addr:
-            continue
-        try:
-            with grpc.insecure_channel(addr) as channel:
-                stub = vault_pb2_grpc.ReplicationServiceStub(channel)
-                request = vault_pb2.ReplicateSecretRequest(
-                    secret_id=secret_id,
-                    user_id=user_id,
-                    secret_name=secret_name,
-                    data=data,
-                    created_at=created_at
-                )
-                stub.ReplicateSecret(request, timeout=2)
-                print(f"[SecretManagement] Replicated secret {secret_id} to {addr}")
-        except grpc.RpcError as e:
-            print(f"[SecretManagement] Failed to replicate to {addr}: {e}")
-
-def replicate_update(secret_id, data, updated_at):
+    return _replicate('secret', "secret", {
+        'secret_id': secret_id,
+        'user_id': user_id,
+        'secret_name': secret_name,
+        'data': data,
+        'created_at': created_at,
+        'version': version
+    }, level, timeout)
+
+def replicate_update(secret, secret_id, level=quorum.ONE, timeout=quorum.QUORUM_TIMEOUT):
     """Replicate secret update to other nodes"""
-    for addr in REPLICATION_SERVICE_ADDRS:
-        if not addr:
-            continue
-        try:
-            with grpc.insecure_channel(addr) as channel:
-                stub = vault_pb2_grpc.ReplicationServiceStub(channel)
-                request = vault_pb2.ReplicateUpdateRequest(
-                    secret_id=secret_id,
-                    data=data,
-                    updated_at=updated_at
-                )
-                stub.ReplicateUpdate(request, timeout=2)
-                print(f"[SecretManagement] Replicated update {secret_id} to {addr}")
-        except grpc.RpcError as e:
-            print(f"[SecretManagement] Failed to replicate update to {addr}: {e}")
-
-def replicate_deletion(secret_id):
+    return _replicate('update', "update", dict(secret.to_dict(), secret_id=secret_id), level, timeout)
+
+def replicate_deletion(secret_id, version, level=quorum.ONE, timeout=quorum.QUORUM_TIMEOUT):
     """Replicate secret deletion to other nodes"""
-    for addr in REPLICATION_SERVICE_ADDRS:
-        if not addr:
-            continue
-        try:
-            with grpc.insecure_channel(addr) as channel:
-                stub = vault_pb2_grpc.ReplicationServiceStub(channel)
-                request = vault_pb2.ReplicateDeletionRequest(secret_id=secret_id)
-                stub.ReplicateDeletion(request, timeout=2)
-                print(f"[SecretManagement] Replicated deletion {secret_id} to {addr}")
-        except grpc.RpcError as e:
-            print(f"[SecretManagement] Failed to replicate deletion to {addr}: {e}")
+    return _replicate('delete', "deletion", {
+        'secret_id': secret_id,
+        'version': version
+    }, level, timeout)
+
+def _level_not_met(context, level, acked, needed):
+    """Flag a write that was applied but not acknowledged by enough replicas"""
+    message = f"Consistency level {level} not met: {acked} of {needed} replicas acknowledged"
+    context.set_code(grpc.StatusCode.UNAVAILABLE)
+    context.set_details(message)
+    return message
 
 class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer):
 
@@ -72,25 +82,39 @@ class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer
         """Requirement 1: Add Secret"""
         import uuid
 
-        secret_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow().isoformat()
+        # The gateway assigns the id in sharded mode so it can route by it
+        secret_id = request.secret_id or str(uuid.uuid4())
+        if request.secret_id and shared_data.get_secret(secret_id):
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Secret already exists")
+            return vault_pb2.AddSecretResponse(
+                secret_id=secret_id,
+                message="Secret already exists",
+                success=False
+            )
+
+        timestamp = records.now()
+        version = clock.now()
 
-        # Store secret locally
-        shared_data.set_secret(secret_id, {
-            'user_id': request.user_id,
-            'secret_name': request.secret_name,
-            'data': request.data,
-            'created_at': timestamp,
-            'updated_at': timestamp
-        })
+        # Store secret locally, unless sharding places it on other nodes only
+        if replicas.is_owner(secret_id):
+            shared_data.put_secret_if_newer(secret_id, Secret(
+                request.user_id, request.secret_name, request.data, timestamp, timestamp, version
+            ))
 
-        print(f"[SecretManagement] Added secret {secret_id} for user {request.user_id}")
+        log.sampled("secret.added", "Added secret", secret_id=secret_id, user_id=request.user_id)
 
-        # Replicate in background
-        threading.Thread(
-            target=replicate_secret,
-            args=(secret_id, request.user_id, request.secret_name, request.data, timestamp)
-        ).start()
+        # Replicate, waiting for as many replicas as the consistency level needs
+        level = quorum.from_proto(request.consistency, quorum.WRITE_CONSISTENCY)
+        acked, needed = replicate_secret(secret_id, request.user_id, request.secret_name,
+                                         request.data, records.to_iso(timestamp), version, level,
+                                         budget(context, quorum.QUORUM_TIMEOUT))
+        if acked < needed:
+            return vault_pb2.AddSecretResponse(
+                secret_id=secret_id,
+                message=_level_not_met(context, level, acked, needed),
+                success=False
+            )
 
         return vault_pb2.AddSecretResponse(
             secret_id=secret_id,
@@ -113,7 +137,7 @@ class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer
             )
 
         # Verify ownership
-        if secret['user_id'] != request.user_id:
+        if secret.user_id != request.user_id:
             context.set_code(grpc.StatusCode.PERMISSION_DENIED)
             context.set_details("Not authorized to update this secret")
             return vault_pb2.UpdateSecretResponse(
@@ -123,18 +147,22 @@ class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer
             )
 
         # Update secret
-        timestamp = datetime.utcnow().isoformat()
-        secret['data'] = request.data
-        secret['updated_at'] = timestamp
-        shared_data.set_secret(secret_id, secret)
+        clock.observe(secret.version)
+        secret = secret.replace(data=request.data, updated_at=records.now(), version=clock.now())
+        shared_data.put_secret_if_newer(secret_id, secret)
 
-        print(f"[SecretManagement] Updated secret {secret_id}")
+        log.sampled("secret.updated", "Updated secret", secret_id=secret_id)
 
         # Replicate update
-        threading.Thread(
-            target=replicate_update,
-            args=(secret_id, request.data, timestamp)
-        ).start()
+        level = quorum.from_proto(request.consistency, quorum.WRITE_CONSISTENCY)
+        acked, needed = replicate_update(secret, secret_id, level,
+                                         budget(context, quorum.QUORUM_TIMEOUT))
+        if acked < needed:
+            return vault_pb2.UpdateSecretResponse(
+                secret_id=secret_id,
+                message=_level_not_met(context, level, acked, needed),
+                success=False
+            )
 
         return vault_pb2.UpdateSecretResponse(
             secret_id=secret_id,
@@ -157,7 +185,7 @@ class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer
             )
 
         # Verify ownership
-        if secret['user_id'] != request.user_id:
+        if secret.user_id != request.user_id:
             context.set_code(grpc.StatusCode.PERMISSION_DENIED)
             context.set_details("Not authorized to delete this secret")
             return vault_pb2.DeleteSecretResponse(
@@ -167,14 +195,21 @@ class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer
             )
 
         # Delete secret
-        shared_data.delete_secret(secret_id)
-        print(f"[SecretManagement] Deleted secret {secret_id}")
+        clock.observe(secret.version)
+        version = clock.now()
+        shared_data.delete_secret_if_newer(secret_id, version)
+        log.sampled("secret.deleted", "Deleted secret", secret_id=secret_id)
 
         # Replicate deletion
-        threading.Thread(
-            target=replicate_deletion,
-            args=(secret_id,)
-        ).start()
+        level = quorum.from_proto(request.consistency, quorum.WRITE_CONSISTENCY)
+        acked, needed = replicate_deletion(secret_id, version, level,
+                                           budget(context, quorum.QUORUM_TIMEOUT))
+        if acked < needed:
+            return vault_pb2.DeleteSecretResponse(
+                secret_id=secret_id,
+                message=_level_not_met(context, level, acked, needed),
+                success=False
+            )
 
         return vault_pb2.DeleteSecretResponse(
             secret_id=secret_id,
@@ -183,15 +218,24 @@ class SecretManagementServiceImpl(vault_pb2_grpc.SecretManagementServiceServicer
         )
 
 def serve():
+    # Once, before any worker serves data written by an older version
+    shared_data.migrate_legacy_acls()
+    if prefork.is_supervisor():
+        return prefork.supervise("SecretManagement")
+    tracing.set_service_name("SecretManagement")
     port = os.environ.get("PORT", "50051")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = channels.create_server("SecretManagement", 10,
+                                    interceptors=[metrics.ServerInterceptor(), tracing.ServerInterceptor()],
+                                    options=prefork.SERVER_OPTIONS)
     vault_pb2_grpc.add_SecretManagementServiceServicer_to_server(
         SecretManagementServiceImpl(), server
     )
     server.add_insecure_port(f'[::]:{port}')
-    print(f"[SecretManagement] Service started on port {port}")
+    log.info("Service started", port=port)
     server.start()
-    server.wait_for_termination()
+    metrics.serve("SecretManagement")
+    profiling.serve("SecretManagement")
+    prefork.run(server, "SecretManagement")
 
 if __name__ == '__main__':
     serve()
@@ -6,35 +6,107 @@ import os
 
 import vault_pb2
 import vault_pb2_grpc
+import prefork
+import logs
+import metrics
+import profiling
+import tracing
+import channels
+import quorum
 import shared_data
+import singleflight
+from deadlines import budget
+from records import Secret, to_iso
+from hash_ring import ShardMap, parse_nodes
+from hlc import NODE_ID
+from replication_log import hint_log, REPLICATION_FANOUT_WORKERS, REPLICATION_TIMEOUT
+
+log = logs.get_logger("SecretRetrieval")
 
 # Access Control Service address (to check permissions)
 ACCESS_CONTROL_SERVICE_ADDR = os.environ.get("ACCESS_CONTROL_ADDR", "")
-
-def check_access(user_id, secret_id):
+ACCESS_CHECK_TIMEOUT = 2
+
+# Replication service addresses of the other replicas, consulted by reads
+# above consistency level ONE
+replicas = ShardMap(parse_nodes(os.environ.get("REPLICATION_NODES", "")), local_node=NODE_ID)
+fetch_pool = futures.ThreadPoolExecutor(max_workers=REPLICATION_FANOUT_WORKERS,
+                                        thread_name_prefix="quorum-read")
+
+# Concurrent identical reads and access checks share one fetch, so a burst
+# of clients reading the same secret costs one round of backend calls
+inflight = singleflight.Group("SecretRetrieval")
+
+def fetch_secret(addr, secret_id, timeout=REPLICATION_TIMEOUT):
+    """Read a replica's (version, secret) through its Replication Service"""
+    stub = channels.get_stub(vault_pb2_grpc.ReplicationServiceStub, addr)
+    response = stub.FetchSecret(vault_pb2.FetchSecretRequest(secret_id=secret_id),
+                                timeout=timeout)
+    if not response.found:
+        return response.version, None
+    return response.version, Secret(response.user_id, response.secret_name, response.data,
+                                    response.created_at, response.updated_at, response.version)
+
+def read_repair(secret_id, version, secret, stale):
+    """Bring replicas that answered with an older version up to date"""
+    if secret is None:
+        kind, payload = 'delete', {'secret_id': secret_id, 'version': version}
+    else:
+        kind, payload = 'update', dict(secret.to_dict(), secret_id=secret_id)
+    if replicas.local_node in stale:
+        if secret is None:
+            shared_data.delete_secret_if_newer(secret_id, version)
+        else:
+            shared_data.put_secret_if_newer(secret_id, secret)
+    hint_log.submit_all([addr for addr in stale if addr != replicas.local_node], kind, payload)
+    log.info("Read repair", secret_id=secret_id, version=version, stale_replicas=len(stale))
+
+def read_secret(secret_id, level, timeout=quorum.QUORUM_TIMEOUT):
+    """
+    Read a secret from as many replicas as level requires, waiting at most
+    timeout seconds, and return the newest copy (None if missing or
+    deleted), repairing stale replicas. Raises LookupError if not enough
+    replicas answered.
+    """
+    responses = {}
+    if replicas.is_owner(secret_id):
+        responses[replicas.local_node] = shared_data.get_secret_versioned(secret_id)
+    addrs = replicas.owner_addrs(secret_id)
+    needed = quorum.required(level, len(addrs) + len(responses))
+    if len(responses) < needed:
+        calls = {addr: fetch_pool.submit(tracing.wrap(fetch_secret), addr, secret_id, timeout) for addr in addrs}
+        responses.update(quorum.collect(calls, needed - len(responses), timeout))
+    if len(responses) < needed:
+        raise LookupError(f"Consistency level {level} not met: "
+                          f"{len(responses)} of {needed} replicas answered")
+
+    version, secret, stale = quorum.resolve(responses)
+    if stale:
+        read_repair(secret_id, version, secret, stale)
+    return secret
+
+def check_access(user_id, secret_id, timeout=ACCESS_CHECK_TIMEOUT):
     """Check if user has access to a secret via Access Control Service"""
     if not ACCESS_CONTROL_SERVICE_ADDR:
         # Fallback: check locally
         secret = shared_data.get_secret(secret_id)
         if secret:
-            if secret['user_id'] == user_id:
+            if secret.user_id == user_id:
                 return True
-            access_control = shared_data.get_access_control(secret_id)
-            if access_control and user_id in access_control.get('shared_with', []):
+            if shared_data.is_shared_with(secret_id, user_id):
                 return True
         return False
 
     try:
-        with grpc.insecure_channel(ACCESS_CONTROL_SERVICE_ADDR) as channel:
-            stub = vault_pb2_grpc.AccessControlServiceStub(channel)
-            request = vault_pb2.CheckAccessRequest(user_id=user_id, secret_id=secret_id)
-            response = stub.CheckAccess(request, timeout=2)
-            return response.has_access
+        stub = channels.get_stub(vault_pb2_grpc.AccessControlServiceStub, ACCESS_CONTROL_SERVICE_ADDR)
+        request = vault_pb2.CheckAccessRequest(user_id=user_id, secret_id=secret_id)
+        response = stub.CheckAccess(request, timeout=timeout)
+        return response.has_access
     except grpc.RpcError as e:
-        print(f"[SecretRetrieval] Error checking access: {e}")
+        log.warning("Error checking access", code=e.code().name, error=e.details())
         # Fallback to local check
         secret = shared_data.get_secret(secret_id)
-        return secret and secret['user_id'] == user_id
+        return secret and secret.user_id == user_id
 
 class SecretRetrievalServiceImpl(vault_pb2_grpc.SecretRetrievalServiceServicer):
 
@@ -43,7 +115,21 @@ class SecretRetrievalServiceImpl(vault_pb2_grpc.SecretRetrievalServiceServicer):
         secret_id = request.secret_id
         user_id = request.user_id
 
-        secret = shared_data.get_secret(secret_id)
+        level = quorum.from_proto(request.consistency, quorum.READ_CONSISTENCY)
+        timeout = budget(context, quorum.QUORUM_TIMEOUT)
+        try:
+            secret = inflight.do(('read', secret_id, level), read_secret,
+                                 secret_id, level, timeout, timeout=timeout)
+        except (LookupError, TimeoutError) as e:
+            code = grpc.StatusCode.DEADLINE_EXCEEDED if isinstance(e, TimeoutError) else grpc.StatusCode.UNAVAILABLE
+            context.set_code(code)
+            context.set_details(str(e))
+            return vault_pb2.RetrieveSecretResponse(
+                secret_id=secret_id,
+                data="",
+                success=False
+            )
+
         if not secret:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details("Secret not found")
@@ -54,7 +140,7 @@ class SecretRetrievalServiceImpl(vault_pb2_grpc.SecretRetrievalServiceServicer):
             )
 
         # Check access permission
-        if not check_access(user_id, secret_id):
+        if secret.user_id != user_id and not self._check_access(user_id, secret_id, context):
             context.set_code(grpc.StatusCode.PERMISSION_DENIED)
             context.set_details("Not authorized to access this secret")
             return vault_pb2.RetrieveSecretResponse(
@@ -63,41 +149,40 @@ class SecretRetrievalServiceImpl(vault_pb2_grpc.SecretRetrievalServiceServicer):
                 success=False
             )
 
-        print(f"[SecretRetrieval] Retrieved secret {secret_id} for user {user_id}")
+        log.sampled("secret.retrieved", "Retrieved secret", secret_id=secret_id, user_id=user_id)
 
         return vault_pb2.RetrieveSecretResponse(
             secret_id=secret_id,
-            data=secret['data'],
+            data=secret.data,
             success=True
         )
 
+    def _check_access(self, user_id, secret_id, context):
+        timeout = budget(context, ACCESS_CHECK_TIMEOUT)
+        try:
+            return inflight.do(('access', user_id, secret_id), check_access,
+                               user_id, secret_id, timeout, timeout=timeout)
+        except TimeoutError:
+            return False
+
     def ListSecrets(self, request, context):
         """Requirement 4: List Secrets (metadata only)"""
         user_id = request.user_id
         user_secrets = []
 
-        # Find all secrets owned by or shared with the user
-        for secret_id, secret in shared_data.get_all_secrets().items():
-            # Check if user is owner
-            is_owner = secret['user_id'] == user_id
-
-            # Check if secret is shared with user
-            is_shared = False
-            access_control = shared_data.get_access_control(secret_id)
-            if access_control:
-                is_shared = user_id in access_control.get('shared_with', [])
-
-            if is_owner or is_shared:
-                metadata = vault_pb2.SecretMetadata(
-                    secret_id=secret_id,
-                    secret_name=secret['secret_name'],
-                    created_at=secret['created_at'],
-                    updated_at=secret['updated_at'],
-                    is_shared=is_shared
-                )
-                user_secrets.append(metadata)
-
-        print(f"[SecretRetrieval] Listed {len(user_secrets)} secrets for user {user_id}")
+        # Find all secrets owned by or shared with the user (through the
+        # per-user indexes, not a scan of every secret)
+        for secret_id, (secret, is_shared) in shared_data.list_user_secrets(user_id).items():
+            metadata = vault_pb2.SecretMetadata(
+                secret_id=secret_id,
+                secret_name=secret.secret_name,
+                created_at=to_iso(secret.created_at),
+                updated_at=to_iso(secret.updated_at),
+                is_shared=is_shared
+            )
+            user_secrets.append(metadata)
+
+        log.sampled("secret.listed", "Listed secrets", count=len(user_secrets), user_id=user_id)
 
         return vault_pb2.ListSecretsResponse(
             secrets=user_secrets,
@@ -105,15 +190,24 @@ class SecretRetrievalServiceImpl(vault_pb2_grpc.SecretRetrievalServiceServicer):
         )
 
 def serve():
+    # Once, before any worker serves data written by an older version
+    shared_data.migrate_legacy_acls()
+    if prefork.is_supervisor():
+        return prefork.supervise("SecretRetrieval")
+    tracing.set_service_name("SecretRetrieval")
     port = os.environ.get("PORT", "50052")
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = channels.create_server("SecretRetrieval", 10,
+                                    interceptors=[metrics.ServerInterceptor(), tracing.ServerInterceptor()],
+                                    options=prefork.SERVER_OPTIONS)
     vault_pb2_grpc.add_SecretRetrievalServiceServicer_to_server(
         SecretRetrievalServiceImpl(), server
     )
     server.add_insecure_port(f'[::]:{port}')
-    print(f"[SecretRetrieval] Service started on port {port}")
+    log.info("Service started", port=port)
     server.start()
-    server.wait_for_termination()
+    metrics.serve("SecretRetrieval")
+    profiling.serve("SecretRetrieval")
+    prefork.run(server, "SecretRetrieval")
 
 if __name__ == '__main__':
     serve()
@@ -2,31 +2,164 @@
 import redis
 import json
 import os
+from collections import Counter
+
+import hlc
+import logs
+import metrics
+import tracing
+from records import Access, Group, Secret
 
 # Get Redis host from environment variable, default to localhost for local testing
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 
 # Connect to the Redis container. 'redis' is the hostname inside Docker's network.
 # decode_responses=True makes it return strings instead of bytes.
-r = redis.Redis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
-print(f"[SharedData] Connecting to Redis at {REDIS_HOST}")
+# Each command's round trip is timed for the metrics endpoint.
+r = metrics.InstrumentedRedis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
+logs.get_logger("SharedData").info("Connecting to Redis", host=REDIS_HOST)
+
+# Every write also appends the changed key to a capped Redis stream. The
+# stream entry id is the node's sequence watermark for snapshots and deltas.
+CHANGELOG_KEY = "changelog"
+CHANGELOG_MAXLEN = int(os.environ.get("CHANGELOG_MAXLEN", "100000"))
+
+# Deleted secrets leave a tombstone holding the deletion's version, so a
+# stale add/update/share that arrives late can't resurrect them.
+TOMBSTONE_TTL = int(os.environ.get("TOMBSTONE_TTL", str(7 * 24 * 3600)))
+
+# Each call below is a span of the request's trace: one Redis round trip,
+# pipeline or transaction
+redis_call = tracing.traced(kind=tracing.CLIENT, attributes={'db.system': 'redis'})
+
+# Secrets are stored as their record's JSON dict form (see records.py) and
+# returned as records.Secret / records.Access.
+#
+# An access control entry is split in two: access:{id} holds the JSON
+# {owner_id, version} and acl_users:{id} is a SET of the users it is shared
+# with, so granting or checking one user is O(1) however many it is shared
+# with. Two reverse indexes, SETs of secret ids, make listing a user's
+# secrets O(k) in what they can see instead of a scan of every secret:
+# user_owns:{user_id} and user_shared:{user_id}. Index entries that a
+# snapshot batch leaves behind are checked against the records when read.
+# Data written before the split is moved over by migrate_legacy_acls(),
+# which every service runs on startup.
+#
+# Secrets can also be shared with groups (see the Groups section below):
+# acl_groups:{id} is the SET of groups granted, and acl_group_users:{id} a
+# HASH counting, per user, how many of those groups they are in. It is kept
+# up to date as grants and memberships change, so checking a user's access
+# through groups is one HGET, whatever the number and size of the groups.
+def _dumps(record):
+    return json.dumps(record.to_dict())
+
+def _load_secret(value):
+    return Secret.from_dict(json.loads(value)) if value else None
+
+def _load_access(value, members, groups=()):
+    if not value:
+        return None
+    header = json.loads(value)
+    # Entries written before the split still carry their members inline
+    return Access(header.get('owner_id'), [*header.get('shared_with', ()), *members], header.get('version'), groups)
+
+def _acl_header(owner_id, version):
+    return json.dumps({'owner_id': owner_id, 'version': version or ''})
+
+def _move_inline_members(pipe, secret_id, header):
+    """Move the members of an entry written before the split into its SET"""
+    for user_id in header.get('shared_with', ()):
+        pipe.sadd(_members_key(secret_id), user_id)
+        pipe.sadd(_shared_key(user_id), secret_id)
+
+def _members_key(secret_id):
+    return f"acl_users:{secret_id}"
+
+def _acl_groups_key(secret_id):
+    return f"acl_groups:{secret_id}"
+
+def _expansion_key(secret_id):
+    return f"acl_group_users:{secret_id}"
+
+def _owned_key(user_id):
+    return f"user_owns:{user_id}"
+
+def _shared_key(user_id):
+    return f"user_shared:{user_id}"
+
+def _group_key(group_id):
+    return f"group:{group_id}"
+
+def _group_members_key(group_id):
+    return f"group_members:{group_id}"
+
+def _group_removed_key(group_id):
+    return f"group_removed:{group_id}"
+
+def _group_secrets_key(group_id):
+    return f"group_secrets:{group_id}"
+
+def _user_groups_key(user_id):
+    return f"user_groups:{user_id}"
+
+def _write_access(pipe, secret_id, access):
+    """
+    Replace an ACL: its header, its member and group SETs and their reverse
+    index entries. The group expansion is left to _rebuild_expansions().
+    """
+    members, groups = _members_key(secret_id), _acl_groups_key(secret_id)
+    pipe.set(f"access:{secret_id}", _acl_header(access.owner_id, access.version))
+    pipe.delete(members, groups)
+    if access.shared_with:
+        pipe.sadd(members, *access.shared_with)
+        for user_id in access.shared_with:
+            pipe.sadd(_shared_key(user_id), secret_id)
+    if access.groups:
+        pipe.sadd(groups, *access.groups)
+        for group_id in access.groups:
+            pipe.sadd(_group_secrets_key(group_id), secret_id)
+
+def _delete_access(pipe, secret_id, members=(), groups=()):
+    pipe.delete(f"access:{secret_id}", _members_key(secret_id),
+                _acl_groups_key(secret_id), _expansion_key(secret_id))
+    for user_id in members:
+        pipe.srem(_shared_key(user_id), secret_id)
+    for group_id in groups:
+        pipe.srem(_group_secrets_key(group_id), secret_id)
+
+def _log_change(pipe, kind, secret_id):
+    pipe.xadd(CHANGELOG_KEY, {'kind': kind, 'id': secret_id},
+              maxlen=CHANGELOG_MAXLEN, approximate=True)
 
 
 # --- Secrets Database Functions ---
 
+@redis_call
 def get_secret(secret_id):
     """Get a secret from Redis"""
-    secret_json = r.get(f"secret:{secret_id}")
-    return json.loads(secret_json) if secret_json else None
+    return _load_secret(r.get(f"secret:{secret_id}"))
 
-def set_secret(secret_id, secret_data):
-    """Store a secret in Redis. Convert dict to JSON string."""
-    r.set(f"secret:{secret_id}", json.dumps(secret_data))
+@redis_call
+def set_secret(secret_id, secret):
+    """Store a secret in Redis. Convert the record to a JSON string."""
+    pipe = r.pipeline()
+    pipe.set(f"secret:{secret_id}", _dumps(secret))
+    pipe.sadd(_owned_key(secret.user_id), secret_id)
+    _log_change(pipe, 'secret', secret_id)
+    pipe.execute()
 
+@redis_call
 def delete_secret(secret_id):
     """Delete a secret from Redis"""
-    r.delete(f"secret:{secret_id}")
+    secret = get_secret(secret_id)
+    pipe = r.pipeline()
+    pipe.delete(f"secret:{secret_id}")
+    if secret:
+        pipe.srem(_owned_key(secret.user_id), secret_id)
+    _log_change(pipe, 'secret', secret_id)
+    pipe.execute()
 
+@redis_call
 def get_all_secrets():
     """Get all secrets from Redis (less efficient, for listing)"""
     all_secrets = {}
@@ -38,23 +171,530 @@ def get_all_secrets():
 
 # --- Access Control Database Functions ---
 
+@redis_call
 def get_access_control(secret_id):
     """Get access control info from Redis"""
-    access_json = r.get(f"access:{secret_id}")
-    return json.loads(access_json) if access_json else None
+    pipe = r.pipeline()
+    pipe.get(f"access:{secret_id}")
+    pipe.smembers(_members_key(secret_id))
+    pipe.smembers(_acl_groups_key(secret_id))
+    return _load_access(*pipe.execute())
 
-def set_access_control(secret_id, access_data):
+@redis_call
+def set_access_control(secret_id, access):
     """Set access control info in Redis"""
-    r.set(f"access:{secret_id}", json.dumps(access_data))
+    pipe = r.pipeline()
+    _write_access(pipe, secret_id, access)
+    _log_change(pipe, 'access', secret_id)
+    pipe.execute()
+    _rebuild_expansions([secret_id])
 
+@redis_call
 def delete_access_control(secret_id):
     """Delete access control info from Redis"""
-    r.delete(f"access:{secret_id}")
+    pipe = r.pipeline()
+    pipe.smembers(_members_key(secret_id))
+    pipe.smembers(_acl_groups_key(secret_id))
+    members, groups = pipe.execute()
+    pipe = r.pipeline()
+    _delete_access(pipe, secret_id, members, groups)
+    _log_change(pipe, 'access', secret_id)
+    pipe.execute()
+
+def _granted(shared, group_count):
+    return bool(shared) or int(group_count or 0) > 0
+
+@redis_call
+def is_shared_with(secret_id, user_id):
+    """
+    True if the secret is shared with user_id, directly or through a group:
+    one round trip of two O(1) lookups
+    """
+    pipe = r.pipeline()
+    pipe.sismember(_members_key(secret_id), user_id)
+    pipe.hget(_expansion_key(secret_id), user_id)
+    return _granted(*pipe.execute())
 
+@redis_call
+def list_user_secrets(user_id):
+    """
+    Secrets user_id owns or that are shared with them, directly or through
+    a group, as {secret_id: (secret, is_shared)}. A few round trips, O(k)
+    in the number of such secrets.
+    """
+    pipe = r.pipeline()
+    pipe.smembers(_owned_key(user_id))
+    pipe.smembers(_shared_key(user_id))
+    pipe.smembers(_user_groups_key(user_id))
+    owned, shared, groups = pipe.execute()
+    candidates = owned | shared
+    if groups:
+        candidates |= r.sunion([_group_secrets_key(group_id) for group_id in groups])
+    if not candidates:
+        return {}
+    candidates = sorted(candidates)
+    pipe = r.pipeline()
+    pipe.mget([f"secret:{secret_id}" for secret_id in candidates])
+    for secret_id in candidates:
+        pipe.sismember(_members_key(secret_id), user_id)
+        pipe.hget(_expansion_key(secret_id), user_id)
+    values, *lookups = pipe.execute()
+    result = {}
+    for i, (secret_id, value) in enumerate(zip(candidates, values)):
+        secret = _load_secret(value)
+        is_shared = _granted(lookups[2 * i], lookups[2 * i + 1])
+        if secret and (secret.user_id == user_id or is_shared):
+            result[secret_id] = (secret, is_shared)
+    return result
+
+@redis_call
 def get_all_access_controls():
     """Get all access control data from Redis"""
     all_access = {}
     for key in r.scan_iter("access:*"):
         secret_id = key.split(":", 1)[1]
         all_access[secret_id] = get_access_control(secret_id)
-    return all_access
\ No newline at end of file
+    return all_access
+
+
+# --- Versioned (last-writer-wins) Functions ---
+# Each runs as a WATCH/MULTI transaction so the version check and the write
+# are atomic with respect to other writers of the same secret.
+
+def _version_of(record_json):
+    return json.loads(record_json).get('version', '') if record_json else ''
+
+@redis_call
+def get_secret_versioned(secret_id):
+    """
+    Return (version, secret) for quorum reads. secret is None if the secret
+    is missing or deleted, in which case version is the deletion's, if any.
+    """
+    secret_json, tombstone = r.mget(f"secret:{secret_id}", f"tombstone:{secret_id}")
+    if secret_json:
+        secret = _load_secret(secret_json)
+        return secret.version, secret
+    return tombstone or '', None
+
+@redis_call
+def put_secret_if_newer(secret_id, secret):
+    """
+    Store a secret unless a newer version, or a newer deletion, is already
+    recorded. Returns True if the secret was written.
+    """
+    key, tombstone = f"secret:{secret_id}", f"tombstone:{secret_id}"
+
+    def write(pipe):
+        latest = max(_version_of(pipe.get(key)), pipe.get(tombstone) or '')
+        if not hlc.is_newer(secret.version, latest):
+            return False
+        pipe.multi()
+        pipe.set(key, _dumps(secret))
+        pipe.sadd(_owned_key(secret.user_id), secret_id)
+        _log_change(pipe, 'secret', secret_id)
+        return True
+
+    return r.transaction(write, key, tombstone, value_from_callable=True)
+
+@redis_call
+def delete_secret_if_newer(secret_id, version):
+    """
+    Delete a secret and its access control entry as of version, leaving a
+    tombstone. Writes newer than the deletion are kept. Returns True if applied.
+    """
+    key, access_key, tombstone = f"secret:{secret_id}", f"access:{secret_id}", f"tombstone:{secret_id}"
+    members_key, groups_key = _members_key(secret_id), _acl_groups_key(secret_id)
+
+    def write(pipe):
+        if not hlc.is_newer(version, pipe.get(tombstone)):
+            return False
+        secret = _load_secret(pipe.get(key))
+        secret_newer = secret is not None and hlc.is_newer(secret.version, version)
+        access_newer = hlc.is_newer(_version_of(pipe.get(access_key)), version)
+        members = pipe.smembers(members_key) if not access_newer else ()
+        groups = pipe.smembers(groups_key) if not access_newer else ()
+        pipe.multi()
+        pipe.set(tombstone, version, ex=TOMBSTONE_TTL)
+        if not secret_newer:
+            pipe.delete(key)
+            if secret:
+                pipe.srem(_owned_key(secret.user_id), secret_id)
+            _log_change(pipe, 'secret', secret_id)
+        if not access_newer:
+            _delete_access(pipe, secret_id, members, groups)
+            _log_change(pipe, 'access', secret_id)
+        return True
+
+    return r.transaction(write, key, access_key, members_key, groups_key, tombstone, value_from_callable=True)
+
+@redis_call
+def merge_share(secret_id, owner_id, target_user_id, version):
+    """
+    Add target_user_id to a secret's access list. Grants only ever grow, so
+    merging is order-independent; the only thing that can reject a share is a
+    newer deletion of the secret. Returns True if the entry changed.
+    """
+    key, members_key, tombstone = f"access:{secret_id}", _members_key(secret_id), f"tombstone:{secret_id}"
+
+    def write(pipe):
+        if not hlc.is_newer(version, pipe.get(tombstone)):
+            return False
+        current = pipe.get(key)
+        header = json.loads(current) if current else {'owner_id': owner_id}
+        inline = header.get('shared_with', [])
+        changed = target_user_id not in inline and not pipe.sismember(members_key, target_user_id)
+        newer = hlc.is_newer(version, header.get('version'))
+        if not (changed or newer or inline):
+            return False
+        pipe.multi()
+        pipe.set(key, _acl_header(header['owner_id'], version if newer else header.get('version')))
+        _move_inline_members(pipe, secret_id, header)
+        if changed:
+            pipe.sadd(members_key, target_user_id)
+            pipe.sadd(_shared_key(target_user_id), secret_id)
+        _log_change(pipe, 'access', secret_id)
+        return changed
+
+    return r.transaction(write, key, members_key, tombstone, value_from_callable=True)
+
+@redis_call
+def merge_group_share(secret_id, owner_id, group_id, version):
+    """
+    Share a secret with every current and future member of a group. Like
+    merge_share, grants only grow and a newer deletion of the secret rejects
+    the share. Returns True if the entry changed.
+    """
+    key, groups_key, tombstone = f"access:{secret_id}", _acl_groups_key(secret_id), f"tombstone:{secret_id}"
+    members_key = _group_members_key(group_id)
+
+    def write(pipe):
+        if not hlc.is_newer(version, pipe.get(tombstone)):
+            return False
+        current = pipe.get(key)
+        header = json.loads(current) if current else {'owner_id': owner_id}
+        changed = not pipe.sismember(groups_key, group_id)
+        newer = hlc.is_newer(version, header.get('version'))
+        if not (changed or newer or header.get('shared_with')):
+            return False
+        members = pipe.hkeys(members_key) if changed else ()
+        pipe.multi()
+        pipe.set(key, _acl_header(header['owner_id'], version if newer else header.get('version')))
+        _move_inline_members(pipe, secret_id, header)
+        if changed:
+            pipe.sadd(groups_key, group_id)
+            pipe.sadd(_group_secrets_key(group_id), secret_id)
+            for user_id in members:
+                pipe.hincrby(_expansion_key(secret_id), user_id, 1)
+        _log_change(pipe, 'access', secret_id)
+        return changed
+
+    return r.transaction(write, key, groups_key, members_key, tombstone, value_from_callable=True)
+
+
+# --- Group Functions ---
+# A group is a header group:{id} {owner_id, version}, the HASHes
+# group_members:{id} and group_removed:{id} mapping each user to the version
+# of their latest add or removal, the reverse index user_groups:{user_id}
+# and group_secrets:{id}, the secrets shared with the group. Membership
+# changes adjust acl_group_users of each of those secrets in the same
+# transaction, so a grant through a group costs nothing extra to check.
+
+@redis_call
+def get_group(group_id):
+    """Get a group from Redis, or None if it doesn't exist"""
+    pipe = r.pipeline()
+    pipe.get(_group_key(group_id))
+    pipe.hgetall(_group_members_key(group_id))
+    pipe.hgetall(_group_removed_key(group_id))
+    return _load_group(*pipe.execute())
+
+def _load_group(value, members, removed):
+    if not value:
+        return None
+    header = json.loads(value)
+    return Group(header.get('owner_id'), members, removed, header.get('version'))
+
+@redis_call
+def merge_group_member(group_id, owner_id, user_id, member, version):
+    """
+    Add user_id to a group (member=True) or remove them, last-writer-wins on
+    the version of the user's latest add or removal. The group is created,
+    owned by owner_id, if it doesn't exist. Returns True if membership changed.
+    """
+    key, members_key = _group_key(group_id), _group_members_key(group_id)
+    removed_key, secrets_key = _group_removed_key(group_id), _group_secrets_key(group_id)
+
+    def write(pipe):
+        current = pipe.get(key)
+        header = json.loads(current) if current else {'owner_id': owner_id}
+        added, removed = pipe.hget(members_key, user_id), pipe.hget(removed_key, user_id)
+        if not hlc.is_newer(version, max(added or '', removed or '')):
+            return False
+        changed = (added is None) == member
+        secret_ids = pipe.smembers(secrets_key) if changed else ()
+        pipe.multi()
+        if hlc.is_newer(version, header.get('version')):
+            header['version'] = version
+        pipe.set(key, json.dumps(header))
+        if member:
+            pipe.hset(members_key, user_id, version)
+            pipe.hdel(removed_key, user_id)
+            pipe.sadd(_user_groups_key(user_id), group_id)
+        else:
+            pipe.hset(removed_key, user_id, version)
+            pipe.hdel(members_key, user_id)
+            pipe.srem(_user_groups_key(user_id), group_id)
+        for secret_id in secret_ids:
+            pipe.hincrby(_expansion_key(secret_id), user_id, 1 if member else -1)
+        _log_change(pipe, 'group', group_id)
+        return changed
+
+    return r.transaction(write, key, members_key, removed_key, secrets_key, value_from_callable=True)
+
+def _rebuild_expansions(secret_ids):
+    """
+    Recompute acl_group_users of each secret from its groups' current
+    members. Not atomic; for bulk loads and whole-ACL replacements.
+    """
+    pipe = r.pipeline()
+    for secret_id in secret_ids:
+        pipe.smembers(_acl_groups_key(secret_id))
+    granted = pipe.execute()
+    group_ids = sorted(set().union(*granted))
+    pipe = r.pipeline()
+    for group_id in group_ids:
+        pipe.hkeys(_group_members_key(group_id))
+    members = dict(zip(group_ids, pipe.execute()))
+    pipe = r.pipeline()
+    for secret_id, group_ids in zip(secret_ids, granted):
+        counts = Counter(user_id for group_id in group_ids for user_id in members[group_id])
+        pipe.delete(_expansion_key(secret_id))
+        if counts:
+            pipe.hset(_expansion_key(secret_id), mapping=counts)
+    pipe.execute()
+
+
+# --- Upgrade ---
+
+# Set once every secret and ACL has been moved to the split layout
+SCHEMA_KEY = "schema:acl_sets"
+
+def _migrate_access(secret_id):
+    """Move one ACL's inline members into its SET. Returns True if it had any."""
+    key = f"access:{secret_id}"
+
+    def write(pipe):
+        current = pipe.get(key)
+        header = json.loads(current) if current else {}
+        if 'shared_with' not in header:
+            return False
+        pipe.multi()
+        pipe.set(key, _acl_header(header.get('owner_id'), header.get('version')))
+        _move_inline_members(pipe, secret_id, header)
+        return True
+
+    return r.transaction(write, key, value_from_callable=True)
+
+@redis_call
+def migrate_legacy_acls(batch_size=1000):
+    """
+    Build the ACL member SETs and the user_owns/user_shared indexes from
+    secrets and ACLs written before they existed. Runs once per Redis;
+    rerunning it, or running it from several processes at once, is harmless.
+    Returns the number of legacy ACLs moved.
+    """
+    if r.exists(SCHEMA_KEY):
+        return 0
+    log = logs.get_logger("SharedData")
+    for secrets in iter_batches('secret', batch_size):
+        pipe = r.pipeline()
+        for secret_id, secret in secrets.items():
+            if secret is not None:
+                pipe.sadd(_owned_key(secret.user_id), secret_id)
+        pipe.execute()
+    moved = 0
+    prefix = _PREFIXES['access']
+    for key in r.scan_iter(f"{prefix}*", count=batch_size):
+        moved += _migrate_access(key[len(prefix):])
+    r.set(SCHEMA_KEY, 1)
+    log.info("Migrated legacy ACLs", moved=moved)
+    return moved
+
+
+# --- Snapshot / Bootstrap Functions ---
+
+_PREFIXES = {'secret': 'secret:', 'access': 'access:', 'group': 'group:', 'tombstone': 'tombstone:'}
+
+def iter_batches(kind, batch_size):
+    """Yield {secret_id: record} dicts of up to batch_size, one MGET per batch"""
+    prefix = _PREFIXES[kind]
+    keys = []
+    for key in r.scan_iter(f"{prefix}*", count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            yield _mget(keys, kind)
+            keys = []
+    if keys:
+        yield _mget(keys, kind)
+
+@redis_call
+def get_many(kind, secret_ids):
+    """Fetch several records in one round trip. Missing ones map to None."""
+    prefix = _PREFIXES[kind]
+    return _mget([prefix + secret_id for secret_id in secret_ids], kind)
+
+def _mget(keys, kind):
+    if not keys:
+        return {}   # MGET needs at least one key
+    prefix = _PREFIXES[kind]
+    secret_ids = [key[len(prefix):] for key in keys]
+    if kind == 'secret':
+        return {secret_id: _load_secret(value) for secret_id, value in zip(secret_ids, r.mget(keys))}
+    if kind == 'tombstone':
+        # {secret_id: deletion version}, for the secrets that have one
+        return {secret_id: value for secret_id, value in zip(secret_ids, r.mget(keys)) if value}
+    pipe = r.pipeline()
+    pipe.mget(keys)
+    if kind == 'group':
+        for group_id in secret_ids:
+            pipe.hgetall(_group_members_key(group_id))
+            pipe.hgetall(_group_removed_key(group_id))
+        values, *hashes = pipe.execute()
+        return {group_id: _load_group(value, hashes[2 * i], hashes[2 * i + 1])
+                for i, (group_id, value) in enumerate(zip(secret_ids, values))}
+    for secret_id in secret_ids:
+        pipe.smembers(_members_key(secret_id))
+        pipe.smembers(_acl_groups_key(secret_id))
+    values, *sets = pipe.execute()
+    return {secret_id: _load_access(value, sets[2 * i], sets[2 * i + 1])
+            for i, (secret_id, value) in enumerate(zip(secret_ids, values))}
+
+@redis_call
+def current_watermark():
+    """Id of the newest changelog entry, or '0-0' if nothing was written yet"""
+    latest = r.xrevrange(CHANGELOG_KEY, count=1)
+    return latest[0][0] if latest else "0-0"
+
+def _parse_stream_id(stream_id):
+    ms, _, seq = stream_id.partition('-')
+    return int(ms), int(seq or 0)
+
+@redis_call
+def changes_since(watermark, page_size=1000):
+    """
+    Return (keys, new_watermark) where keys is a set of (kind, secret_id)
+    written after watermark, or None if the capped changelog no longer
+    reaches back that far and a full snapshot is needed.
+    """
+    try:
+        info = r.xinfo_stream(CHANGELOG_KEY)
+    except redis.ResponseError:
+        return set(), watermark   # nothing has ever been written
+
+    # Redis 7 reports the newest id removed by trimming; older servers don't,
+    # so fall back to the conservative check against the oldest retained id.
+    trimmed_up_to = info.get('max-deleted-entry-id')
+    if trimmed_up_to is None and info.get('first-entry'):
+        first_id = info['first-entry'][0]
+        if _parse_stream_id(first_id) > _parse_stream_id(watermark) and watermark != "0-0":
+            return None
+    elif trimmed_up_to and _parse_stream_id(trimmed_up_to) > _parse_stream_id(watermark):
+        return None
+
+    keys = set()
+    cursor = watermark
+    while True:
+        page = r.xrange(CHANGELOG_KEY, min=f"({cursor}", max="+", count=page_size)
+        for entry_id, fields in page:
+            keys.add((fields['kind'], fields['id']))
+        if page:
+            cursor = page[-1][0]
+        if len(page) < page_size:
+            return keys, cursor
+
+@redis_call
+def apply_batch(secrets, access, groups=None, tombstones=None):
+    """
+    Merge a snapshot or delta batch, last-writer-wins like the functions
+    above: a secret is written only if newer than the local copy and any
+    local deletion, ACLs are merged as unions, groups member by member, and
+    a deletion (None) only takes effect through its tombstone's version.
+    Secrets and ACLs are merged in one transaction, after which the group
+    expansions of the ACLs it changed are recomputed.
+    """
+    groups, tombstones = groups or {}, tombstones or {}
+    for group_id, group in groups.items():
+        if group is None:
+            continue   # groups are never deleted
+        for user_id, version in group.members.items():
+            merge_group_member(group_id, group.owner_id, user_id, True, version)
+        for user_id, version in group.removed.items():
+            merge_group_member(group_id, group.owner_id, user_id, False, version)
+
+    secret_ids = sorted(set(secrets) | set(access) | set(tombstones))
+    if not secret_ids:
+        return
+    watched = [key for secret_id in secret_ids
+               for key in (f"secret:{secret_id}", f"access:{secret_id}", f"tombstone:{secret_id}",
+                           _members_key(secret_id), _acl_groups_key(secret_id))]
+    merged_access = set()
+
+    def write(pipe):
+        merged_access.clear()
+        # The keys are watched on pipe; read them in bulk on another connection
+        read = r.pipeline(transaction=False)
+        read.mget([f"secret:{secret_id}" for secret_id in secret_ids])
+        read.mget([f"access:{secret_id}" for secret_id in secret_ids])
+        read.mget([f"tombstone:{secret_id}" for secret_id in secret_ids])
+        for secret_id in secret_ids:
+            read.smembers(_members_key(secret_id))
+            read.smembers(_acl_groups_key(secret_id))
+        secret_values, access_values, tombstone_values, *sets = read.execute()
+
+        pipe.multi()
+        for i, secret_id in enumerate(secret_ids):
+            current = _load_secret(secret_values[i])
+            header = json.loads(access_values[i]) if access_values[i] else None
+            deleted_at = tombstone_values[i] or ''
+
+            version = tombstones.get(secret_id)
+            if version and hlc.is_newer(version, deleted_at):
+                deleted_at = version
+                pipe.set(f"tombstone:{secret_id}", version, ex=TOMBSTONE_TTL)
+                if current is not None and not hlc.is_newer(current.version, version):
+                    pipe.delete(f"secret:{secret_id}")
+                    pipe.srem(_owned_key(current.user_id), secret_id)
+                    _log_change(pipe, 'secret', secret_id)
+                    current = None
+                if header is not None and not hlc.is_newer(header.get('version'), version):
+                    members = sets[2 * i] | set(header.get('shared_with', ()))
+                    _delete_access(pipe, secret_id, members, sets[2 * i + 1])
+                    _log_change(pipe, 'access', secret_id)
+                    header = None
+
+            secret = secrets.get(secret_id)
+            latest = max(current.version if current else '', deleted_at)
+            if secret is not None and (not latest or hlc.is_newer(secret.version, latest)):
+                pipe.set(f"secret:{secret_id}", _dumps(secret))
+                pipe.sadd(_owned_key(secret.user_id), secret_id)
+                _log_change(pipe, 'secret', secret_id)
+
+            record = access.get(secret_id)
+            if record is None or (deleted_at and not hlc.is_newer(record.version, deleted_at)):
+                continue
+            header = header or {'owner_id': record.owner_id}
+            newer = hlc.is_newer(record.version, header.get('version'))
+            pipe.set(f"access:{secret_id}", _acl_header(header['owner_id'], record.version if newer else header.get('version')))
+            _move_inline_members(pipe, secret_id, header)
+            for user_id in record.shared_with:
+                pipe.sadd(_members_key(secret_id), user_id)
+                pipe.sadd(_shared_key(user_id), secret_id)
+            for group_id in record.groups:
+                pipe.sadd(_acl_groups_key(secret_id), group_id)
+                pipe.sadd(_group_secrets_key(group_id), secret_id)
+            _log_change(pipe, 'access', secret_id)
+            merged_access.add(secret_id)
+
+    r.transaction(write, *watched)
+    if merged_access:
+        _rebuild_expansions(sorted(merged_access))
@@ -0,0 +1,58 @@
+# singleflight.py
+# Coalescing of duplicate concurrent calls
+#
+# When many callers ask for the same thing at once (clients booting together
+# and all reading the same shared secret), only the first runs the fetch;
+# the others wait for it and share its result or exception. Nothing is
+# cached: a call that starts after the fetch finished runs a new one.
+import threading
+
+import metrics
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Group:
+    """Runs at most one call per key at a time; name labels its metrics"""
+
+    def __init__(self, name):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._executed = metrics.SINGLEFLIGHT_CALLS.labels(name, 'executed')
+        self._coalesced = metrics.SINGLEFLIGHT_CALLS.labels(name, 'coalesced')
+
+    def do(self, key, fn, *args, timeout=None):
+        """
+        Return fn(*args), or the result of the identical call already in
+        flight for key. Waiting for another caller's call gives up after
+        timeout seconds with TimeoutError; that call carries on regardless.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executed.inc()
+            else:
+                self._coalesced.inc()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight call {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,101 @@
+# snapshot.py
+# Helpers for streaming a node's dataset to a new replica
+#
+# A bootstrap is a full snapshot taken at a sequence watermark, followed by a
+# delta of every key changed since that watermark. Both are shipped as
+# batches of the form {"secrets": {id: record|None}, "access": {id: acl|None},
+# "groups": {id: group|None}, "tombstones": {id: deletion version}}, where
+# None means the key was deleted, so one apply function handles both. The
+# apply functions merge last-writer-wins, so a deletion only takes effect
+# through its tombstone's version. Only the Redis-backed services hold groups.
+# In memory a batch holds records.Secret / records.Access; on the wire, their
+# dict form.
+import json
+import os
+import threading
+import zlib
+from collections import deque
+
+import records
+
+SNAPSHOT_CHUNK_RECORDS = int(os.environ.get("SNAPSHOT_CHUNK_RECORDS", "1000"))
+SNAPSHOT_COMPRESSION_LEVEL = int(os.environ.get("SNAPSHOT_COMPRESSION_LEVEL", "3"))
+CHANGELOG_MAXLEN = int(os.environ.get("CHANGELOG_MAXLEN", "100000"))
+
+def batch_to_dicts(secrets, access):
+    """A batch of records in its wire form. Returns (secrets, access)."""
+    return ({secret_id: records.to_dict(record) for secret_id, record in secrets.items()},
+            {secret_id: records.to_dict(record) for secret_id, record in access.items()})
+
+def batch_from_dicts(secrets, access):
+    """Inverse of batch_to_dicts"""
+    return ({secret_id: records.secret_from_dict(record) for secret_id, record in secrets.items()},
+            {secret_id: records.access_from_dict(record) for secret_id, record in access.items()})
+
+def encode_batch(secrets, access, groups=None, tombstones=None):
+    """Serialize and compress one batch of records"""
+    secrets, access = batch_to_dicts(secrets, access)
+    batch = {'secrets': secrets, 'access': access}
+    if groups:
+        batch['groups'] = {group_id: records.to_dict(group) for group_id, group in groups.items()}
+    if tombstones:
+        batch['tombstones'] = tombstones
+    raw = json.dumps(batch, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'), SNAPSHOT_COMPRESSION_LEVEL)
+
+def decode_batch(payload):
+    """Inverse of encode_batch. Returns (secrets, access, groups, tombstones)."""
+    batch = json.loads(zlib.decompress(payload))
+    secrets, access = batch_from_dicts(batch.get('secrets', {}), batch.get('access', {}))
+    groups = {group_id: records.group_from_dict(group) for group_id, group in batch.get('groups', {}).items()}
+    return secrets, access, groups, batch.get('tombstones', {})
+
+def iter_batches(items, size=SNAPSHOT_CHUNK_RECORDS):
+    """Split an iterable of (key, value) pairs into dicts of at most size entries"""
+    batch = {}
+    for key, value in items:
+        batch[key] = value
+        if len(batch) >= size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+class ChangeLog:
+    """
+    Bounded in-memory log of which keys changed, used by the in-memory stores
+    (http_server, data_service) to serve deltas from a watermark. Only keys
+    are kept; the delta ships each key's current value.
+    """
+
+    def __init__(self, maxlen=CHANGELOG_MAXLEN):
+        self._entries = deque(maxlen=maxlen)   # (seq, kind, secret_id)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind, secret_id):
+        """Note that a 'secret' or 'access' entry changed"""
+        with self._lock:
+            self._seq += 1
+            self._entries.append((self._seq, kind, secret_id))
+
+    def watermark(self):
+        with self._lock:
+            return str(self._seq)
+
+    def changes_since(self, watermark):
+        """
+        Return (keys, new_watermark) where keys is a set of (kind, secret_id)
+        changed after watermark, or None if the log no longer reaches back
+        that far and a full snapshot is needed.
+        """
+        since = int(watermark or 0)
+        with self._lock:
+            if since > self._seq:
+                return None
+            if self._entries and self._entries[0][0] > since + 1:
+                return None
+            if not self._entries and since < self._seq:
+                return None
+            keys = {(kind, secret_id) for seq, kind, secret_id in self._entries if seq > since}
+            return keys, str(self._seq)
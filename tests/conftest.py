@@ -0,0 +1,8 @@
+# Tests import the service modules from the repository root
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# replication_log opens its hint log at import; keep it out of the checkout
+os.environ.setdefault("REPLICATION_LOG_DIR", tempfile.mkdtemp(prefix="replication_log-"))
@@ -0,0 +1,54 @@
+# Consistent-hash ring and shard ownership
+from hash_ring import HashRing, ShardMap, parse_nodes
+
+KEYS = [f"secret-{i}" for i in range(2000)]
+
+def _primaries(ring):
+    return {key: ring.preference_list(key, 1)[0] for key in KEYS}
+
+def test_parse_nodes():
+    assert parse_nodes("n1=h1:1, n2=h2:2,,h3:3") == {'n1': 'h1:1', 'n2': 'h2:2', 'h3:3': 'h3:3'}
+
+def test_preference_list_is_distinct_and_stable():
+    ring = HashRing(['n1', 'n2', 'n3'])
+    owners = ring.preference_list('secret-1', 2)
+    assert len(set(owners)) == 2
+    assert HashRing(['n3', 'n1', 'n2']).preference_list('secret-1', 2) == owners
+    assert len(ring.preference_list('secret-1', 5)) == 3
+    assert HashRing().preference_list('secret-1', 2) == []
+
+def test_keys_spread_across_nodes():
+    counts = {}
+    for node_id in _primaries(HashRing(['n1', 'n2', 'n3', 'n4'])).values():
+        counts[node_id] = counts.get(node_id, 0) + 1
+    assert min(counts.values()) > len(KEYS) / 4 / 2
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = HashRing(['n1', 'n2', 'n3'])
+    before = _primaries(ring)
+    ring.add_node('n4')
+    after = _primaries(ring)
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 'n4' for key in moved)
+    assert len(KEYS) / 8 < len(moved) < len(KEYS) / 2
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing(['n1', 'n2', 'n3', 'n4'])
+    before = _primaries(ring)
+    ring.remove_node('n4')
+    after = _primaries(ring)
+    assert [key for key in KEYS if before[key] != after[key]] == [key for key in KEYS if before[key] == 'n4']
+    assert 'n4' not in ring.nodes
+
+def test_shard_map_owners():
+    peers = {'n2': 'h2:50054', 'n3': 'h3:50054'}
+    sharded = ShardMap(peers, local_node='n1', replication_factor=2)
+    owners = sharded.owners('secret-1')
+    assert owners == sharded.ring.preference_list('secret-1', 2)
+    assert sharded.is_owner('secret-1') == ('n1' in owners)
+    assert sharded.owner_addrs('secret-1') == [peers[n] for n in owners if n != 'n1']
+
+    full = ShardMap(peers, local_node='n1', replication_factor=0)
+    assert full.owners('secret-1') == ['n1', 'n2', 'n3']
+    assert full.is_owner('secret-1')
+    assert full.all_addrs() == ['h2:50054', 'h3:50054']
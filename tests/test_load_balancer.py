@@ -0,0 +1,120 @@
+# Client-side load balancing: failover, ejection and hedging
+import threading
+import time
+from concurrent.futures import Future
+
+import grpc
+import pytest
+
+import load_balancer
+from load_balancer import LoadBalancer
+
+# addr -> (seconds to answer, status code)
+UPSTREAMS = {}
+
+class _RpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+class _Call(Future):
+    def code(self):
+        error = self.exception()
+        return error.code() if error is not None else grpc.StatusCode.OK
+
+class _Method:
+    def __init__(self, addr):
+        self.addr = addr
+
+    def _answer(self):
+        delay, code = UPSTREAMS[self.addr]
+        time.sleep(delay)
+        if code != grpc.StatusCode.OK:
+            raise _RpcError(code)
+        return self.addr
+
+    def __call__(self, request, timeout=None):
+        return self._answer()
+
+    def future(self, request, timeout=None):
+        call = _Call()
+
+        def run():
+            try:
+                result = self._answer()
+            except grpc.RpcError as e:
+                if not call.cancelled():
+                    call.set_exception(e)
+                return
+            if not call.cancelled():
+                call.set_result(result)
+
+        threading.Thread(target=run, daemon=True).start()
+        return call
+
+class _Stub:
+    def __init__(self, channel):
+        self._addr = channel
+
+    def __getattr__(self, method):
+        return _Method(self._addr)
+
+@pytest.fixture(autouse=True)
+def upstreams(monkeypatch):
+    monkeypatch.setattr(load_balancer.channels, 'get_channel', lambda addr: addr)
+    UPSTREAMS.clear()
+    return UPSTREAMS
+
+def _balancer(**upstreams):
+    UPSTREAMS.update(upstreams)
+    return LoadBalancer(list(upstreams))
+
+def test_call_fails_over_from_unreachable_endpoint():
+    lb = _balancer(a=(0, grpc.StatusCode.UNAVAILABLE), b=(0, grpc.StatusCode.OK))
+    assert lb.call(_Stub, 'Get', None, timeout=1) == 'b'
+    assert lb.endpoints['a'].failures == 1
+
+def test_call_returns_application_errors_without_failover():
+    lb = _balancer(a=(0, grpc.StatusCode.NOT_FOUND), b=(0, grpc.StatusCode.OK))
+    with pytest.raises(grpc.RpcError) as error:
+        lb.call(_Stub, 'Get', None, timeout=1)
+    assert error.value.code() == grpc.StatusCode.NOT_FOUND
+    assert lb.endpoints['b'].samples == 0
+
+def test_endpoint_ejected_after_consecutive_failures():
+    lb = _balancer(a=(0, grpc.StatusCode.UNAVAILABLE), b=(0, grpc.StatusCode.OK))
+    for _ in range(load_balancer.LB_EJECT_FAILURES):
+        lb.call(_Stub, 'Get', None, timeout=1, candidates=['a', 'b'])
+    assert lb.endpoints['a'].ejected_until > time.monotonic()
+    assert lb.endpoints['a'].ejections == 1
+
+def test_at_most_max_eject_percent_are_ejected():
+    lb = _balancer(a=(0, grpc.StatusCode.UNAVAILABLE), b=(0, grpc.StatusCode.UNAVAILABLE))
+    for _ in range(load_balancer.LB_EJECT_FAILURES * 2):
+        with pytest.raises(grpc.RpcError):
+            lb.call(_Stub, 'Get', None, timeout=1)
+    now = time.monotonic()
+    assert sum(e.ejected_until > now for e in lb.endpoints.values()) == 1
+
+def test_latency_outlier_ejected():
+    lb = _balancer(a=(0, grpc.StatusCode.OK), b=(0, grpc.StatusCode.OK), c=(0, grpc.StatusCode.OK))
+    for _ in range(load_balancer._MIN_SAMPLES):
+        for addr, latency in (('a', 0.5), ('b', 0.01), ('c', 0.01)):
+            lb._record(lb.endpoints[addr], 'Get', latency, grpc.StatusCode.OK)
+    assert lb.endpoints['a'].ejected_until > time.monotonic()
+    assert lb.endpoints['b'].ejected_until == lb.endpoints['c'].ejected_until == 0.0
+
+def test_slow_call_is_hedged_to_another_endpoint():
+    lb = _balancer(a=(2, grpc.StatusCode.OK), b=(0, grpc.StatusCode.OK))
+    lb._hedge_delays['Get'] = 0.01
+    start = time.monotonic()
+    assert lb.hedged_call(_Stub, 'Get', None, timeout=5) == 'b'
+    assert time.monotonic() - start < 1
+
+def test_hedges_are_limited_by_their_budget():
+    lb = _balancer(a=(0.2, grpc.StatusCode.OK), b=(0, grpc.StatusCode.OK))
+    lb._hedge_delays['Get'] = 0.01
+    lb._hedge_tokens = 0
+    assert lb.hedged_call(_Stub, 'Get', None, timeout=5) == 'a'
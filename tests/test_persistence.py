@@ -0,0 +1,93 @@
+# Write-ahead log and snapshots of the in-memory store
+import os
+import time
+
+import pytest
+
+import persistence
+from hlc import clock
+from memory_store import MemoryStore
+from records import Access, Secret
+
+def _contents(store):
+    return ({secret_id: secret.to_dict() for secret_id, secret in store.secrets.items()},
+            {secret_id: access.to_dict() for secret_id, access in store.access.items()},
+            dict(store.tombstones))
+
+def _visible_to(store, user_id):
+    return sorted(secret_id for secret_id, _, _ in store.secrets_for_user(user_id))
+
+def _fill(store, start, count):
+    for i in range(start, start + count):
+        secret_id = f"s{i}"
+        store.put_secret(secret_id, Secret('alice', 'name', f"data{i}", 1, 1, clock.now()))
+        store.merge_share(secret_id, 'alice', 'bob', clock.now())
+        if i % 5 == 0:
+            store.delete_secret(secret_id, clock.now())
+
+def _wait_for_snapshot(journal):
+    deadline = time.monotonic() + 10
+    while journal._snapshotting and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not journal._snapshotting
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, 'PERSIST_SNAPSHOT_EVERY', 50)
+    return str(tmp_path)
+
+def test_restore_round_trip(directory):
+    store = MemoryStore()
+    persistence.restore(store, directory)
+    _fill(store, 0, 40)                     # past one snapshot ...
+    _wait_for_snapshot(store.journal)
+    _fill(store, 40, 10)                    # ... and into the log after it
+
+    assert os.path.exists(os.path.join(directory, 'snapshot'))
+    restored = MemoryStore()
+    assert persistence.restore(restored, directory)
+    assert _contents(restored) == _contents(store)
+    assert _visible_to(restored, 'bob') == _visible_to(store, 'bob') != []
+
+def test_restore_ignores_torn_tail(directory):
+    store = MemoryStore()
+    persistence.restore(store, directory)
+    _fill(store, 0, 3)
+    segment = os.path.join(directory, f"wal-{store.journal.segment:08d}.log")
+    with open(segment, 'a') as f:
+        f.write('{"k":"secret","id":"s9","v":{"user')
+
+    restored = MemoryStore()
+    persistence.restore(restored, directory)
+    assert _contents(restored) == _contents(store)
+    # Later writes go to a new segment, not after the torn entry
+    restored.put_secret('s9', Secret('alice', 'name', 'data', 1, 1, clock.now()))
+    again = MemoryStore()
+    persistence.restore(again, directory)
+    assert 's9' in again.secrets
+
+def test_apply_batch_keeps_newer_records():
+    old, new = clock.now(), clock.now()
+    store = MemoryStore()
+    store.put_secret('s1', Secret('alice', 'name', 'new', 1, 1, new))
+    store.apply_batch({'s1': Secret('alice', 'name', 'old', 1, 1, old), 's2': Secret('carol', 'name', 'c', 1, 1, old)},
+                      {'s1': Access('alice', ['bob'], old)},
+                      {'s2': new})
+
+    assert store.secrets['s1'].data == 'new'
+    assert store.access['s1'].shared_with == {'bob'}
+    assert 's2' not in store.secrets and store.tombstones['s2'] == new
+
+def test_write_that_changes_nothing_does_not_sync(directory, monkeypatch):
+    store = MemoryStore()
+    persistence.restore(store, directory)
+    version = clock.now()
+    store.put_secret('s1', Secret('alice', 'name', 'data', 1, 1, version))
+    syncs = []
+    monkeypatch.setattr(store.journal, 'sync', syncs.append)
+
+    assert not store.put_secret('s1', Secret('alice', 'name', 'older', 1, 1, version))
+    assert not store.delete_secret('s1', '')
+    assert syncs == []
+    assert store.put_secret('s1', Secret('alice', 'name', 'newer', 1, 1, clock.now()))
+    assert syncs == [store.journal.written]
@@ -0,0 +1,48 @@
+# Hint logs of prefork workers when WORKERS changes
+import json
+import os
+
+import pytest
+
+import logs
+import prefork
+import replication_log
+
+log = logs.get_logger("Test")
+
+def _write_hints(path, *payloads):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        for seq, payload in enumerate(payloads, 1):
+            f.write(json.dumps({'seq': seq, 'addr': 'peer:50054', 'kind': 'delete', 'payload': payload}) + '\n')
+
+def _secret_ids(path):
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [e['seq'] for e in entries] == list(range(1, len(entries) + 1))
+    return [e['payload']['secret_id'] for e in entries]
+
+@pytest.fixture
+def log_dir(tmp_path):
+    directory = tmp_path / "replication_log"
+    _write_hints(str(directory / "worker-0" / "peer_50054.log"), {'secret_id': 'a'})
+    _write_hints(str(directory / "worker-1" / "peer_50054.log"), {'secret_id': 'b'}, {'secret_id': 'c'})
+    _write_hints(str(directory / "worker-2" / "peer_50054.log"), {'secret_id': 'd'})
+    return str(directory)
+
+def test_fewer_workers_take_over_removed_workers_hints(log_dir):
+    prefork.adopt_hints(log_dir, 2, log)
+
+    assert sorted(os.listdir(log_dir)) == ['worker-0', 'worker-1']
+    assert _secret_ids(os.path.join(log_dir, 'worker-0', 'peer_50054.log')) == ['a', 'd']
+    assert _secret_ids(os.path.join(log_dir, 'worker-1', 'peer_50054.log')) == ['b', 'c']
+
+def test_single_process_takes_over_every_workers_hints(log_dir, monkeypatch):
+    _write_hints(os.path.join(log_dir, 'peer_50054.log'), {'secret_id': 'root'})
+    prefork.adopt_hints(log_dir, 1, log)
+
+    assert os.listdir(log_dir) == ['peer_50054.log']
+    assert sorted(_secret_ids(os.path.join(log_dir, 'peer_50054.log'))) == ['a', 'b', 'c', 'd', 'root']
+    # ... and a hint log opened on the directory replays all of them
+    monkeypatch.setattr(replication_log.ReplicationLog, '_start_replayer', lambda self, addr: None)
+    assert replication_log.ReplicationLog(log_dir).pending_count('peer:50054') == 5
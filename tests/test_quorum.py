@@ -0,0 +1,59 @@
+# Consistency levels: acknowledgement counting and read resolution
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import quorum
+
+def _done(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+def _later(seconds, result):
+    future = Future()
+    timer = threading.Timer(seconds, future.set_result, [result])
+    timer.daemon = True
+    timer.start()
+    return future
+
+@pytest.mark.parametrize("level, replicas, needed", [
+    (quorum.ONE, 3, 1), (quorum.QUORUM, 3, 2), (quorum.QUORUM, 4, 3), (quorum.ALL, 3, 3), (quorum.ONE, 0, 0),
+])
+def test_required(level, replicas, needed):
+    assert quorum.required(level, replicas) == needed
+
+def test_parse_level():
+    assert quorum.parse_level('quorum') == quorum.QUORUM
+    assert quorum.parse_level('', default=quorum.ALL) == quorum.ALL
+    with pytest.raises(ValueError):
+        quorum.parse_level('most')
+
+def test_collect_returns_once_enough_calls_succeeded():
+    calls = {'a': _done(True), 'b': _done(True), 'c': _later(5, True)}
+    assert quorum.collect(calls, 2, timeout=1) == {'a': True, 'b': True}
+
+def test_collect_gives_up_when_the_level_is_out_of_reach():
+    calls = {'a': _done(error=RuntimeError()), 'b': _done(False), 'c': _later(5, True)}
+    assert quorum.collect(calls, 2, timeout=1, ok=bool) == {}
+
+def test_collect_stops_at_the_timeout():
+    calls = {'a': _done(True), 'b': _later(5, True)}
+    assert quorum.collect(calls, 2, timeout=0.05) == {'a': True}
+
+def test_await_acks_counts_the_local_write():
+    calls = {'b': _done(True), 'c': _done(False)}
+    assert quorum.await_acks(calls, 1, quorum.QUORUM, timeout=1) == (2, 2)
+    assert quorum.await_acks(calls, 1, quorum.ALL, timeout=1) == (2, 3)
+
+def test_resolve_picks_newest_and_lists_stale_replicas():
+    responses = {'a': ('002', 'new'), 'b': ('001', 'old'), 'c': ('', None), 'd': ('002', 'new')}
+    assert quorum.resolve(responses) == ('002', 'new', ['b', 'c'])
+
+def test_resolve_prefers_a_newer_deletion():
+    responses = {'a': ('001', 'old'), 'b': ('003', None)}
+    assert quorum.resolve(responses) == ('003', None, ['a'])
@@ -0,0 +1,82 @@
+# Hinted-handoff log: compaction and replay
+import time
+
+import grpc
+import pytest
+
+import replication_log
+from replication_log import compact
+
+def _entry(seq, kind, version, **payload):
+    return {'seq': seq, 'addr': 'peer:50054', 'kind': kind, 'payload': dict(payload, version=version)}
+
+def _kept(entries):
+    return [entry['seq'] for entry in compact(entries)]
+
+def test_compact_keeps_newest_update_whatever_the_order():
+    assert _kept([_entry(1, 'update', '002', secret_id='s', data='new'),
+                  _entry(2, 'update', '001', secret_id='s', data='old')]) == [1]
+
+def test_compact_delete_supersedes_only_older_mutations():
+    entries = [_entry(1, 'secret', '001', secret_id='s'),
+               _entry(2, 'share', '002', secret_id='s', target_user_id='bob'),
+               _entry(3, 'update', '005', secret_id='s'),
+               _entry(4, 'delete', '003', secret_id='s'),
+               _entry(5, 'share', '004', secret_id='s', target_user_id='carol'),
+               _entry(6, 'update', '001', secret_id='other')]
+    assert _kept(entries) == [3, 4, 5, 6]
+
+def test_compact_keeps_newest_share_and_membership_change():
+    entries = [_entry(1, 'share', '001', secret_id='s', target_user_id='bob'),
+               _entry(2, 'share', '002', secret_id='s', target_user_id='bob'),
+               _entry(3, 'group_share', '001', secret_id='s', group_id='bob'),
+               _entry(4, 'group_member', '002', group_id='g', user_id='u', member=False),
+               _entry(5, 'group_member', '001', group_id='g', user_id='u', member=True)]
+    assert _kept(entries) == [2, 3, 4]
+
+class _RpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+@pytest.fixture
+def hints(tmp_path, monkeypatch):
+    monkeypatch.setattr(replication_log, 'RETRY_BASE_DELAY', 0.01)
+    monkeypatch.setattr(replication_log, 'RETRY_MAX_DELAY', 0.02)
+    monkeypatch.setattr(replication_log, 'REPLICATION_MAX_REJECTIONS', 3)
+    return replication_log.ReplicationLog(str(tmp_path))
+
+def _replay(hints, monkeypatch, replies, *secret_ids):
+    """Log a mutation per secret id; replies[secret_id] lists what the peer answers, last one repeating"""
+    sent = []
+
+    def send_mutation(addr, kind, payload, timeout=None):
+        sent.append(payload['secret_id'])
+        answers = replies[payload['secret_id']]
+        answer = answers.pop(0) if len(answers) > 1 else answers[0]
+        if isinstance(answer, grpc.StatusCode):
+            raise _RpcError(answer)
+        return answer
+
+    monkeypatch.setattr(replication_log, 'send_mutation', send_mutation)
+    for secret_id in secret_ids:
+        hints.append('peer:50054', 'delete', {'secret_id': secret_id, 'version': '001'})
+    deadline = time.monotonic() + 10
+    while hints.has_pending('peer:50054') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not hints.has_pending('peer:50054')
+    return sent
+
+def test_replay_retries_unavailable_peer_in_order(hints, monkeypatch):
+    replies = {'a': [grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, True], 'b': [True]}
+    assert _replay(hints, monkeypatch, replies, 'a', 'b') == ['a', 'a', 'a', 'b']
+
+def test_replay_drops_mutation_the_peer_rejects(hints, monkeypatch):
+    replies = {'a': [grpc.StatusCode.INVALID_ARGUMENT], 'b': [True]}
+    assert _replay(hints, monkeypatch, replies, 'a', 'b') == ['a', 'b']
+
+def test_replay_retries_unapplied_mutation_then_drops_it(hints, monkeypatch):
+    replies = {'a': [False], 'b': [True]}
+    assert _replay(hints, monkeypatch, replies, 'a', 'b') == ['a', 'a', 'a', 'b']
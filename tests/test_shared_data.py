@@ -0,0 +1,60 @@
+# Redis-backed data layer, against an in-process fake Redis
+import json
+
+import fakeredis
+import pytest
+
+import shared_data
+from hlc import clock
+from records import Access, Secret
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(shared_data, 'r', fake)
+    return fake
+
+def _legacy_secret(redis, secret_id, owner, shared_with):
+    """Write a secret and its ACL the way versions before the split did"""
+    secret = Secret(owner, 'name', 'data', '2024-01-01T00:00:00', '2024-01-01T00:00:00', clock.now())
+    redis.set(f"secret:{secret_id}", json.dumps(secret.to_dict()))
+    redis.set(f"access:{secret_id}", json.dumps({'owner_id': owner, 'shared_with': shared_with}))
+
+def test_legacy_acls_keep_access_after_migration(redis):
+    _legacy_secret(redis, 's1', 'alice', ['bob'])
+    _legacy_secret(redis, 's2', 'carol', [])
+
+    assert shared_data.migrate_legacy_acls() == 2
+
+    assert shared_data.is_shared_with('s1', 'bob')
+    assert not shared_data.is_shared_with('s1', 'eve')
+    assert shared_data.get_access_control('s1').shared_with == {'bob'}
+    assert list(shared_data.list_user_secrets('alice')) == ['s1']
+    assert shared_data.list_user_secrets('bob')['s1'][1] is True
+    assert list(shared_data.list_user_secrets('carol')) == ['s2']
+    assert 'shared_with' not in json.loads(redis.get('access:s1'))
+
+def test_migration_runs_once(redis):
+    _legacy_secret(redis, 's1', 'alice', ['bob'])
+    shared_data.migrate_legacy_acls()
+    _legacy_secret(redis, 's2', 'alice', ['bob'])
+    assert shared_data.migrate_legacy_acls() == 0
+
+def test_share_after_migration_adds_to_set():
+    shared_data.put_secret_if_newer('s1', Secret('alice', 'n', 'd', 1, 1, clock.now()))
+    shared_data.migrate_legacy_acls()
+    assert shared_data.merge_share('s1', 'alice', 'bob', clock.now())
+    assert shared_data.is_shared_with('s1', 'bob')
+    assert list(shared_data.list_user_secrets('bob')) == ['s1']
+
+def test_apply_batch_keeps_newer_records():
+    old, new = clock.now(), clock.now()
+    shared_data.put_secret_if_newer('s1', Secret('alice', 'n', 'new', 1, 1, new))
+    shared_data.apply_batch({'s1': Secret('alice', 'n', 'old', 1, 1, old), 's2': Secret('carol', 'n', 'c', 1, 1, old)},
+                            {'s1': Access('alice', ['bob'], old), 's2': Access('carol', ['erin'], old)},
+                            tombstones={'s2': new})
+
+    assert shared_data.get_secret('s1').data == 'new'
+    assert shared_data.is_shared_with('s1', 'bob')
+    assert shared_data.get_secret('s2') is None
+    assert not shared_data.is_shared_with('s2', 'erin')
@@ -0,0 +1,429 @@
+# tracing.py
+# Distributed tracing, compatible with OpenTelemetry
+#
+# A request gets one trace id at its first hop; every hop it crosses (the
+# gateway, each service, their calls to one another, Redis, replication to
+# peers) records a span of that trace with its own timing. Context travels
+# in the W3C `traceparent` header: gRPC metadata between services, HTTP
+# headers between http_server.py nodes. Within a process the current span
+# is a contextvar; work handed to a thread pool keeps it via wrap().
+#
+# Finished spans are written by a background thread to TRACE_FILE as OTLP
+# JSON, one export request per line, so traces can be inspected offline or
+# loaded by an OpenTelemetry Collector (otlpjsonfile receiver) into any
+# tracing backend. Tracing is off unless TRACE_FILE is set.
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import re
+import socket
+import threading
+import time
+
+import grpc
+
+import logs
+import prefork
+
+# OTLP/JSON output file ("" = tracing off); prefork workers add their id
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+# Fraction of new traces recorded; the decision follows the trace downstream
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+ENABLED = bool(TRACE_FILE)
+
+# Span kinds, as numbered by OTLP
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_EXPORT_BATCH = 512
+_EXPORT_INTERVAL = 1.0
+_QUEUE_SIZE = 10000
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar('current_span', default=None)
+service_name = os.environ.get("OTEL_SERVICE_NAME", "")
+
+def set_service_name(name):
+    """Name this process's spans are reported under, unless OTEL_SERVICE_NAME is set"""
+    global service_name
+    if not os.environ.get("OTEL_SERVICE_NAME"):
+        service_name = name
+
+class SpanContext:
+    """Identity of a span, as carried across processes"""
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+def parse_traceparent(value):
+    """SpanContext of a traceparent header, or None if missing or malformed"""
+    match = _TRACEPARENT.match((value or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return SpanContext(match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1)
+
+class Span:
+    def __init__(self, name, kind, parent, attributes):
+        if parent is None:
+            self.context = SpanContext(os.urandom(16).hex(), os.urandom(8).hex(),
+                                       random.random() < TRACE_SAMPLE_RATE)
+            self.parent_id = ''
+        else:
+            self.context = SpanContext(parent.trace_id, os.urandom(8).hex(), parent.sampled)
+            self.parent_id = parent.span_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.error = str(message)
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if self.context.sampled:
+            _exporter.submit(self)
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off"""
+    context = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+_NOOP = _NoopSpan()
+
+def current():
+    """SpanContext of the current span, or None"""
+    span = _current.get()
+    return span.context if span is not None else None
+
+def _log_fields():
+    # Log lines written inside a recorded span can be found from its trace
+    context = current()
+    if context is None or not context.sampled:
+        return {}
+    return {'trace_id': context.trace_id, 'span_id': context.span_id}
+
+@contextlib.contextmanager
+def span(name, kind=INTERNAL, attributes=None, parent=None):
+    """
+    Record a span around a block, as a child of parent (a SpanContext) or
+    else of the current span. Exceptions mark it as failed.
+    """
+    if not ENABLED:
+        yield _NOOP
+        return
+    new = Span(name, kind, parent or current(), attributes)
+    token = _current.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        if new.error is None:
+            new.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        new.end()
+
+def traced(name=None, kind=INTERNAL, attributes=None):
+    """Decorator: record a span around each call of the function"""
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with span(span_name, kind, attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def wrap(fn):
+    """fn bound to the caller's trace context, for running in other threads"""
+    if not ENABLED:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # A context can't be entered by two threads at once, so each call
+        # gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+def headers():
+    """HTTP headers that carry the current trace to the next hop"""
+    context = current()
+    return {'traceparent': context.traceparent()} if context else {}
+
+# --- gRPC ---
+
+def _code_name(code):
+    return code.name if code is not None else 'OK'
+
+class ServerInterceptor(grpc.ServerInterceptor):
+    """Records a server span for each unary and server-streaming call, continuing the caller's trace"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or not ENABLED:
+            return handler
+        name = handler_call_details.method.lstrip('/')
+        metadata = dict(handler_call_details.invocation_metadata or ())
+        parent = parse_traceparent(metadata.get('traceparent'))
+        attributes = {'rpc.system': 'grpc', 'rpc.method': name}
+
+        def finish(active, context):
+            code = context.code()
+            active.set_attribute('rpc.grpc.status_code', _code_name(code))
+            if code not in (None, grpc.StatusCode.OK) and active.error is None:
+                active.set_error(_code_name(code))
+
+        if handler.unary_unary is not None:
+            behavior = handler.unary_unary
+
+            def trace(request, context):
+                with span(name, SERVER, attributes, parent) as active:
+                    try:
+                        return behavior(request, context)
+                    finally:
+                        finish(active, context)
+
+            return grpc.unary_unary_rpc_method_handler(
+                trace,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
+        if handler.unary_stream is not None:
+            behavior = handler.unary_stream
+
+            def trace_stream(request, context):
+                # The span is current only while the handler is producing a
+                # message, not across yields
+                active = Span(name, SERVER, parent, attributes)
+                try:
+                    iterator = iter(behavior(request, context))
+                    while True:
+                        token = _current.set(active)
+                        try:
+                            message = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            _current.reset(token)
+                        yield message
+                except BaseException as e:
+                    active.set_error(f"{type(e).__name__}: {e}")
+                    raise
+                finally:
+                    finish(active, context)
+                    active.end()
+
+            return grpc.unary_stream_rpc_method_handler(
+                trace_stream,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+        return handler
+
+class _ClientCallDetails(grpc.ClientCallDetails):
+    def __init__(self, details, metadata):
+        self.method = details.method
+        self.timeout = details.timeout
+        self.metadata = metadata
+        self.credentials = details.credentials
+        self.wait_for_ready = details.wait_for_ready
+        self.compression = details.compression
+
+class ClientInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """Records a client span for each outgoing unary call and sends its traceparent along"""
+
+    def __init__(self, addr):
+        self.addr = addr
+
+    def _start(self, details):
+        name = details.method.lstrip('/')
+        active = Span(name, CLIENT, current(), {
+            'rpc.system': 'grpc', 'rpc.method': name, 'server.address': self.addr,
+        })
+        metadata = list(details.metadata or []) + [('traceparent', active.context.traceparent())]
+        return active, _ClientCallDetails(details, metadata)
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        active, details = self._start(client_call_details)
+        call = continuation(details, request)
+
+        def done(call):
+            code = call.code()
+            active.set_attribute('rpc.grpc.status_code', _code_name(code))
+            if code not in (None, grpc.StatusCode.OK):
+                active.set_error(_code_name(code))
+            active.end()
+
+        # Blocking calls are already done here; futures end the span on completion
+        call.add_done_callback(done)
+        return call
+
+def intercept_channel(channel, addr):
+    """channel with outgoing calls traced, if tracing is on"""
+    if not ENABLED:
+        return channel
+    return grpc.intercept_channel(channel, ClientInterceptor(addr))
+
+# --- HTTP (Flask) ---
+
+def instrument_flask(app):
+    """Record a server span per request, continuing the trace in the traceparent header"""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_span():
+        route = request.url_rule.rule if request.url_rule else request.path
+        active = Span(f"{request.method} {route}", SERVER, parse_traceparent(request.headers.get('traceparent')),
+                      {'http.request.method': request.method, 'http.route': route})
+        g.trace_span = active
+        g.trace_token = _current.set(active)
+
+    @app.after_request
+    def _record_status(response):
+        active = g.get('trace_span')
+        if active is not None:
+            active.set_attribute('http.response.status_code', response.status_code)
+            if response.status_code >= 500:
+                active.set_error(f"HTTP {response.status_code}")
+        return response
+
+    @app.teardown_request
+    def _end_span(exc):
+        active = g.pop('trace_span', None)
+        if active is None:
+            return
+        _current.reset(g.pop('trace_token'))
+        if exc is not None:
+            active.set_error(f"{type(exc).__name__}: {exc}")
+        active.end()
+
+# --- Export ---
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+def _otlp_span(span):
+    encoded = {
+        'traceId': span.context.trace_id,
+        'spanId': span.context.span_id,
+        'name': span.name,
+        'kind': span.kind,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns),
+        'attributes': [_attribute(k, v) for k, v in span.attributes.items()],
+        # 1 = OK, 2 = ERROR
+        'status': {'code': 2, 'message': span.error} if span.error is not None else {'code': 1},
+    }
+    if span.parent_id:
+        encoded['parentSpanId'] = span.parent_id
+    return encoded
+
+class FileExporter:
+    """Writes finished spans to a file as OTLP/JSON lines, in batches, from a background thread"""
+
+    def __init__(self, path):
+        root, ext = os.path.splitext(path)
+        self.path = f"{root}.worker-{prefork.WORKER_ID}{ext}" if prefork.WORKER_ID else path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, span):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="trace-export")
+                self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Never slow requests down to keep up with tracing
+            self.dropped += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            # Up to _EXPORT_BATCH spans, or what arrived within
+            # _EXPORT_INTERVAL of the first
+            batch, deadline = [], None
+            while len(batch) < _EXPORT_BATCH:
+                try:
+                    span = self._queue.get(timeout=max(deadline - time.monotonic(), 0) if batch else None)
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                if not batch:
+                    deadline = time.monotonic() + _EXPORT_INTERVAL
+                batch.append(span)
+            if batch:
+                self._write(batch)
+
+    def shutdown(self):
+        """Write out every span submitted so far (at exit)"""
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(5)
+
+    def _write(self, batch):
+        resource = {'attributes': [
+            _attribute('service.name', service_name or 'vault'),
+            _attribute('service.instance.id', f"{socket.gethostname()}-{os.getpid()}"),
+        ]}
+        line = json.dumps({'resourceSpans': [{
+            'resource': resource,
+            'scopeSpans': [{'scope': {'name': 'vault.tracing'}, 'spans': [_otlp_span(s) for s in batch]}],
+        }]})
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logs.get_logger("Tracing").warning("Could not write spans", spans=len(batch), path=self.path,
+                                               error=str(e))
+
+_exporter = FileExporter(TRACE_FILE) if ENABLED else None
+if ENABLED:
+    atexit.register(_exporter.shutdown)
+    logs.add_context(_log_fields)
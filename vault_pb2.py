@@ -24,65 +24,93 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bvault.proto\x12\x05vault\"F\n\x10\x41\x64\x64SecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x13\n\x0bsecret_name\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\"H\n\x11\x41\x64\x64SecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\";\n\x15RetrieveSecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\"J\n\x16RetrieveSecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"G\n\x13UpdateSecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\"K\n\x14UpdateSecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"9\n\x13\x44\x65leteSecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\"K\n\x14\x44\x65leteSecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"%\n\x12ListSecretsRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\"s\n\x0eSecretMetadata\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x13\n\x0bsecret_name\x18\x02 \x01(\t\x12\x12\n\ncreated_at\x18\x03 \x01(\t\x12\x12\n\nupdated_at\x18\x04 \x01(\t\x12\x11\n\tis_shared\x18\x05 \x01(\x08\"R\n\x13ListSecretsResponse\x12&\n\x07secrets\x18\x01 \x03(\x0b\x32\x15.vault.SecretMetadata\x12\x13\n\x0btotal_count\x18\x02 \x01(\x05\"Q\n\x12ShareSecretRequest\x12\x10\n\x08owner_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12\x16\n\x0etarget_user_id\x18\x03 \x01(\t\"7\n\x13ShareSecretResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\"8\n\x12\x43heckAccessRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\";\n\x13\x43heckAccessResponse\x12\x12\n\nhas_access\x18\x01 \x01(\x08\x12\x10\n\x08owner_id\x18\x02 \x01(\t\"s\n\x16ReplicateSecretRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x13\n\x0bsecret_name\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\t\x12\x12\n\ncreated_at\x18\x05 \x01(\t\"*\n\x17ReplicateSecretResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"M\n\x16ReplicateUpdateRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\t\x12\x12\n\nupdated_at\x18\x03 \x01(\t\"*\n\x17ReplicateUpdateResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"-\n\x18ReplicateDeletionRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\",\n\x19ReplicateDeletionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"T\n\x15ReplicateShareRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x10\n\x08owner_id\x18\x02 \x01(\t\x12\x16\n\x0etarget_user_id\x18\x03 \x01(\t\")\n\x16ReplicateShareResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32\xf1\x01\n\x17SecretManagementService\x12@\n\tAddSecret\x12\x17.vault.AddSecretRequest\x1a\x18.vault.AddSecretResponse\"\x00\x12I\n\x0cUpdateSecret\x12\x1a.vault.UpdateSecretRequest\x1a\x1b.vault.UpdateSecretResponse\"\x00\x12I\n\x0c\x44\x65leteSecret\x12\x1a.vault.DeleteSecretRequest\x1a\x1b.vault.DeleteSecretResponse\"\x00\x32\xb1\x01\n\x16SecretRetrievalService\x12O\n\x0eRetrieveSecret\x12\x1c.vault.RetrieveSecretRequest\x1a\x1d.vault.RetrieveSecretResponse\"\x00\x12\x46\n\x0bListSecrets\x12\x19.vault.ListSecretsRequest\x1a\x1a.vault.ListSecretsResponse\"\x00\x32\xa6\x01\n\x14\x41\x63\x63\x65ssControlService\x12\x46\n\x0bShareSecret\x12\x19.vault.ShareSecretRequest\x1a\x1a.vault.ShareSecretResponse\"\x00\x12\x46\n\x0b\x43heckAccess\x12\x19.vault.CheckAccessRequest\x1a\x1a.vault.CheckAccessResponse\"\x00\x32\xe7\x02\n\x12ReplicationService\x12R\n\x0fReplicateSecret\x12\x1d.vault.ReplicateSecretRequest\x1a\x1e.vault.ReplicateSecretResponse\"\x00\x12R\n\x0fReplicateUpdate\x12\x1d.vault.ReplicateUpdateRequest\x1a\x1e.vault.ReplicateUpdateResponse\"\x00\x12X\n\x11ReplicateDeletion\x12\x1f.vault.ReplicateDeletionRequest\x1a .vault.ReplicateDeletionResponse\"\x00\x12O\n\x0eReplicateShare\x12\x1c.vault.ReplicateShareRequest\x1a\x1d.vault.ReplicateShareResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bvault.proto\x12\x05vault\"\x87\x01\n\x10\x41\x64\x64SecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x13\n\x0bsecret_name\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12\x11\n\tsecret_id\x18\x04 \x01(\t\x12,\n\x0b\x63onsistency\x18\x05 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"H\n\x11\x41\x64\x64SecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"i\n\x15RetrieveSecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12,\n\x0b\x63onsistency\x18\x03 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"J\n\x16RetrieveSecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"u\n\x13UpdateSecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12,\n\x0b\x63onsistency\x18\x04 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"K\n\x14UpdateSecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"g\n\x13\x44\x65leteSecretRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12,\n\x0b\x63onsistency\x18\x03 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"K\n\x14\x44\x65leteSecretResponse\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07success\x18\x03 \x01(\x08\"%\n\x12ListSecretsRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\"s\n\x0eSecretMetadata\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x13\n\x0bsecret_name\x18\x02 \x01(\t\x12\x12\n\ncreated_at\x18\x03 \x01(\t\x12\x12\n\nupdated_at\x18\x04 \x01(\t\x12\x11\n\tis_shared\x18\x05 \x01(\x08\"R\n\x13ListSecretsResponse\x12&\n\x07secrets\x18\x01 \x03(\x0b\x32\x15.vault.SecretMetadata\x12\x13\n\x0btotal_count\x18\x02 \x01(\x05\"\x7f\n\x12ShareSecretRequest\x12\x10\n\x08owner_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12\x16\n\x0etarget_user_id\x18\x03 \x01(\t\x12,\n\x0b\x63onsistency\x18\x04 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"7\n\x13ShareSecretResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\"8\n\x12\x43heckAccessRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\";\n\x13\x43heckAccessResponse\x12\x12\n\nhas_access\x18\x01 \x01(\x08\x12\x10\n\x08owner_id\x18\x02 \x01(\t\"\x82\x01\n\x1bShareSecretWithGroupRequest\x12\x10\n\x08owner_id\x18\x01 \x01(\t\x12\x11\n\tsecret_id\x18\x02 \x01(\t\x12\x10\n\x08group_id\x18\x03 \x01(\t\x12,\n\x0b\x63onsistency\x18\x04 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"w\n\x12GroupMemberRequest\x12\x10\n\x08owner_id\x18\x01 \x01(\t\x12\x10\n\x08group_id\x18\x02 \x01(\t\x12\x0f\n\x07user_id\x18\x03 \x01(\t\x12,\n\x0b\x63onsistency\x18\x04 \x01(\x0e\x32\x17.vault.ConsistencyLevel\"7\n\x13GroupMemberResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\"<\n\x17ListGroupMembersRequest\x12\x10\n\x08group_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\"P\n\x18ListGroupMembersResponse\x12\x10\n\x08group_id\x18\x01 \x01(\t\x12\x10\n\x08owner_id\x18\x02 \x01(\t\x12\x10\n\x08user_ids\x18\x03 \x03(\t\"\x84\x01\n\x16ReplicateSecretRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x13\n\x0bsecret_name\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\t\x12\x12\n\ncreated_at\x18\x05 \x01(\t\x12\x0f\n\x07version\x18\x06 \x01(\t\"*\n\x17ReplicateSecretResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x98\x01\n\x16ReplicateUpdateRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\t\x12\x12\n\nupdated_at\x18\x03 \x01(\t\x12\x0f\n\x07version\x18\x04 \x01(\t\x12\x0f\n\x07user_id\x18\x05 \x01(\t\x12\x13\n\x0bsecret_name\x18\x06 \x01(\t\x12\x12\n\ncreated_at\x18\x07 \x01(\t\"*\n\x17ReplicateUpdateResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\">\n\x18ReplicateDeletionRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x0f\n\x07version\x18\x02 \x01(\t\",\n\x19ReplicateDeletionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"e\n\x15ReplicateShareRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x10\n\x08owner_id\x18\x02 \x01(\t\x12\x16\n\x0etarget_user_id\x18\x03 \x01(\t\x12\x0f\n\x07version\x18\x04 \x01(\t\")\n\x16ReplicateShareResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"d\n\x1aReplicateGroupShareRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\x12\x10\n\x08owner_id\x18\x02 \x01(\t\x12\x10\n\x08group_id\x18\x03 \x01(\t\x12\x0f\n\x07version\x18\x04 \x01(\t\".\n\x1bReplicateGroupShareResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"s\n\x1bReplicateGroupMemberRequest\x12\x10\n\x08group_id\x18\x01 \x01(\t\x12\x10\n\x08owner_id\x18\x02 \x01(\t\x12\x0f\n\x07user_id\x18\x03 \x01(\t\x12\x0e\n\x06member\x18\x04 \x01(\x08\x12\x0f\n\x07version\x18\x05 \x01(\t\"/\n\x1cReplicateGroupMemberResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\'\n\x12\x46\x65tchSecretRequest\x12\x11\n\tsecret_id\x18\x01 \x01(\t\"\x91\x01\n\x13\x46\x65tchSecretResponse\x12\r\n\x05\x66ound\x18\x01 \x01(\x08\x12\x0f\n\x07version\x18\x02 \x01(\t\x12\x0f\n\x07user_id\x18\x03 \x01(\t\x12\x13\n\x0bsecret_name\x18\x04 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\t\x12\x12\n\ncreated_at\x18\x06 \x01(\t\x12\x12\n\nupdated_at\x18\x07 \x01(\t\"*\n\x0fSnapshotRequest\x12\x17\n\x0fsince_watermark\x18\x01 \x01(\t\"i\n\rSnapshotChunk\x12\x10\n\x08is_delta\x18\x01 \x01(\x08\x12\x11\n\twatermark\x18\x02 \x01(\t\x12\x0f\n\x07payload\x18\x03 \x01(\x0c\x12\x14\n\x0crecord_count\x18\x04 \x01(\x05\x12\x0c\n\x04last\x18\x05 \x01(\x08*=\n\x10\x43onsistencyLevel\x12\x0b\n\x07\x44\x45\x46\x41ULT\x10\x00\x12\x07\n\x03ONE\x10\x01\x12\n\n\x06QUORUM\x10\x02\x12\x07\n\x03\x41LL\x10\x03\x32\xf1\x01\n\x17SecretManagementService\x12@\n\tAddSecret\x12\x17.vault.AddSecretRequest\x1a\x18.vault.AddSecretResponse\"\x00\x12I\n\x0cUpdateSecret\x12\x1a.vault.UpdateSecretRequest\x1a\x1b.vault.UpdateSecretResponse\"\x00\x12I\n\x0c\x44\x65leteSecret\x12\x1a.vault.DeleteSecretRequest\x1a\x1b.vault.DeleteSecretResponse\"\x00\x32\xb1\x01\n\x16SecretRetrievalService\x12O\n\x0eRetrieveSecret\x12\x1c.vault.RetrieveSecretRequest\x1a\x1d.vault.RetrieveSecretResponse\"\x00\x12\x46\n\x0bListSecrets\x12\x19.vault.ListSecretsRequest\x1a\x1a.vault.ListSecretsResponse\"\x00\x32\xf0\x03\n\x14\x41\x63\x63\x65ssControlService\x12\x46\n\x0bShareSecret\x12\x19.vault.ShareSecretRequest\x1a\x1a.vault.ShareSecretResponse\"\x00\x12\x46\n\x0b\x43heckAccess\x12\x19.vault.CheckAccessRequest\x1a\x1a.vault.CheckAccessResponse\"\x00\x12X\n\x14ShareSecretWithGroup\x12\".vault.ShareSecretWithGroupRequest\x1a\x1a.vault.ShareSecretResponse\"\x00\x12I\n\x0e\x41\x64\x64GroupMember\x12\x19.vault.GroupMemberRequest\x1a\x1a.vault.GroupMemberResponse\"\x00\x12L\n\x11RemoveGroupMember\x12\x19.vault.GroupMemberRequest\x1a\x1a.vault.GroupMemberResponse\"\x00\x12U\n\x10ListGroupMembers\x12\x1e.vault.ListGroupMembersRequest\x1a\x1f.vault.ListGroupMembersResponse\"\x00\x32\xb0\x05\n\x12ReplicationService\x12R\n\x0fReplicateSecret\x12\x1d.vault.ReplicateSecretRequest\x1a\x1e.vault.ReplicateSecretResponse\"\x00\x12R\n\x0fReplicateUpdate\x12\x1d.vault.ReplicateUpdateRequest\x1a\x1e.vault.ReplicateUpdateResponse\"\x00\x12X\n\x11ReplicateDeletion\x12\x1f.vault.ReplicateDeletionRequest\x1a .vault.ReplicateDeletionResponse\"\x00\x12O\n\x0eReplicateShare\x12\x1c.vault.ReplicateShareRequest\x1a\x1d.vault.ReplicateShareResponse\"\x00\x12<\n\x08Snapshot\x12\x16.vault.SnapshotRequest\x1a\x14.vault.SnapshotChunk\"\x00\x30\x01\x12\x46\n\x0b\x46\x65tchSecret\x12\x19.vault.FetchSecretRequest\x1a\x1a.vault.FetchSecretResponse\"\x00\x12^\n\x13ReplicateGroupShare\x12!.vault.ReplicateGroupShareRequest\x1a\".vault.ReplicateGroupShareResponse\"\x00\x12\x61\n\x14ReplicateGroupMember\x12\".vault.ReplicateGroupMemberRequest\x1a#.vault.ReplicateGroupMemberResponse\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'vault_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_ADDSECRETREQUEST']._serialized_start=22
-  _globals['_ADDSECRETREQUEST']._serialized_end=92
-  _globals['_ADDSECRETRESPONSE']._serialized_start=94
-  _globals['_ADDSECRETRESPONSE']._serialized_end=166
-  _globals['_RETRIEVESECRETREQUEST']._serialized_start=168
-  _globals['_RETRIEVESECRETREQUEST']._serialized_end=227
-  _globals['_RETRIEVESECRETRESPONSE']._serialized_start=229
-  _globals['_RETRIEVESECRETRESPONSE']._serialized_end=303
-  _globals['_UPDATESECRETREQUEST']._serialized_start=305
-  _globals['_UPDATESECRETREQUEST']._serialized_end=376
-  _globals['_UPDATESECRETRESPONSE']._serialized_start=378
-  _globals['_UPDATESECRETRESPONSE']._serialized_end=453
-  _globals['_DELETESECRETREQUEST']._serialized_start=455
-  _globals['_DELETESECRETREQUEST']._serialized_end=512
-  _globals['_DELETESECRETRESPONSE']._serialized_start=514
-  _globals['_DELETESECRETRESPONSE']._serialized_end=589
-  _globals['_LISTSECRETSREQUEST']._serialized_start=591
-  _globals['_LISTSECRETSREQUEST']._serialized_end=628
-  _globals['_SECRETMETADATA']._serialized_start=630
-  _globals['_SECRETMETADATA']._serialized_end=745
-  _globals['_LISTSECRETSRESPONSE']._serialized_start=747
-  _globals['_LISTSECRETSRESPONSE']._serialized_end=829
-  _globals['_SHARESECRETREQUEST']._serialized_start=831
-  _globals['_SHARESECRETREQUEST']._serialized_end=912
-  _globals['_SHARESECRETRESPONSE']._serialized_start=914
-  _globals['_SHARESECRETRESPONSE']._serialized_end=969
-  _globals['_CHECKACCESSREQUEST']._serialized_start=971
-  _globals['_CHECKACCESSREQUEST']._serialized_end=1027
-  _globals['_CHECKACCESSRESPONSE']._serialized_start=1029
-  _globals['_CHECKACCESSRESPONSE']._serialized_end=1088
-  _globals['_REPLICATESECRETREQUEST']._serialized_start=1090
-  _globals['_REPLICATESECRETREQUEST']._serialized_end=1205
-  _globals['_REPLICATESECRETRESPONSE']._serialized_start=1207
-  _globals['_REPLICATESECRETRESPONSE']._serialized_end=1249
-  _globals['_REPLICATEUPDATEREQUEST']._serialized_start=1251
-  _globals['_REPLICATEUPDATEREQUEST']._serialized_end=1328
-  _globals['_REPLICATEUPDATERESPONSE']._serialized_start=1330
-  _globals['_REPLICATEUPDATERESPONSE']._serialized_end=1372
-  _globals['_REPLICATEDELETIONREQUEST']._serialized_start=1374
-  _globals['_REPLICATEDELETIONREQUEST']._serialized_end=1419
-  _globals['_REPLICATEDELETIONRESPONSE']._serialized_start=1421
-  _globals['_REPLICATEDELETIONRESPONSE']._serialized_end=1465
-  _globals['_REPLICATESHAREREQUEST']._serialized_start=1467
-  _globals['_REPLICATESHAREREQUEST']._serialized_end=1551
-  _globals['_REPLICATESHARERESPONSE']._serialized_start=1553
-  _globals['_REPLICATESHARERESPONSE']._serialized_end=1594
-  _globals['_SECRETMANAGEMENTSERVICE']._serialized_start=1597
-  _globals['_SECRETMANAGEMENTSERVICE']._serialized_end=1838
-  _globals['_SECRETRETRIEVALSERVICE']._serialized_start=1841
-  _globals['_SECRETRETRIEVALSERVICE']._serialized_end=2018
-  _globals['_ACCESSCONTROLSERVICE']._serialized_start=2021
-  _globals['_ACCESSCONTROLSERVICE']._serialized_end=2187
-  _globals['_REPLICATIONSERVICE']._serialized_start=2190
-  _globals['_REPLICATIONSERVICE']._serialized_end=2549
+  _globals['_CONSISTENCYLEVEL']._serialized_start=3085
+  _globals['_CONSISTENCYLEVEL']._serialized_end=3146
+  _globals['_ADDSECRETREQUEST']._serialized_start=23
+  _globals['_ADDSECRETREQUEST']._serialized_end=158
+  _globals['_ADDSECRETRESPONSE']._serialized_start=160
+  _globals['_ADDSECRETRESPONSE']._serialized_end=232
+  _globals['_RETRIEVESECRETREQUEST']._serialized_start=234
+  _globals['_RETRIEVESECRETREQUEST']._serialized_end=339
+  _globals['_RETRIEVESECRETRESPONSE']._serialized_start=341
+  _globals['_RETRIEVESECRETRESPONSE']._serialized_end=415
+  _globals['_UPDATESECRETREQUEST']._serialized_start=417
+  _globals['_UPDATESECRETREQUEST']._serialized_end=534
+  _globals['_UPDATESECRETRESPONSE']._serialized_start=536
+  _globals['_UPDATESECRETRESPONSE']._serialized_end=611
+  _globals['_DELETESECRETREQUEST']._serialized_start=613
+  _globals['_DELETESECRETREQUEST']._serialized_end=716
+  _globals['_DELETESECRETRESPONSE']._serialized_start=718
+  _globals['_DELETESECRETRESPONSE']._serialized_end=793
+  _globals['_LISTSECRETSREQUEST']._serialized_start=795
+  _globals['_LISTSECRETSREQUEST']._serialized_end=832
+  _globals['_SECRETMETADATA']._serialized_start=834
+  _globals['_SECRETMETADATA']._serialized_end=949
+  _globals['_LISTSECRETSRESPONSE']._serialized_start=951
+  _globals['_LISTSECRETSRESPONSE']._serialized_end=1033
+  _globals['_SHARESECRETREQUEST']._serialized_start=1035
+  _globals['_SHARESECRETREQUEST']._serialized_end=1162
+  _globals['_SHARESECRETRESPONSE']._serialized_start=1164
+  _globals['_SHARESECRETRESPONSE']._serialized_end=1219
+  _globals['_CHECKACCESSREQUEST']._serialized_start=1221
+  _globals['_CHECKACCESSREQUEST']._serialized_end=1277
+  _globals['_CHECKACCESSRESPONSE']._serialized_start=1279
+  _globals['_CHECKACCESSRESPONSE']._serialized_end=1338
+  _globals['_SHARESECRETWITHGROUPREQUEST']._serialized_start=1341
+  _globals['_SHARESECRETWITHGROUPREQUEST']._serialized_end=1471
+  _globals['_GROUPMEMBERREQUEST']._serialized_start=1473
+  _globals['_GROUPMEMBERREQUEST']._serialized_end=1592
+  _globals['_GROUPMEMBERRESPONSE']._serialized_start=1594
+  _globals['_GROUPMEMBERRESPONSE']._serialized_end=1649
+  _globals['_LISTGROUPMEMBERSREQUEST']._serialized_start=1651
+  _globals['_LISTGROUPMEMBERSREQUEST']._serialized_end=1711
+  _globals['_LISTGROUPMEMBERSRESPONSE']._serialized_start=1713
+  _globals['_LISTGROUPMEMBERSRESPONSE']._serialized_end=1793
+  _globals['_REPLICATESECRETREQUEST']._serialized_start=1796
+  _globals['_REPLICATESECRETREQUEST']._serialized_end=1928
+  _globals['_REPLICATESECRETRESPONSE']._serialized_start=1930
+  _globals['_REPLICATESECRETRESPONSE']._serialized_end=1972
+  _globals['_REPLICATEUPDATEREQUEST']._serialized_start=1975
+  _globals['_REPLICATEUPDATEREQUEST']._serialized_end=2127
+  _globals['_REPLICATEUPDATERESPONSE']._serialized_start=2129
+  _globals['_REPLICATEUPDATERESPONSE']._serialized_end=2171
+  _globals['_REPLICATEDELETIONREQUEST']._serialized_start=2173
+  _globals['_REPLICATEDELETIONREQUEST']._serialized_end=2235
+  _globals['_REPLICATEDELETIONRESPONSE']._serialized_start=2237
+  _globals['_REPLICATEDELETIONRESPONSE']._serialized_end=2281
+  _globals['_REPLICATESHAREREQUEST']._serialized_start=2283
+  _globals['_REPLICATESHAREREQUEST']._serialized_end=2384
+  _globals['_REPLICATESHARERESPONSE']._serialized_start=2386
+  _globals['_REPLICATESHARERESPONSE']._serialized_end=2427
+  _globals['_REPLICATEGROUPSHAREREQUEST']._serialized_start=2429
+  _globals['_REPLICATEGROUPSHAREREQUEST']._serialized_end=2529
+  _globals['_REPLICATEGROUPSHARERESPONSE']._serialized_start=2531
+  _globals['_REPLICATEGROUPSHARERESPONSE']._serialized_end=2577
+  _globals['_REPLICATEGROUPMEMBERREQUEST']._serialized_start=2579
+  _globals['_REPLICATEGROUPMEMBERREQUEST']._serialized_end=2694
+  _globals['_REPLICATEGROUPMEMBERRESPONSE']._serialized_start=2696
+  _globals['_REPLICATEGROUPMEMBERRESPONSE']._serialized_end=2743
+  _globals['_FETCHSECRETREQUEST']._serialized_start=2745
+  _globals['_FETCHSECRETREQUEST']._serialized_end=2784
+  _globals['_FETCHSECRETRESPONSE']._serialized_start=2787
+  _globals['_FETCHSECRETRESPONSE']._serialized_end=2932
+  _globals['_SNAPSHOTREQUEST']._serialized_start=2934
+  _globals['_SNAPSHOTREQUEST']._serialized_end=2976
+  _globals['_SNAPSHOTCHUNK']._serialized_start=2978
+  _globals['_SNAPSHOTCHUNK']._serialized_end=3083
+  _globals['_SECRETMANAGEMENTSERVICE']._serialized_start=3149
+  _globals['_SECRETMANAGEMENTSERVICE']._serialized_end=3390
+  _globals['_SECRETRETRIEVALSERVICE']._serialized_start=3393
+  _globals['_SECRETRETRIEVALSERVICE']._serialized_end=3570
+  _globals['_ACCESSCONTROLSERVICE']._serialized_start=3573
+  _globals['_ACCESSCONTROLSERVICE']._serialized_end=4069
+  _globals['_REPLICATIONSERVICE']._serialized_start=4072
+  _globals['_REPLICATIONSERVICE']._serialized_end=4760
 # @@protoc_insertion_point(module_scope)
@@ -1,4 +1,5 @@
 from google.protobuf.internal import containers as _containers
+from google.protobuf.internal import enum_type_wrapper as _enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from collections.abc import Iterable as _Iterable, Mapping as _Mapping
@@ -6,15 +7,30 @@ from typing import ClassVar as _ClassVar, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
+class ConsistencyLevel(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    DEFAULT: _ClassVar[ConsistencyLevel]
+    ONE: _ClassVar[ConsistencyLevel]
+    QUORUM: _ClassVar[ConsistencyLevel]
+    ALL: _ClassVar[ConsistencyLevel]
+DEFAULT: ConsistencyLevel
+ONE: ConsistencyLevel
+QUORUM: ConsistencyLevel
+ALL: ConsistencyLevel
+
 class AddSecretRequest(_message.Message):
-    __slots__ = ("user_id", "secret_name", "data")
+    __slots__ = ("user_id", "secret_name", "data", "secret_id", "consistency")
     USER_ID_FIELD_NUMBER: _ClassVar[int]
     SECRET_NAME_FIELD_NUMBER: _ClassVar[int]
     DATA_FIELD_NUMBER: _ClassVar[int]
+    SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
     user_id: str
     secret_name: str
     data: str
-    def __init__(self, user_id: _Optional[str] = ..., secret_name: _Optional[str] = ..., data: _Optional[str] = ...) -> None: ...
+    secret_id: str
+    consistency: ConsistencyLevel
+    def __init__(self, user_id: _Optional[str] = ..., secret_name: _Optional[str] = ..., data: _Optional[str] = ..., secret_id: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
 
 class AddSecretResponse(_message.Message):
     __slots__ = ("secret_id", "message", "success")
@@ -27,12 +43,14 @@ class AddSecretResponse(_message.Message):
     def __init__(self, secret_id: _Optional[str] = ..., message: _Optional[str] = ..., success: bool = ...) -> None: ...
 
 class RetrieveSecretRequest(_message.Message):
-    __slots__ = ("user_id", "secret_id")
+    __slots__ = ("user_id", "secret_id", "consistency")
     USER_ID_FIELD_NUMBER: _ClassVar[int]
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
     user_id: str
     secret_id: str
-    def __init__(self, user_id: _Optional[str] = ..., secret_id: _Optional[str] = ...) -> None: ...
+    consistency: ConsistencyLevel
+    def __init__(self, user_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
 
 class RetrieveSecretResponse(_message.Message):
     __slots__ = ("secret_id", "data", "success")
@@ -45,14 +63,16 @@ class RetrieveSecretResponse(_message.Message):
     def __init__(self, secret_id: _Optional[str] = ..., data: _Optional[str] = ..., success: bool = ...) -> None: ...
 
 class UpdateSecretRequest(_message.Message):
-    __slots__ = ("user_id", "secret_id", "data")
+    __slots__ = ("user_id", "secret_id", "data", "consistency")
     USER_ID_FIELD_NUMBER: _ClassVar[int]
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
     DATA_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
     user_id: str
     secret_id: str
     data: str
-    def __init__(self, user_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., data: _Optional[str] = ...) -> None: ...
+    consistency: ConsistencyLevel
+    def __init__(self, user_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., data: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
 
 class UpdateSecretResponse(_message.Message):
     __slots__ = ("secret_id", "message", "success")
@@ -65,12 +85,14 @@ class UpdateSecretResponse(_message.Message):
     def __init__(self, secret_id: _Optional[str] = ..., message: _Optional[str] = ..., success: bool = ...) -> None: ...
 
 class DeleteSecretRequest(_message.Message):
-    __slots__ = ("user_id", "secret_id")
+    __slots__ = ("user_id", "secret_id", "consistency")
     USER_ID_FIELD_NUMBER: _ClassVar[int]
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
     user_id: str
     secret_id: str
-    def __init__(self, user_id: _Optional[str] = ..., secret_id: _Optional[str] = ...) -> None: ...
+    consistency: ConsistencyLevel
+    def __init__(self, user_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
 
 class DeleteSecretResponse(_message.Message):
     __slots__ = ("secret_id", "message", "success")
@@ -111,14 +133,16 @@ class ListSecretsResponse(_message.Message):
     def __init__(self, secrets: _Optional[_Iterable[_Union[SecretMetadata, _Mapping]]] = ..., total_count: _Optional[int] = ...) -> None: ...
 
 class ShareSecretRequest(_message.Message):
-    __slots__ = ("owner_id", "secret_id", "target_user_id")
+    __slots__ = ("owner_id", "secret_id", "target_user_id", "consistency")
     OWNER_ID_FIELD_NUMBER: _ClassVar[int]
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
     TARGET_USER_ID_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
     owner_id: str
     secret_id: str
     target_user_id: str
-    def __init__(self, owner_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., target_user_id: _Optional[str] = ...) -> None: ...
+    consistency: ConsistencyLevel
+    def __init__(self, owner_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., target_user_id: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
 
 class ShareSecretResponse(_message.Message):
     __slots__ = ("message", "success")
@@ -144,19 +168,71 @@ class CheckAccessResponse(_message.Message):
     owner_id: str
     def __init__(self, has_access: bool = ..., owner_id: _Optional[str] = ...) -> None: ...
 
+class ShareSecretWithGroupRequest(_message.Message):
+    __slots__ = ("owner_id", "secret_id", "group_id", "consistency")
+    OWNER_ID_FIELD_NUMBER: _ClassVar[int]
+    SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    GROUP_ID_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
+    owner_id: str
+    secret_id: str
+    group_id: str
+    consistency: ConsistencyLevel
+    def __init__(self, owner_id: _Optional[str] = ..., secret_id: _Optional[str] = ..., group_id: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
+
+class GroupMemberRequest(_message.Message):
+    __slots__ = ("owner_id", "group_id", "user_id", "consistency")
+    OWNER_ID_FIELD_NUMBER: _ClassVar[int]
+    GROUP_ID_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    CONSISTENCY_FIELD_NUMBER: _ClassVar[int]
+    owner_id: str
+    group_id: str
+    user_id: str
+    consistency: ConsistencyLevel
+    def __init__(self, owner_id: _Optional[str] = ..., group_id: _Optional[str] = ..., user_id: _Optional[str] = ..., consistency: _Optional[_Union[ConsistencyLevel, str]] = ...) -> None: ...
+
+class GroupMemberResponse(_message.Message):
+    __slots__ = ("message", "success")
+    MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    message: str
+    success: bool
+    def __init__(self, message: _Optional[str] = ..., success: bool = ...) -> None: ...
+
+class ListGroupMembersRequest(_message.Message):
+    __slots__ = ("group_id", "user_id")
+    GROUP_ID_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    group_id: str
+    user_id: str
+    def __init__(self, group_id: _Optional[str] = ..., user_id: _Optional[str] = ...) -> None: ...
+
+class ListGroupMembersResponse(_message.Message):
+    __slots__ = ("group_id", "owner_id", "user_ids")
+    GROUP_ID_FIELD_NUMBER: _ClassVar[int]
+    OWNER_ID_FIELD_NUMBER: _ClassVar[int]
+    USER_IDS_FIELD_NUMBER: _ClassVar[int]
+    group_id: str
+    owner_id: str
+    user_ids: _containers.RepeatedScalarFieldContainer[str]
+    def __init__(self, group_id: _Optional[str] = ..., owner_id: _Optional[str] = ..., user_ids: _Optional[_Iterable[str]] = ...) -> None: ...
+
 class ReplicateSecretRequest(_message.Message):
-    __slots__ = ("secret_id", "user_id", "secret_name", "data", "created_at")
+    __slots__ = ("secret_id", "user_id", "secret_name", "data", "created_at", "version")
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
     USER_ID_FIELD_NUMBER: _ClassVar[int]
     SECRET_NAME_FIELD_NUMBER: _ClassVar[int]
     DATA_FIELD_NUMBER: _ClassVar[int]
     CREATED_AT_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
     secret_id: str
     user_id: str
     secret_name: str
     data: str
     created_at: str
-    def __init__(self, secret_id: _Optional[str] = ..., user_id: _Optional[str] = ..., secret_name: _Optional[str] = ..., data: _Optional[str] = ..., created_at: _Optional[str] = ...) -> None: ...
+    version: str
+    def __init__(self, secret_id: _Optional[str] = ..., user_id: _Optional[str] = ..., secret_name: _Optional[str] = ..., data: _Optional[str] = ..., created_at: _Optional[str] = ..., version: _Optional[str] = ...) -> None: ...
 
 class ReplicateSecretResponse(_message.Message):
     __slots__ = ("success",)
@@ -165,14 +241,22 @@ class ReplicateSecretResponse(_message.Message):
     def __init__(self, success: bool = ...) -> None: ...
 
 class ReplicateUpdateRequest(_message.Message):
-    __slots__ = ("secret_id", "data", "updated_at")
+    __slots__ = ("secret_id", "data", "updated_at", "version", "user_id", "secret_name", "created_at")
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
     DATA_FIELD_NUMBER: _ClassVar[int]
     UPDATED_AT_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    SECRET_NAME_FIELD_NUMBER: _ClassVar[int]
+    CREATED_AT_FIELD_NUMBER: _ClassVar[int]
     secret_id: str
     data: str
     updated_at: str
-    def __init__(self, secret_id: _Optional[str] = ..., data: _Optional[str] = ..., updated_at: _Optional[str] = ...) -> None: ...
+    version: str
+    user_id: str
+    secret_name: str
+    created_at: str
+    def __init__(self, secret_id: _Optional[str] = ..., data: _Optional[str] = ..., updated_at: _Optional[str] = ..., version: _Optional[str] = ..., user_id: _Optional[str] = ..., secret_name: _Optional[str] = ..., created_at: _Optional[str] = ...) -> None: ...
 
 class ReplicateUpdateResponse(_message.Message):
     __slots__ = ("success",)
@@ -181,10 +265,12 @@ class ReplicateUpdateResponse(_message.Message):
     def __init__(self, success: bool = ...) -> None: ...
 
 class ReplicateDeletionRequest(_message.Message):
-    __slots__ = ("secret_id",)
+    __slots__ = ("secret_id", "version")
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
     secret_id: str
-    def __init__(self, secret_id: _Optional[str] = ...) -> None: ...
+    version: str
+    def __init__(self, secret_id: _Optional[str] = ..., version: _Optional[str] = ...) -> None: ...
 
 class ReplicateDeletionResponse(_message.Message):
     __slots__ = ("success",)
@@ -193,17 +279,101 @@ class ReplicateDeletionResponse(_message.Message):
     def __init__(self, success: bool = ...) -> None: ...
 
 class ReplicateShareRequest(_message.Message):
-    __slots__ = ("secret_id", "owner_id", "target_user_id")
+    __slots__ = ("secret_id", "owner_id", "target_user_id", "version")
     SECRET_ID_FIELD_NUMBER: _ClassVar[int]
     OWNER_ID_FIELD_NUMBER: _ClassVar[int]
     TARGET_USER_ID_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
     secret_id: str
     owner_id: str
     target_user_id: str
-    def __init__(self, secret_id: _Optional[str] = ..., owner_id: _Optional[str] = ..., target_user_id: _Optional[str] = ...) -> None: ...
+    version: str
+    def __init__(self, secret_id: _Optional[str] = ..., owner_id: _Optional[str] = ..., target_user_id: _Optional[str] = ..., version: _Optional[str] = ...) -> None: ...
 
 class ReplicateShareResponse(_message.Message):
     __slots__ = ("success",)
     SUCCESS_FIELD_NUMBER: _ClassVar[int]
     success: bool
     def __init__(self, success: bool = ...) -> None: ...
+
+class ReplicateGroupShareRequest(_message.Message):
+    __slots__ = ("secret_id", "owner_id", "group_id", "version")
+    SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    OWNER_ID_FIELD_NUMBER: _ClassVar[int]
+    GROUP_ID_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
+    secret_id: str
+    owner_id: str
+    group_id: str
+    version: str
+    def __init__(self, secret_id: _Optional[str] = ..., owner_id: _Optional[str] = ..., group_id: _Optional[str] = ..., version: _Optional[str] = ...) -> None: ...
+
+class ReplicateGroupShareResponse(_message.Message):
+    __slots__ = ("success",)
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    success: bool
+    def __init__(self, success: bool = ...) -> None: ...
+
+class ReplicateGroupMemberRequest(_message.Message):
+    __slots__ = ("group_id", "owner_id", "user_id", "member", "version")
+    GROUP_ID_FIELD_NUMBER: _ClassVar[int]
+    OWNER_ID_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    MEMBER_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
+    group_id: str
+    owner_id: str
+    user_id: str
+    member: bool
+    version: str
+    def __init__(self, group_id: _Optional[str] = ..., owner_id: _Optional[str] = ..., user_id: _Optional[str] = ..., member: bool = ..., version: _Optional[str] = ...) -> None: ...
+
+class ReplicateGroupMemberResponse(_message.Message):
+    __slots__ = ("success",)
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    success: bool
+    def __init__(self, success: bool = ...) -> None: ...
+
+class FetchSecretRequest(_message.Message):
+    __slots__ = ("secret_id",)
+    SECRET_ID_FIELD_NUMBER: _ClassVar[int]
+    secret_id: str
+    def __init__(self, secret_id: _Optional[str] = ...) -> None: ...
+
+class FetchSecretResponse(_message.Message):
+    __slots__ = ("found", "version", "user_id", "secret_name", "data", "created_at", "updated_at")
+    FOUND_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    SECRET_NAME_FIELD_NUMBER: _ClassVar[int]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    CREATED_AT_FIELD_NUMBER: _ClassVar[int]
+    UPDATED_AT_FIELD_NUMBER: _ClassVar[int]
+    found: bool
+    version: str
+    user_id: str
+    secret_name: str
+    data: str
+    created_at: str
+    updated_at: str
+    def __init__(self, found: bool = ..., version: _Optional[str] = ..., user_id: _Optional[str] = ..., secret_name: _Optional[str] = ..., data: _Optional[str] = ..., created_at: _Optional[str] = ..., updated_at: _Optional[str] = ...) -> None: ...
+
+class SnapshotRequest(_message.Message):
+    __slots__ = ("since_watermark",)
+    SINCE_WATERMARK_FIELD_NUMBER: _ClassVar[int]
+    since_watermark: str
+    def __init__(self, since_watermark: _Optional[str] = ...) -> None: ...
+
+class SnapshotChunk(_message.Message):
+    __slots__ = ("is_delta", "watermark", "payload", "record_count", "last")
+    IS_DELTA_FIELD_NUMBER: _ClassVar[int]
+    WATERMARK_FIELD_NUMBER: _ClassVar[int]
+    PAYLOAD_FIELD_NUMBER: _ClassVar[int]
+    RECORD_COUNT_FIELD_NUMBER: _ClassVar[int]
+    LAST_FIELD_NUMBER: _ClassVar[int]
+    is_delta: bool
+    watermark: str
+    payload: bytes
+    record_count: int
+    last: bool
+    def __init__(self, is_delta: bool = ..., watermark: _Optional[str] = ..., payload: _Optional[bytes] = ..., record_count: _Optional[int] = ..., last: bool = ...) -> None: ...
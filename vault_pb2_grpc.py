@@ -317,7 +317,7 @@ class SecretRetrievalService(object):
 
 
 class AccessControlServiceStub(object):
-    """Access Control Service - Handles Share operation
+    """Access Control Service - Handles Share operation and groups
     """
 
     def __init__(self, channel):
@@ -336,10 +336,30 @@ class AccessControlServiceStub(object):
                 request_serializer=vault__pb2.CheckAccessRequest.SerializeToString,
                 response_deserializer=vault__pb2.CheckAccessResponse.FromString,
                 _registered_method=True)
+        self.ShareSecretWithGroup = channel.unary_unary(
+                '/vault.AccessControlService/ShareSecretWithGroup',
+                request_serializer=vault__pb2.ShareSecretWithGroupRequest.SerializeToString,
+                response_deserializer=vault__pb2.ShareSecretResponse.FromString,
+                _registered_method=True)
+        self.AddGroupMember = channel.unary_unary(
+                '/vault.AccessControlService/AddGroupMember',
+                request_serializer=vault__pb2.GroupMemberRequest.SerializeToString,
+                response_deserializer=vault__pb2.GroupMemberResponse.FromString,
+                _registered_method=True)
+        self.RemoveGroupMember = channel.unary_unary(
+                '/vault.AccessControlService/RemoveGroupMember',
+                request_serializer=vault__pb2.GroupMemberRequest.SerializeToString,
+                response_deserializer=vault__pb2.GroupMemberResponse.FromString,
+                _registered_method=True)
+        self.ListGroupMembers = channel.unary_unary(
+                '/vault.AccessControlService/ListGroupMembers',
+                request_serializer=vault__pb2.ListGroupMembersRequest.SerializeToString,
+                response_deserializer=vault__pb2.ListGroupMembersResponse.FromString,
+                _registered_method=True)
 
 
 class AccessControlServiceServicer(object):
-    """Access Control Service - Handles Share operation
+    """Access Control Service - Handles Share operation and groups
     """
 
     def ShareSecret(self, request, context):
@@ -354,6 +374,30 @@ class AccessControlServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ShareSecretWithGroup(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AddGroupMember(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RemoveGroupMember(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListGroupMembers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_AccessControlServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -367,6 +411,26 @@ def add_AccessControlServiceServicer_to_server(servicer, server):
                     request_deserializer=vault__pb2.CheckAccessRequest.FromString,
                     response_serializer=vault__pb2.CheckAccessResponse.SerializeToString,
             ),
+            'ShareSecretWithGroup': grpc.unary_unary_rpc_method_handler(
+                    servicer.ShareSecretWithGroup,
+                    request_deserializer=vault__pb2.ShareSecretWithGroupRequest.FromString,
+                    response_serializer=vault__pb2.ShareSecretResponse.SerializeToString,
+            ),
+            'AddGroupMember': grpc.unary_unary_rpc_method_handler(
+                    servicer.AddGroupMember,
+                    request_deserializer=vault__pb2.GroupMemberRequest.FromString,
+                    response_serializer=vault__pb2.GroupMemberResponse.SerializeToString,
+            ),
+            'RemoveGroupMember': grpc.unary_unary_rpc_method_handler(
+                    servicer.RemoveGroupMember,
+                    request_deserializer=vault__pb2.GroupMemberRequest.FromString,
+                    response_serializer=vault__pb2.GroupMemberResponse.SerializeToString,
+            ),
+            'ListGroupMembers': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListGroupMembers,
+                    request_deserializer=vault__pb2.ListGroupMembersRequest.FromString,
+                    response_serializer=vault__pb2.ListGroupMembersResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'vault.AccessControlService', rpc_method_handlers)
@@ -376,7 +440,7 @@ def add_AccessControlServiceServicer_to_server(servicer, server):
 
  # This class is part of an EXPERIMENTAL API.
 class AccessControlService(object):
-    """Access Control Service - Handles Share operation
+    """Access Control Service - Handles Share operation and groups
     """
 
     @staticmethod
@@ -433,6 +497,114 @@ class AccessControlService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ShareSecretWithGroup(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.AccessControlService/ShareSecretWithGroup',
+            vault__pb2.ShareSecretWithGroupRequest.SerializeToString,
+            vault__pb2.ShareSecretResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AddGroupMember(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.AccessControlService/AddGroupMember',
+            vault__pb2.GroupMemberRequest.SerializeToString,
+            vault__pb2.GroupMemberResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RemoveGroupMember(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.AccessControlService/RemoveGroupMember',
+            vault__pb2.GroupMemberRequest.SerializeToString,
+            vault__pb2.GroupMemberResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ListGroupMembers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.AccessControlService/ListGroupMembers',
+            vault__pb2.ListGroupMembersRequest.SerializeToString,
+            vault__pb2.ListGroupMembersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class ReplicationServiceStub(object):
     """Replication Service - Internal service for data consistency across nodes
@@ -464,6 +636,26 @@ class ReplicationServiceStub(object):
                 request_serializer=vault__pb2.ReplicateShareRequest.SerializeToString,
                 response_deserializer=vault__pb2.ReplicateShareResponse.FromString,
                 _registered_method=True)
+        self.Snapshot = channel.unary_stream(
+                '/vault.ReplicationService/Snapshot',
+                request_serializer=vault__pb2.SnapshotRequest.SerializeToString,
+                response_deserializer=vault__pb2.SnapshotChunk.FromString,
+                _registered_method=True)
+        self.FetchSecret = channel.unary_unary(
+                '/vault.ReplicationService/FetchSecret',
+                request_serializer=vault__pb2.FetchSecretRequest.SerializeToString,
+                response_deserializer=vault__pb2.FetchSecretResponse.FromString,
+                _registered_method=True)
+        self.ReplicateGroupShare = channel.unary_unary(
+                '/vault.ReplicationService/ReplicateGroupShare',
+                request_serializer=vault__pb2.ReplicateGroupShareRequest.SerializeToString,
+                response_deserializer=vault__pb2.ReplicateGroupShareResponse.FromString,
+                _registered_method=True)
+        self.ReplicateGroupMember = channel.unary_unary(
+                '/vault.ReplicationService/ReplicateGroupMember',
+                request_serializer=vault__pb2.ReplicateGroupMemberRequest.SerializeToString,
+                response_deserializer=vault__pb2.ReplicateGroupMemberResponse.FromString,
+                _registered_method=True)
 
 
 class ReplicationServiceServicer(object):
@@ -494,6 +686,30 @@ class ReplicationServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Snapshot(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FetchSecret(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReplicateGroupShare(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReplicateGroupMember(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ReplicationServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -517,6 +733,26 @@ def add_ReplicationServiceServicer_to_server(servicer, server):
                     request_deserializer=vault__pb2.ReplicateShareRequest.FromString,
                     response_serializer=vault__pb2.ReplicateShareResponse.SerializeToString,
             ),
+            'Snapshot': grpc.unary_stream_rpc_method_handler(
+                    servicer.Snapshot,
+                    request_deserializer=vault__pb2.SnapshotRequest.FromString,
+                    response_serializer=vault__pb2.SnapshotChunk.SerializeToString,
+            ),
+            'FetchSecret': grpc.unary_unary_rpc_method_handler(
+                    servicer.FetchSecret,
+                    request_deserializer=vault__pb2.FetchSecretRequest.FromString,
+                    response_serializer=vault__pb2.FetchSecretResponse.SerializeToString,
+            ),
+            'ReplicateGroupShare': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReplicateGroupShare,
+                    request_deserializer=vault__pb2.ReplicateGroupShareRequest.FromString,
+                    response_serializer=vault__pb2.ReplicateGroupShareResponse.SerializeToString,
+            ),
+            'ReplicateGroupMember': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReplicateGroupMember,
+                    request_deserializer=vault__pb2.ReplicateGroupMemberRequest.FromString,
+                    response_serializer=vault__pb2.ReplicateGroupMemberResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'vault.ReplicationService', rpc_method_handlers)
@@ -636,3 +872,111 @@ class ReplicationService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def Snapshot(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/vault.ReplicationService/Snapshot',
+            vault__pb2.SnapshotRequest.SerializeToString,
+            vault__pb2.SnapshotChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def FetchSecret(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.ReplicationService/FetchSecret',
+            vault__pb2.FetchSecretRequest.SerializeToString,
+            vault__pb2.FetchSecretResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReplicateGroupShare(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.ReplicationService/ReplicateGroupShare',
+            vault__pb2.ReplicateGroupShareRequest.SerializeToString,
+            vault__pb2.ReplicateGroupShareResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReplicateGroupMember(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vault.ReplicationService/ReplicateGroupMember',
+            vault__pb2.ReplicateGroupMemberRequest.SerializeToString,
+            vault__pb2.ReplicateGroupMemberResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)